@@ -0,0 +1,122 @@
+"""
+Benchmark: classificazione per pattern POS esatti vs similarità di n-grammi.
+
+Per ogni fold le righe di original_training_material vengono divise in
+addestramento/test; con le righe di addestramento si costruisce in memoria
+un KnowledgeIndex (solo pattern) e su quelle di test si misurano
+accuratezza, copertura (righe con almeno un case proposto) e latenza.
+
+Uso (dalla cartella del progetto):
+    python MachineLearningAlgorithm/benchmark_patterns.py [--folds 5] [--ngram 3]
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from nlp_models import get_pipeline
+from MachineLearningAlgorithm import knowledge_query
+from MachineLearningAlgorithm.knowledge_builder import sanitize
+from MachineLearningAlgorithm.knowledge_query import (
+    KnowledgeIndex, find_pattern_matches, fuzzy_pattern_scores,
+)
+
+MATERIAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "original_training_material")
+
+
+def load_material(nlp) -> list[tuple[str, list[str]]]:
+    """Ritorna [(case, sequenza POS)] per ogni riga non vuota del materiale originale."""
+    cases, lines = [], []
+    for path in sorted(glob.glob(os.path.join(MATERIAL_DIR, "*.txt"))):
+        case = os.path.splitext(os.path.basename(path))[0]
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                sanitized = sanitize(line)
+                if sanitized:
+                    cases.append(case)
+                    lines.append(sanitized)
+    docs = nlp.pipe(lines, batch_size=256)
+    return [
+        (case, [t.pos_ for t in doc if t.text.strip()])
+        for case, doc in zip(cases, docs)
+    ]
+
+
+def build_index(samples: list[tuple[str, list[str]]]) -> KnowledgeIndex:
+    """KnowledgeIndex di soli pattern, come lo produrrebbe knowledge_builder."""
+    case_names = sorted({case for case, _ in samples})
+    case_id = {name: i + 1 for i, name in enumerate(case_names)}
+    counts = Counter((case, json.dumps(seq)) for case, seq in samples if seq)
+    syntaxes = sorted({syntax for _, syntax in counts})
+    pattern_id = {syntax: i + 1 for i, syntax in enumerate(syntaxes)}
+    return KnowledgeIndex(
+        cases=[(case_id[n], n) for n in case_names],
+        words=[],
+        word_scores=[],
+        patterns=[(pattern_id[s], json.loads(s)) for s in syntaxes],
+        pattern_scores=[(case_id[c], pattern_id[s], n) for (c, s), n in counts.items()],
+    )
+
+
+def exact_scores(seq, index: KnowledgeIndex):
+    rows = list({m["row"] for m in find_pattern_matches(seq, index)})
+    return index.pattern_matrix[rows].sum(axis=0)
+
+
+def fuzzy_scores(seq, index: KnowledgeIndex):
+    return fuzzy_pattern_scores(seq, index)[1]
+
+
+def evaluate(scorer, index: KnowledgeIndex, test) -> tuple[int, int, list[float]]:
+    correct = covered = 0
+    latencies = []
+    for case, seq in test:
+        start = time.perf_counter()
+        scores = scorer(seq, index)
+        latencies.append(time.perf_counter() - start)
+        if len(scores) and scores.max() > 0:
+            covered += 1
+            if index.case_names[int(np.argmax(scores))] == case:
+                correct += 1
+    return correct, covered, latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--ngram", type=int, default=knowledge_query.NGRAM_N)
+    args = parser.parse_args(argv)
+    knowledge_query.NGRAM_N = args.ngram
+
+    samples = load_material(get_pipeline("pos"))
+    print(f"{len(samples)} righe, {args.folds} fold, n-grammi di {args.ngram}\n")
+
+    results = {"esatto": [0, 0, []], "n-grammi": [0, 0, []]}
+    for fold in range(args.folds):
+        train = [s for i, s in enumerate(samples) if i % args.folds != fold]
+        test = [s for i, s in enumerate(samples) if i % args.folds == fold]
+        index = build_index(train)
+        for name, scorer in (("esatto", exact_scores), ("n-grammi", fuzzy_scores)):
+            correct, covered, latencies = evaluate(scorer, index, test)
+            results[name][0] += correct
+            results[name][1] += covered
+            results[name][2].extend(latencies)
+
+    print(f"{'metodo':<10} {'accuratezza':>12} {'copertura':>10} {'media µs':>10} {'p95 µs':>10}")
+    for name, (correct, covered, latencies) in results.items():
+        lat = np.array(latencies) * 1e6
+        print(
+            f"{name:<10} {correct / len(samples):>12.1%} {covered / len(samples):>10.1%} "
+            f"{lat.mean():>10.1f} {np.percentile(lat, 95):>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
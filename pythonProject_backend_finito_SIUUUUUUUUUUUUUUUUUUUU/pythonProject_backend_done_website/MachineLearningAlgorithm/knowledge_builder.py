@@ -4,9 +4,18 @@ import re
 import json
 import glob
 import sys
+import argparse
+import hashlib
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+if __name__ == "__main__":
+    # eseguito come script: rende importabili i moduli della cartella principale
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 try:
-    import spacy
+    from nlp_models import get_pipeline
 except ImportError:
     print("SpaCy non è installato. Installa spaCy con 'pip install spacy' e il modello italiano con 'python -m spacy download it_core_news_sm'.")
     sys.exit(1)
@@ -18,10 +27,24 @@ else:
     DB_PATH = "MachineLearningAlgorithm/knowledge.db"
     TRAIN_DIR = "MachineLearningAlgorithm/training_material"
 
+# PRAGMA applicati alla connessione di training (sovrascrivibili da riga di comando)
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",       # i lettori non bloccano la scrittura (e viceversa)
+    "synchronous": "NORMAL",     # in WAL basta un fsync al checkpoint
+    "cache_size": -64000,        # ~64 MB di page cache
+    "temp_store": "MEMORY",
+}
+
 ###############################################################################
 # Inizializzazione del database                                              #
 ###############################################################################
 
+def configure_connection(conn: sqlite3.Connection, pragmas: dict | None = None) -> None:
+    """Applica i PRAGMA di prestazione (WAL, sync, cache)."""
+    for name, value in {**DEFAULT_PRAGMAS, **(pragmas or {})}.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
 def initialize_db(conn: sqlite3.Connection) -> None:
     """Crea le tabelle se non esistono già."""
     cur = conn.cursor()
@@ -82,8 +105,50 @@ def initialize_db(conn: sqlite3.Connection) -> None:
         """
     )
 
+    # Versione del DB: incrementata a fine ingestione, i lettori la usano
+    # per capire quando ricaricare il loro snapshot in memoria
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS KnowledgeVersion (
+            id         INTEGER PRIMARY KEY CHECK (id = 1),
+            version    INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        """
+    )
+
+    # Manifest dell'ingestione incrementale: un file per riga, con l'hash del
+    # contenuto e i conteggi che ha contribuito (servono per applicare i delta)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS TrainingFile (
+            name           TEXT PRIMARY KEY,
+            case_name      TEXT NOT NULL,
+            sha256         TEXT NOT NULL,
+            size           INTEGER NOT NULL,
+            mtime_ns       INTEGER NOT NULL,
+            lines          INTEGER NOT NULL,
+            word_counts    TEXT NOT NULL,
+            pattern_counts TEXT NOT NULL,
+            ingested_at    REAL NOT NULL
+        );
+        """
+    )
+
     conn.commit()
 
+
+def bump_version(conn: sqlite3.Connection) -> None:
+    """Segnala ai lettori che il contenuto del DB è cambiato."""
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO KnowledgeVersion (id, version, updated_at) VALUES (1, 1, ?)
+            ON CONFLICT (id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at
+            """,
+            (time.time(),),
+        )
+
 ###############################################################################
 # Funzioni helper                                                             #
 ###############################################################################
@@ -164,6 +229,83 @@ def increment_pattern_score(conn: sqlite3.Connection, case_id: int, pattern_id:
         )
     conn.commit()
 
+###############################################################################
+# Scrittura in blocco                                                         #
+###############################################################################
+
+def bulk_write(
+    conn: sqlite3.Connection,
+    case_name: str,
+    word_counts: Counter,
+    pattern_counts: Counter,
+) -> None:
+    """
+    Scrive in un'unica transazione i conteggi di un Case:
+    crea le parole/pattern mancanti e somma gli score con un UPSERT.
+    word_counts:    Counter {parola: occorrenze}
+    pattern_counts: Counter {syntax JSON: occorrenze}
+    """
+    with conn:  # commit unico (rollback in caso di errore)
+        write_counts(conn.cursor(), case_name, word_counts, pattern_counts)
+
+
+def write_counts(
+    cur: sqlite3.Cursor,
+    case_name: str,
+    word_counts: Counter,
+    pattern_counts: Counter,
+) -> int:
+    """
+    Corpo di bulk_write, senza transazione: la gestisce il chiamante.
+    I conteggi possono essere negativi (delta di un file modificato o rimosso);
+    le righe che scendono a zero vanno tolte con drop_empty_scores.
+    Ritorna l'id del Case.
+    """
+    cur.execute('INSERT OR IGNORE INTO "Case" (name) VALUES (?)', (case_name,))
+    cur.execute('SELECT id FROM "Case" WHERE name = ?', (case_name,))
+    case_id = cur.fetchone()[0]
+
+    cur.executemany(
+        'INSERT OR IGNORE INTO "Word" (word) VALUES (?)',
+        ((w,) for w in word_counts),
+    )
+    cur.executemany(
+        """
+        INSERT INTO Word_Scorage (case_id, word_id, score)
+        SELECT ?, id, ? FROM "Word" WHERE word = ?
+        ON CONFLICT (case_id, word_id) DO UPDATE SET score = score + excluded.score
+        """,
+        ((case_id, n, w) for w, n in word_counts.items()),
+    )
+
+    cur.executemany(
+        'INSERT OR IGNORE INTO "Pattern" (syntax) VALUES (?)',
+        ((p,) for p in pattern_counts),
+    )
+    cur.executemany(
+        """
+        INSERT INTO Pattern_Scorage (case_id, pattern_id, score)
+        SELECT ?, id, ? FROM "Pattern" WHERE syntax = ?
+        ON CONFLICT (case_id, pattern_id) DO UPDATE SET score = score + excluded.score
+        """,
+        ((case_id, n, p) for p, n in pattern_counts.items()),
+    )
+    return case_id
+
+
+def drop_empty_scores(cur: sqlite3.Cursor) -> None:
+    """Elimina gli score arrivati a zero e le parole/pattern/case rimasti senza score."""
+    cur.execute("DELETE FROM Word_Scorage WHERE score <= 0")
+    cur.execute("DELETE FROM Pattern_Scorage WHERE score <= 0")
+    cur.execute('DELETE FROM "Word" WHERE id NOT IN (SELECT word_id FROM Word_Scorage)')
+    cur.execute('DELETE FROM "Pattern" WHERE id NOT IN (SELECT pattern_id FROM Pattern_Scorage)')
+    cur.execute(
+        """
+        DELETE FROM "Case" WHERE id NOT IN (SELECT case_id FROM Word_Scorage)
+                             AND id NOT IN (SELECT case_id FROM Pattern_Scorage)
+        """
+    )
+
 ###############################################################################
 # Funzioni di processing                                                      #
 ###############################################################################
@@ -176,9 +318,50 @@ def sanitize(text: str) -> str:
     return SANITIZE_REGEX.sub(" ", text).strip()
 
 
-def process_file(conn: sqlite3.Connection, nlp, filepath: str) -> None:
-    """Analizza un singolo file di training e poi lo elimina."""
+def count_file(
+    nlp, filepath: str, batch_size: int = 256, n_process: int = 1
+) -> tuple[Counter, Counter, int]:
+    """
+    Conta in memoria parole e pattern POS di un file di training,
+    facendo scorrere le righe in streaming dentro nlp.pipe.
+    Ritorna (word_counts, pattern_counts, righe) con i pattern già serializzati in JSON.
+    """
+    word_counts = Counter()
+    pattern_counts = Counter()
+    n_lines = 0
+
+    def lines(f):
+        nonlocal n_lines
+        for line in f:
+            sanitized_line = sanitize(line)
+            if not sanitized_line:
+                continue  # riga vuota
+            n_lines += 1
+            word_counts.update(w for w in sanitized_line.lower().split() if w)
+            yield sanitized_line
+
+    with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+        for doc in nlp.pipe(lines(f), batch_size=batch_size, n_process=n_process):
+            pattern_list = [token.pos_ for token in doc if token.text.strip()]
+            if pattern_list:
+                pattern_counts[json.dumps(pattern_list, ensure_ascii=False)] += 1
+    return word_counts, pattern_counts, n_lines
+
+
+def process_file(conn: sqlite3.Connection, nlp, filepath: str, bulk: bool = True) -> None:
+    """
+    Analizza un singolo file di training e poi lo elimina.
+    Con bulk=True i conteggi vengono aggregati in memoria e scritti in una sola
+    transazione; con bulk=False si usa il vecchio percorso riga per riga.
+    """
     case_name = os.path.splitext(os.path.basename(filepath))[0]
+
+    if bulk:
+        word_counts, pattern_counts, _ = count_file(nlp, filepath)
+        bulk_write(conn, case_name, word_counts, pattern_counts)
+        os.remove(filepath)
+        return
+
     case_id = get_or_create_case(conn, case_name)
 
     with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
@@ -206,18 +389,265 @@ def process_file(conn: sqlite3.Connection, nlp, filepath: str) -> None:
     # Elimina il file dopo l'elaborazione
     os.remove(filepath)
 
+###############################################################################
+# Training parallelo                                                          #
+###############################################################################
+
+def _count_worker(filepath: str, batch_size: int) -> tuple[str, Counter, Counter, int]:
+    """Eseguito in un processo del pool: conta un file con il modello del processo."""
+    case_name = os.path.splitext(os.path.basename(filepath))[0]
+    word_counts, pattern_counts, n_lines = count_file(get_pipeline("pos"), filepath, batch_size)
+    return case_name, word_counts, pattern_counts, n_lines
+
+
+def count_files(nlp, txt_files: list[str], jobs: int = 1, batch_size: int = 256, n_process: int = 1):
+    """
+    Genera (case_name, word_counts, pattern_counts, righe) per ogni file, nell'ordine
+    di txt_files: su più processi se jobs > 1, altrimenti con nlp.pipe su n_process core.
+    """
+    if jobs > 1 and len(txt_files) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(txt_files))) as pool:
+            yield from pool.map(_count_worker, txt_files, [batch_size] * len(txt_files))
+    else:
+        for txt_path in txt_files:
+            case_name = os.path.splitext(os.path.basename(txt_path))[0]
+            yield (case_name, *count_file(nlp, txt_path, batch_size, n_process))
+
+
+def train(
+    conn: sqlite3.Connection,
+    nlp,
+    txt_files: list[str],
+    jobs: int = 1,
+    batch_size: int = 256,
+    n_process: int = 1,
+) -> dict:
+    """
+    Conta i file di training (in parallelo su più processi se jobs > 1),
+    unisce le tabelle di conteggio per Case e le scrive nel DB alla fine,
+    in un'unica transazione per tutti i Case. I file vengono eliminati solo
+    dopo il commit: se una scrittura fallisce il DB resta com'era e i file
+    restano al loro posto per un nuovo tentativo.
+    Con jobs > 1 ogni processo usa nlp.pipe su un solo core (n_process è ignorato);
+    con jobs == 1 il file corrente viene diviso su n_process core da spaCy.
+    Ritorna le statistiche di throughput.
+    """
+    start = time.perf_counter()
+    words: dict[str, Counter] = {}
+    patterns: dict[str, Counter] = {}
+    total_lines = 0
+
+    def merge(case_name, word_counts, pattern_counts, n_lines):
+        nonlocal total_lines
+        words.setdefault(case_name, Counter()).update(word_counts)
+        patterns.setdefault(case_name, Counter()).update(pattern_counts)
+        total_lines += n_lines
+        print(f"  '{case_name}': {n_lines} righe")
+
+    for result in count_files(nlp, txt_files, jobs, batch_size, n_process):
+        merge(*result)
+    count_elapsed = time.perf_counter() - start
+
+    with conn:  # commit unico per tutti i Case (rollback in caso di errore)
+        cur = conn.cursor()
+        for case_name in words:
+            write_counts(cur, case_name, words[case_name], patterns[case_name])
+    for txt_path in txt_files:
+        os.remove(txt_path)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "files": len(txt_files),
+        "lines": total_lines,
+        "count_seconds": count_elapsed,
+        "write_seconds": elapsed - count_elapsed,
+        "seconds": elapsed,
+        "lines_per_sec": total_lines / elapsed if elapsed else 0.0,
+    }
+
+###############################################################################
+# Ingestione incrementale                                                     #
+###############################################################################
+
+def file_digest(filepath: str) -> str:
+    """SHA-256 del contenuto del file, letto a blocchi da 1 MiB."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(conn: sqlite3.Connection) -> dict[str, dict]:
+    """Ritorna il manifest {nome file: riga di TrainingFile come dict}."""
+    cur = conn.execute("SELECT * FROM TrainingFile")
+    columns = [d[0] for d in cur.description]
+    return {row[0]: dict(zip(columns, row)) for row in cur}
+
+
+def _manifest_counts(entry: dict) -> tuple[Counter, Counter]:
+    return Counter(json.loads(entry["word_counts"])), Counter(json.loads(entry["pattern_counts"]))
+
+
+def _delta(new: Counter, old: Counter) -> Counter:
+    """new - old conservando i valori negativi (Counter.__sub__ li scarterebbe)."""
+    delta = Counter(new)
+    delta.subtract(old)
+    return Counter({key: n for key, n in delta.items() if n})
+
+
+def _negate(counts: Counter) -> Counter:
+    return Counter({key: -n for key, n in counts.items()})
+
+
+def sync(
+    conn: sqlite3.Connection,
+    nlp,
+    txt_files: list[str],
+    jobs: int = 1,
+    batch_size: int = 256,
+    n_process: int = 1,
+    prune: bool = False,
+    rebuild: bool = False,
+) -> dict:
+    """
+    Ingestione incrementale guidata dal manifest TrainingFile; i file non vengono eliminati.
+      • invariati (stessa dimensione e mtime, oppure stesso SHA-256) – saltati
+      • nuovi o modificati – ricontati; nel DB si applica solo la differenza
+        rispetto ai conteggi che il file aveva contribuito l'ultima volta
+      • spariti dalla cartella – i loro conteggi vengono tolti solo con prune=True
+    Con rebuild=True le tabelle degli score vengono svuotate e ricostruite dai
+    conteggi salvati nel manifest: spaCy riconta solo i file cambiati.
+    Tutte le scritture avvengono in un'unica transazione.
+    Ritorna le statistiche di throughput e i contatori per stato.
+    """
+    start = time.perf_counter()
+    manifest = load_manifest(conn)
+
+    changed = []        # (nome, sha256, stat) dei file da ricontare, allineati a to_count
+    to_count = []
+    touched = []        # contenuto invariato ma mtime diversa: si aggiorna solo il manifest
+    for txt_path in sorted(txt_files):
+        name = os.path.basename(txt_path)
+        st = os.stat(txt_path)
+        entry = manifest.get(name)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            continue
+        digest = file_digest(txt_path)
+        if entry and entry["sha256"] == digest:
+            touched.append((name, st))
+            continue
+        changed.append((name, digest, st))
+        to_count.append(txt_path)
+
+    on_disk = {os.path.basename(p) for p in txt_files}
+    removed = [name for name in manifest if name not in on_disk] if prune else []
+
+    counts = list(count_files(nlp, to_count, jobs, batch_size, n_process))
+    count_elapsed = time.perf_counter() - start
+
+    with conn:
+        cur = conn.cursor()
+        cur.executemany(
+            "UPDATE TrainingFile SET size = ?, mtime_ns = ? WHERE name = ?",
+            ((st.st_size, st.st_mtime_ns, name) for name, st in touched),
+        )
+
+        if rebuild:
+            for table in ("Word_Scorage", "Pattern_Scorage", '"Word"', '"Pattern"', '"Case"'):
+                cur.execute(f"DELETE FROM {table}")
+            recount = {name for name, _, _ in changed}
+            for name, entry in manifest.items():
+                if name not in recount and name not in removed:
+                    write_counts(cur, entry["case_name"], *_manifest_counts(entry))
+
+        for (name, digest, st), (case_name, word_counts, pattern_counts, n_lines) in zip(changed, counts):
+            old = manifest.get(name)
+            if old is None or rebuild:
+                write_counts(cur, case_name, word_counts, pattern_counts)
+            else:
+                old_words, old_patterns = _manifest_counts(old)
+                write_counts(cur, case_name, _delta(word_counts, old_words), _delta(pattern_counts, old_patterns))
+            cur.execute(
+                "INSERT OR REPLACE INTO TrainingFile VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    name, case_name, digest, st.st_size, st.st_mtime_ns, n_lines,
+                    json.dumps(word_counts, ensure_ascii=False),
+                    json.dumps(pattern_counts, ensure_ascii=False),
+                    time.time(),
+                ),
+            )
+
+        for name in removed:
+            if not rebuild:
+                old_words, old_patterns = _manifest_counts(manifest[name])
+                write_counts(cur, manifest[name]["case_name"], _negate(old_words), _negate(old_patterns))
+            cur.execute("DELETE FROM TrainingFile WHERE name = ?", (name,))
+
+        drop_empty_scores(cur)
+
+    elapsed = time.perf_counter() - start
+    total_lines = sum(result[3] for result in counts)
+    added = sum(1 for name, _, _ in changed if name not in manifest)
+    return {
+        "files": len(txt_files),
+        "unchanged": len(txt_files) - len(changed),
+        "added": added,
+        "modified": len(changed) - added,
+        "removed": len(removed),
+        "rebuilt": rebuild,
+        "lines": total_lines,
+        "count_seconds": count_elapsed,
+        "write_seconds": elapsed - count_elapsed,
+        "seconds": elapsed,
+        "lines_per_sec": total_lines / elapsed if elapsed else 0.0,
+    }
+
 ###############################################################################
 # Main                                                                        #
 ###############################################################################
 
-def main():
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Addestra knowledge.db dai file in training_material.")
+    parser.add_argument("--train-dir", default=TRAIN_DIR,
+                        help="cartella dei file .txt di training")
+    parser.add_argument("--consume", action="store_true",
+                        help="vecchio comportamento: ingestione senza manifest, i file vengono eliminati")
+    parser.add_argument("--row-by-row", action="store_true",
+                        help="vecchia ingestione riga per riga (un commit per operazione, implica --consume)")
+    parser.add_argument("--prune", action="store_true",
+                        help="toglie dal DB i conteggi dei file spariti dalla cartella")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="svuota gli score e li ricostruisce dal manifest (riconta solo i file cambiati)")
+    parser.add_argument("--journal-mode", default=DEFAULT_PRAGMAS["journal_mode"])
+    parser.add_argument("--synchronous", default=DEFAULT_PRAGMAS["synchronous"])
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_PRAGMAS["cache_size"],
+                        help="PRAGMA cache_size (negativo = KiB)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="file elaborati in parallelo (processi)")
+    parser.add_argument("--batch-size", type=int, default=256,
+                        help="righe per batch di nlp.pipe")
+    parser.add_argument("--n-process", type=int, default=1,
+                        help="processi di nlp.pipe per file (solo con --jobs 1)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
     # Connessione (e creazione) del DB
     with sqlite3.connect(DB_PATH) as conn:
+        configure_connection(conn, {
+            "journal_mode": args.journal_mode,
+            "synchronous": args.synchronous,
+            "cache_size": args.cache_size,
+        })
         initialize_db(conn)
 
-        # Carica il modello SpaCy italiano
+        # Carica il modello SpaCy italiano (condiviso, servono solo i POS)
+        nlp = get_pipeline("pos")
         try:
-            nlp = spacy.load("it_core_news_sm")
+            nlp.load()
         except OSError:
             print(
                 "Modello 'it_core_news_sm' non trovato. Installa con: python -m spacy download it_core_news_sm"
@@ -225,24 +655,51 @@ def main():
             sys.exit(1)
 
         # Assicura che la directory di training esista
-        if not os.path.isdir(TRAIN_DIR):
-            os.makedirs(TRAIN_DIR, exist_ok=True)
+        train_dir = args.train_dir
+        if not os.path.isdir(train_dir):
+            os.makedirs(train_dir, exist_ok=True)
             print(
-                f"Directory '{TRAIN_DIR}' creata. Aggiungi file .txt da elaborare e riesegui lo script."
+                f"Directory '{train_dir}' creata. Aggiungi file .txt da elaborare e riesegui lo script."
             )
             return
 
         # Analizza ogni file .txt presente
-        txt_files = glob.glob(os.path.join(TRAIN_DIR, "*.txt"))
-        if not txt_files:
-            print("Nessun file .txt trovato in 'training_material'. Niente da fare.")
+        txt_files = glob.glob(os.path.join(train_dir, "*.txt"))
+        if not txt_files and not (args.prune or args.rebuild):
+            print(f"Nessun file .txt trovato in '{train_dir}'. Niente da fare.")
             return
 
-        for txt_path in txt_files:
-            print(f"Processo '{txt_path}' ...")
-            process_file(conn, nlp, txt_path)
+        if args.row_by_row:
+            for txt_path in txt_files:
+                print(f"Processo '{txt_path}' ...")
+                process_file(conn, nlp, txt_path, bulk=False)
+        elif not args.consume:
+            stats = sync(conn, nlp, txt_files, args.jobs, args.batch_size, args.n_process,
+                         prune=args.prune, rebuild=args.rebuild)
+            print(
+                f"{stats['files']} file: {stats['unchanged']} invariati, {stats['added']} nuovi, "
+                f"{stats['modified']} modificati, {stats['removed']} rimossi"
+                + (" (ricostruzione completa)" if stats["rebuilt"] else "")
+            )
+            print(
+                f"{stats['lines']} righe in {stats['seconds']:.2f}s "
+                f"(conteggio {stats['count_seconds']:.2f}s, scrittura {stats['write_seconds']:.2f}s): "
+                f"{stats['lines_per_sec']:.0f} righe/s"
+            )
+            if not (stats["added"] or stats["modified"] or stats["removed"] or stats["rebuilt"]):
+                print("Nessuna modifica: knowledge.db è già aggiornato.")
+                return
+        else:
+            print(f"Processo {len(txt_files)} file con {args.jobs} processi ...")
+            stats = train(conn, nlp, txt_files, args.jobs, args.batch_size, args.n_process)
+            print(
+                f"{stats['lines']} righe in {stats['seconds']:.2f}s "
+                f"(conteggio {stats['count_seconds']:.2f}s, scrittura {stats['write_seconds']:.2f}s): "
+                f"{stats['lines_per_sec']:.0f} righe/s"
+            )
+        bump_version(conn)
         print("Elaborazione completata.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
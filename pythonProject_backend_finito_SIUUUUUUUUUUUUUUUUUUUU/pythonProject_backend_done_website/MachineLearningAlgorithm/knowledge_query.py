@@ -1 +1 @@
-import sqlite3import jsonimport reimport mathimport sysfrom collections import defaultdictfrom live_log import emittry:    import spacyexcept ImportError:    print("SpaCy non è installato. Installa spaCy con 'pip install spacy' e il modello italiano con 'python -m spacy download it_core_news_sm'.")    sys.exit(1)DB_PATH = "MachineLearningAlgorithm/knowledge.db"SANITIZE_REGEX = re.compile(r"[^A-Za-zÀ-ÖØ-öø-ÿ0-9]+", re.UNICODE)THRESHOLD_RELATIVE = 0.4  # restituisce tutti i Case con score >= 40% del miglioreMAX_TOP = 5               # numero massimo di Case da mostrare################################################################################ Utility                                                                     ################################################################################def sanitize(text: str) -> str:    """Sostituisce i caratteri non alfanumerici con spazi e rimuove spazi extra."""    return SANITIZE_REGEX.sub(" ", text).strip()################################################################################ Database helpers                                                            ################################################################################def load_patterns(conn: sqlite3.Connection):    cur = conn.cursor()    cur.execute("SELECT id, syntax FROM Pattern")    return [(row[0], json.loads(row[1])) for row in cur.fetchall()]def pattern_scores_for_case(conn: sqlite3.Connection, pattern_ids):    score_per_case = defaultdict(int)    if not pattern_ids:        return score_per_case    cur = conn.cursor()    placeholder = ",".join(["?"] * len(pattern_ids))    cur.execute(        f"SELECT case_id, pattern_id, score FROM Pattern_Scorage WHERE pattern_id IN ({placeholder})",        pattern_ids,    )    for case_id, pattern_id, score in cur.fetchall():        score_per_case[case_id] += score    return score_per_casedef pattern_score_for_single(conn: sqlite3.Connection, case_id: int, pattern_id: int) -> int:    cur = conn.cursor()    cur.execute(        "SELECT score FROM Pattern_Scorage WHERE case_id = ? AND pattern_id = ?",        (case_id, pattern_id),    )    row = cur.fetchone()    return row[0] if row else 0def words_info(conn: sqlite3.Connection, words):    if not words:        return {}, {}, {}    lower_words = [w.lower() for w in words]    placeholders = ",".join(["?"] * len(lower_words))    cur = conn.cursor()    cur.execute(f"SELECT id, word FROM Word WHERE word IN ({placeholders})", lower_words)    rows = cur.fetchall()    word_to_id = {row[1]: row[0] for row in rows}    if not word_to_id:        return {}, {}, {}    tf_per_word_case = defaultdict(dict)    placeholder_ids = ",".join(["?"] * len(word_to_id))    cur.execute(        f"SELECT word_id, case_id, score FROM Word_Scorage WHERE word_id IN ({placeholder_ids})",        list(word_to_id.values()),    )    for wid, case_id, score in cur.fetchall():        tf_per_word_case[wid][case_id] = score    cur.execute('SELECT COUNT(*) FROM "Case"')    n_cases = cur.fetchone()[0] or 1    cur.execute(        f"SELECT word_id, COUNT(*) FROM Word_Scorage WHERE word_id IN ({placeholder_ids}) GROUP BY word_id",        list(word_to_id.values()),    )    df_rows = {row[0]: row[1] for row in cur.fetchall()}    idf = {wid: math.log(n_cases / (1 + df_rows.get(wid, 0))) for wid in word_to_id.values()}    return word_to_id, tf_per_word_case, idf################################################################################ Scoring functions                                                           ################################################################################def score_cases(pattern_case_scores, word_scores_case):    combined = defaultdict(float)    if pattern_case_scores:        max_p = max(pattern_case_scores.values()) or 1        for cid, s in pattern_case_scores.items():            combined[cid] += math.sqrt(max(0, s)) / math.sqrt(max(0.01, max_p))    if word_scores_case:        max_w = max(word_scores_case.values()) or 1        for cid, s in word_scores_case.items():            combined[cid] += math.sqrt(max(0, s)) / math.sqrt(max(0.01, max_w))    return combined################################################################################ Pattern matching                                                            ################################################################################def find_pattern_matches(pos_sequence, patterns):    matches = []    seq_len = len(pos_sequence)    for pid, pat in patterns:        pat_len = len(pat)        if pat_len == 0 or pat_len > seq_len:            continue        for i in range(seq_len - pat_len + 1):            if pos_sequence[i : i + pat_len] == pat:                matches.append({"pattern_id": pid, "start": i, "end": i + pat_len})    return matches################################################################################ Case lookup per pattern                                                     ################################################################################def cases_for_patterns(    conn: sqlite3.Connection, pattern_ids: list[int]) -> tuple[dict[int, list[int]], dict[int, str]]:    """    Ritorna:      • pid_to_cases  = {pattern_id: [case_id, ...]}      • id_to_name    = {case_id   : "CaseName"}    """    if not pattern_ids:        return {}, {}    placeholders = ",".join("?" * len(pattern_ids))    cur = conn.cursor()    cur.execute(        f"""        SELECT ps.pattern_id, c.id, c.name        FROM Pattern_Scorage ps        JOIN "Case" c ON c.id = ps.case_id        WHERE ps.pattern_id IN ({placeholders})        """,        pattern_ids,    )    pid_to_cases = defaultdict(list)    id_to_name = {}    for pid, cid, cname in cur.fetchall():        pid_to_cases[pid].append(cid)        id_to_name[cid] = cname    return pid_to_cases, id_to_name################################################################################ Interactive search loop                                                    ################################################################################def interactive_search(user_input):    with sqlite3.connect(DB_PATH) as conn:        conn.row_factory = sqlite3.Row        try:            nlp = spacy.load("it_core_news_sm")        except OSError:            emit("Modello 'it_core_news_sm' non trovato. Installa con: python -m spacy download it_core_news_sm", "warning")            return        patterns = load_patterns(conn)        pattern_len = {pid: len(plist) for pid, plist in patterns}        sanitized = sanitize(user_input)        if not sanitized:            emit("Input vuoto. Riprova.", "warning")            return        doc = nlp(sanitized)        pos_seq = [t.pos_ for t in doc if t.text.strip()]        matches = find_pattern_matches(pos_seq, patterns)        if not matches:            emit("Nessun pattern trovato nel testo.", "warning")            return        pattern_ids = [m["pattern_id"] for m in matches]        pattern_cases, id_to_name = cases_for_patterns(conn, pattern_ids)        # pattern_cases: {pattern_id: [case1, case2, ...]}        exclusive_for = {            pid: cases[0] for pid, cases in pattern_cases.items() if len(cases) == 1        }        emit("Match trovati:", "thinking")        for m in matches:            seg = doc[m["start"]:m["end"]].text            case_ids = pattern_cases.get(m["pattern_id"], [])            cases_txt = ", ".join(id_to_name[cid] for cid in case_ids) or "?"            emit(f" - Pattern ID {m['pattern_id']} (case: {cases_txt}) -> segment: '{seg}'", "thinking")        pattern_case_scores = pattern_scores_for_case(conn, pattern_ids)        words_in_matches = [doc[i].text.lower() for m in matches for i in range(m["start"], m["end"])]        _, tf_per_word_case, idf = words_info(conn, words_in_matches)        word_scores_case = defaultdict(float)        for wid, cases_tf in tf_per_word_case.items():            for cid, tf in cases_tf.items():                word_scores_case[cid] += tf * idf.get(wid, 0.0)        combined_scores = score_cases(pattern_case_scores, word_scores_case)        if not combined_scores:            emit("Impossibile calcolare punteggi.", "warning")            return        max_score = max(combined_scores.values())        candidates_raw = [cid for cid, s in combined_scores.items()                          if s >= max_score * THRESHOLD_RELATIVE]        # === nuovo filtro “almeno un pattern esclusivo” ==========================        def has_exclusive(cid: int) -> bool:            return any(exclusive_for.get(pid) == cid for pid in pattern_ids)        candidate_ids = [cid for cid in candidates_raw if has_exclusive(cid)]        # fallback di sicurezza: se filtriamo TUTTO, torniamo alla lista grezza        if not candidate_ids:            candidate_ids = candidates_raw        candidate_ids_sorted = sorted(candidate_ids, key=lambda c: combined_scores[c], reverse=True)[:MAX_TOP]        if not candidate_ids_sorted:            emit("Nessun case supera la soglia relativa.", "warning")            return        pattern_to_segment = {m["pattern_id"]: doc[m["start"]:m["end"]].text for m in matches}        cur = conn.cursor()        placeholders = ",".join(["?"] * len(candidate_ids_sorted))        cur.execute(f'SELECT id, name FROM "Case" WHERE id IN ({placeholders})', candidate_ids_sorted)        id_to_name = {row[0]: row[1] for row in cur.fetchall()}        max_p = max(pattern_case_scores.values()) or 1        max_w = max(word_scores_case.values()) or 1        emit("\n==== RISULTATI (ordinati per score) ====")        for cid in candidate_ids_sorted:            best_pattern_id = None            best_relevance = -1.0            for pid in pattern_ids:                score_single = pattern_score_for_single(conn, cid, pid)                if score_single == 0:                    continue                relevance = score_single * (1 + pattern_len.get(pid, 1))                if relevance > best_relevance:                    best_relevance = relevance                    best_pattern_id = pid            segment = pattern_to_segment.get(best_pattern_id)            if segment is None:                continue            emit(                f"* {id_to_name.get(cid, 'ID '+str(cid))}: score={combined_scores[cid]:.3f} | "                f"pattern={pattern_case_scores.get(cid,0)/max_p:.3f} | tf-idf={word_scores_case.get(cid,0)/max_w:.3f} | "                f"pattern segment='{segment}'"            )        #print()  # riga vuota separatrice################################################################################ Entrypoint                                                                  ################################################################################if __name__ == "__main__":    print("Premi Ctrl+C per terminare.\n")    try:        while True:            prompt = str(input("Inserisci la tua richiesta: "))            interactive_search(prompt)    except KeyboardInterrupt:        print("\nInterrotto dall'utente. Arrivederci.")
\ No newline at end of file
+import osimport sqlite3import jsonimport reimport sysimport timefrom contextlib import closingfrom threading import Lock, Threadfrom live_log import emitfrom query_cache import QueryCachetry:    import numpy as np    from nlp_models import get_pipelineexcept ImportError:    print("SpaCy non è installato. Installa spaCy con 'pip install spacy' e il modello italiano con 'python -m spacy download it_core_news_sm'.")    sys.exit(1)DB_PATH = "MachineLearningAlgorithm/knowledge.db"SANITIZE_REGEX = re.compile(r"[^A-Za-zÀ-ÖØ-öø-ÿ0-9]+", re.UNICODE)THRESHOLD_RELATIVE = 0.4  # restituisce tutti i Case con score >= 40% del miglioreMAX_TOP = 5               # numero massimo di Case da mostrareNGRAM_N = 3               # n-grammi POS usati per il confronto fuzzy dei patternRELOAD_CHECK_INTERVAL = float(os.environ.get("KNOWLEDGE_RELOAD_CHECK", 2.0))  # secondi fra due controlli di versionenlp = get_pipeline("pos")  # modello condiviso, caricato al primo uso; servono solo i POS# Cache delle ricerche: chiave (versione dello snapshot, query); svuotata anche a ogni cambio di snapshotSEARCH_CACHE = QueryCache()################################################################################ Utility                                                                     ################################################################################def sanitize(text: str) -> str:    """Sostituisce i caratteri non alfanumerici con spazi e rimuove spazi extra."""    return SANITIZE_REGEX.sub(" ", text).strip()def pos_ngrams(pos_sequence, n: int | None = None) -> set[tuple]:    """n-grammi della sequenza POS, con marcatori di inizio/fine (anche i pattern corti ne hanno)."""    n = n or NGRAM_N    padded = ("<s>", *pos_sequence, "</s>")    if len(padded) <= n:        return {padded}    return {padded[i : i + n] for i in range(len(padded) - n + 1)}################################################################################ Indice in memoria                                                           ################################################################################class KnowledgeIndex:    """    Tabelle di knowledge.db caricate una volta in strutture compatte:      • case_ids / case_names  – colonna -> Case      • word_row, word_matrix  – parola -> riga della matrice (parole × case) degli score      • idf                    – idf per riga parola      • pattern_ids, pattern_matrix, pattern_len – riga pattern -> id, score per case, lunghezza      • by_length              – lunghezza -> {sequenza POS: riga pattern}      • ngram_postings         – n-gramma POS -> righe dei pattern che lo contengono    Ogni query si risolve con lookup su dizionari e somme vettoriali, senza SQL.    L'indice è immutabile (snapshot): un riaddestramento produce un nuovo indice.    """    version = None       # versione del DB da cui è stato caricato    load_seconds = 0.0    def __init__(self, cases, words, word_scores, patterns, pattern_scores):        self.case_ids = [cid for cid, _ in cases]        self.case_names = [name for _, name in cases]        col = {cid: j for j, cid in enumerate(self.case_ids)}        n_cases = len(cases)        # —— parole ——        self.word_row = {}        for wid, word in words:            self.word_row.setdefault(word, len(self.word_row))        word_id_row = {wid: self.word_row[word] for wid, word in words}        self.word_matrix = np.zeros((len(self.word_row), n_cases), dtype=np.int32)        for wid, cid, score in word_scores:            if wid in word_id_row and cid in col:                self.word_matrix[word_id_row[wid], col[cid]] = score        df = (self.word_matrix > 0).sum(axis=1)        self.idf = np.log((n_cases or 1) / (1 + df))        # —— pattern POS ——        self.pattern_ids = [pid for pid, _ in patterns]        self.pattern_len = np.array([len(seq) for _, seq in patterns], dtype=np.int32)        pattern_row = {pid: i for i, pid in enumerate(self.pattern_ids)}        self.pattern_matrix = np.zeros((len(patterns), n_cases), dtype=np.int32)        for cid, pid, score in pattern_scores:            if pid in pattern_row and cid in col:                self.pattern_matrix[pattern_row[pid], col[cid]] = score        self.by_length: dict[int, dict[tuple, int]] = {}        for row, (_, seq) in enumerate(patterns):            if seq:                self.by_length.setdefault(len(seq), {})[tuple(seq)] = row        # —— indice n-grammi per il confronto fuzzy ——        postings: dict[tuple, list[int]] = {}        ngram_count = []        for row, (_, seq) in enumerate(patterns):            grams = pos_ngrams(seq) if seq else set()            ngram_count.append(len(grams))            for gram in grams:                postings.setdefault(gram, []).append(row)        self.ngram_count = np.array(ngram_count, dtype=np.int32)        self.ngram_postings = {g: np.array(rows, dtype=np.int32) for g, rows in postings.items()}        for arr in (self.word_matrix, self.idf, self.pattern_len, self.pattern_matrix,                    self.ngram_count, *self.ngram_postings.values()):            arr.flags.writeable = False    @property    def n_cases(self) -> int:        return len(self.case_ids)def load_index(conn: sqlite3.Connection) -> KnowledgeIndex:    """Legge tutte le tabelle di knowledge.db (una query per tabella)."""    cur = conn.cursor()    cases = cur.execute('SELECT id, name FROM "Case" ORDER BY id').fetchall()    words = cur.execute('SELECT id, word FROM "Word"').fetchall()    word_scores = cur.execute("SELECT word_id, case_id, score FROM Word_Scorage").fetchall()    patterns = [        (pid, json.loads(syntax))        for pid, syntax in cur.execute('SELECT id, syntax FROM "Pattern" ORDER BY id')    ]    pattern_scores = cur.execute("SELECT case_id, pattern_id, score FROM Pattern_Scorage").fetchall()    return KnowledgeIndex(cases, words, word_scores, patterns, pattern_scores)################################################################################ Snapshot e ricarica a caldo                                                 ################################################################################_index: KnowledgeIndex | None = None_index_lock = Lock()_reloading = False_last_check = 0.0_reloads = 0def _connect() -> sqlite3.Connection:    return sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)def _mtime(path: str):    try:        return os.stat(path).st_mtime_ns    except OSError:        return Nonedef read_version(conn: sqlite3.Connection) -> tuple:    """    Versione corrente del DB: la riga scritta da knowledge_builder a fine    ingestione oppure, per DB più vecchi, le mtime di knowledge.db e del suo WAL.    """    try:        row = conn.execute("SELECT version FROM KnowledgeVersion WHERE id = 1").fetchone()    except sqlite3.OperationalError:        row = None    if row:        return ("version", row[0])    return ("mtime", _mtime(DB_PATH), _mtime(DB_PATH + "-wal"))def load_snapshot() -> KnowledgeIndex:    """Carica un nuovo indice leggendo versione e tabelle nella stessa transazione."""    start = time.perf_counter()    with closing(_connect()) as conn:        conn.execute("BEGIN")        version = read_version(conn)        index = load_index(conn)        conn.rollback()    index.version = version    index.load_seconds = time.perf_counter() - start    return indexdef _swap(index: KnowledgeIndex) -> None:    """Sostituisce lo snapshot in uso (assegnazione atomica del riferimento)."""    global _index, _reloads    _index = index    _reloads += 1    SEARCH_CACHE.clear()    print(f"knowledge.db: snapshot {index.version} caricato in {index.load_seconds:.3f}s")def _reload() -> None:    global _reloading    try:        _swap(load_snapshot())    except sqlite3.Error as e:        print(f"knowledge.db: ricarica fallita ({e}), resta lo snapshot precedente")    finally:        _reloading = Falsedef _maybe_reload(index: KnowledgeIndex) -> None:    """    Ogni RELOAD_CHECK_INTERVAL secondi confronta la versione del DB con quella    dello snapshot; se è cambiata ricarica in background: le query continuano    a usare lo snapshot vecchio finché quello nuovo non è pronto.    """    global _last_check, _reloading    now = time.monotonic()    if _reloading or now - _last_check < RELOAD_CHECK_INTERVAL:        return    with _index_lock:        if _reloading or now - _last_check < RELOAD_CHECK_INTERVAL:            return        _last_check = now        try:            with closing(_connect()) as conn:                version = read_version(conn)        except sqlite3.Error:            return        if version == index.version:            return        _reloading = True    Thread(target=_reload, name="knowledge-reload", daemon=True).start()def get_index() -> KnowledgeIndex:    """Ritorna lo snapshot in uso, caricandolo da DB_PATH al primo utilizzo."""    index = _index    if index is None:        with _index_lock:            if _index is None:                _swap(load_snapshot())            return _index    _maybe_reload(index)    return indexdef index_stats() -> dict:    index = _index    if index is None:        return {"loaded": False}    return {        "loaded": True,        "version": list(index.version),        "load_seconds": index.load_seconds,        "reloads": _reloads,        "reloading": _reloading,        "cases": len(index.case_ids),        "words": len(index.word_row),        "patterns": len(index.pattern_ids),    }################################################################################ Scoring functions                                                           ################################################################################def score_cases(pattern_scores, pattern_present, word_scores, word_present):    """    Combina gli score per case (array allineati alle colonne dell'indice).    Ogni componente è normalizzata sul massimo fra i case presenti.    Ritorna (combined, present).    """    combined = np.zeros(len(pattern_scores), dtype=np.float64)    for scores, present in ((pattern_scores, pattern_present), (word_scores, word_present)):        if not present.any():            continue        max_s = scores[present].max() or 1        part = np.sqrt(np.maximum(0, scores)) / np.sqrt(max(0.01, max_s))        combined += np.where(present, part, 0.0)    return combined, pattern_present | word_present################################################################################ Pattern matching                                                            ################################################################################def find_pattern_matches(pos_sequence, index: KnowledgeIndex):    """    Trova i pattern POS contenuti nella sequenza: un lookup per (lunghezza, posizione)    invece di confrontare ogni pattern con ogni posizione.    Ordine dei match: per pattern_id, poi per posizione.    """    matches = []    seq = tuple(pos_sequence)    seq_len = len(seq)    for pat_len, table in index.by_length.items():        if pat_len > seq_len:            continue        for i in range(seq_len - pat_len + 1):            row = table.get(seq[i : i + pat_len])            if row is not None:                matches.append({                    "pattern_id": index.pattern_ids[row],                    "row": row,                    "start": i,                    "end": i + pat_len,                })    matches.sort(key=lambda m: (m["pattern_id"], m["start"]))    return matchesdef fuzzy_pattern_scores(pos_sequence, index: KnowledgeIndex):    """    Confronto parziale: similarità di Jaccard fra gli n-grammi POS della query    e quelli di ogni pattern (solo i pattern che condividono almeno un n-gramma    vengono toccati). Ritorna (similarità per pattern, score per case).    """    grams = pos_ngrams(pos_sequence)    overlap = np.zeros(len(index.pattern_ids), dtype=np.int32)    for gram in grams:        rows = index.ngram_postings.get(gram)        if rows is not None:            overlap[rows] += 1    union = len(grams) + index.ngram_count - overlap    similarity = np.divide(overlap, union, out=np.zeros(len(overlap)), where=union > 0)    return similarity, similarity @ index.pattern_matrixdef _emit_fuzzy_results(pos_seq, index: KnowledgeIndex) -> bool:    """Risultati per similarità quando nessun pattern combacia esattamente."""    similarity, case_scores = fuzzy_pattern_scores(pos_seq, index)    if not len(case_scores) or case_scores.max() <= 0:        return False    max_score = case_scores.max()    emit("Nessun pattern esatto: confronto per similarità di n-grammi POS.", "thinking")    emit("\n==== RISULTATI (ordinati per score) ====")    for j in np.argsort(-case_scores, kind="stable")[:MAX_TOP]:        if case_scores[j] < max_score * THRESHOLD_RELATIVE:            break        best = int(np.argmax(similarity * (index.pattern_matrix[:, j] > 0)))        emit(            f"* {index.case_names[j]}: score={case_scores[j] / max_score:.3f} | "            f"pattern simile={index.pattern_ids[best]} (similarità {similarity[best]:.2f})"        )    return True################################################################################ Interactive search loop                                                    ################################################################################def interactive_search(user_input):    """    Classifica la richiesta (passando dalla cache delle ricerche). Lo snapshot    si prende prima della cache: il controllo di ricarica gira anche sugli hit    e la versione dello snapshot fa parte della chiave.    """    try:        index = get_index()    except sqlite3.Error:        emit(f"Database '{DB_PATH}' non disponibile. Esegui prima knowledge_builder.py.", "warning")        return    return SEARCH_CACHE.cached_call(user_input, _interactive_search, index, version=index.version)def _interactive_search(user_input, index: KnowledgeIndex):    try:        nlp.load()    except OSError:        emit("Modello 'it_core_news_sm' non trovato. Installa con: python -m spacy download it_core_news_sm", "warning")        return    sanitized = sanitize(user_input)    if not sanitized:        emit("Input vuoto. Riprova.", "warning")        return    doc = nlp(sanitized)    pos_seq = [t.pos_ for t in doc if t.text.strip()]    matches = find_pattern_matches(pos_seq, index)    if not matches:        if not _emit_fuzzy_results(pos_seq, index):            emit("Nessun pattern trovato nel testo.", "warning")        return    # righe pattern distinte, nell'ordine dei match    rows = list(dict.fromkeys(m["row"] for m in matches))    pattern_block = index.pattern_matrix[rows]            # (pattern × case)    pattern_present = (pattern_block > 0)    # pattern con un solo case: quel case ha "almeno un pattern esclusivo"    exclusive_cols = {        int(np.flatnonzero(mask)[0]) for mask in pattern_present if mask.sum() == 1    }    emit("Match trovati:", "thinking")    for m in matches:        seg = doc[m["start"]:m["end"]].text        cols = np.flatnonzero(index.pattern_matrix[m["row"]])        cases_txt = ", ".join(index.case_names[j] for j in cols) or "?"        emit(f" - Pattern ID {m['pattern_id']} (case: {cases_txt}) -> segment: '{seg}'", "thinking")    pattern_case_scores = pattern_block.sum(axis=0)    pattern_case_present = pattern_present.any(axis=0)    # tf-idf sulle parole (distinte) coperte dai match    words_in_matches = {doc[i].text.lower() for m in matches for i in range(m["start"], m["end"])}    word_rows = [index.word_row[w] for w in words_in_matches if w in index.word_row]    tf = index.word_matrix[word_rows]                     # (parole × case)    word_scores_case = (tf * index.idf[word_rows, None]).sum(axis=0)    word_case_present = (tf > 0).any(axis=0)    combined_scores, present = score_cases(        pattern_case_scores, pattern_case_present, word_scores_case, word_case_present    )    if not present.any():        emit("Impossibile calcolare punteggi.", "warning")        return    max_score = combined_scores[present].max()    candidates_raw = [int(j) for j in np.flatnonzero(present & (combined_scores >= max_score * THRESHOLD_RELATIVE))]    # === nuovo filtro “almeno un pattern esclusivo” ==========================    candidate_cols = [j for j in candidates_raw if j in exclusive_cols]    # fallback di sicurezza: se filtriamo TUTTO, torniamo alla lista grezza    if not candidate_cols:        candidate_cols = candidates_raw    candidate_cols_sorted = sorted(candidate_cols, key=lambda j: combined_scores[j], reverse=True)[:MAX_TOP]    if not candidate_cols_sorted:        emit("Nessun case supera la soglia relativa.", "warning")        return    pattern_to_segment = {m["pattern_id"]: doc[m["start"]:m["end"]].text for m in matches}    max_p = (pattern_case_scores[pattern_case_present].max() if pattern_case_present.any() else 0) or 1    max_w = (word_scores_case[word_case_present].max() if word_case_present.any() else 0) or 1    emit("\n==== RISULTATI (ordinati per score) ====")    for j in candidate_cols_sorted:        # pattern più rilevante per il case: score * (1 + lunghezza)        relevance = pattern_block[:, j] * (1 + index.pattern_len[rows])        best = int(np.argmax(relevance))        if relevance[best] <= 0:            continue        segment = pattern_to_segment.get(index.pattern_ids[rows[best]])        if segment is None:            continue        emit(            f"* {index.case_names[j]}: score={combined_scores[j]:.3f} | "            f"pattern={pattern_case_scores[j]/max_p:.3f} | tf-idf={word_scores_case[j]/max_w:.3f} | "            f"pattern segment='{segment}'"        )################################################################################ Entrypoint                                                                  ################################################################################if __name__ == "__main__":    print("Premi Ctrl+C per terminare.\n")    try:        while True:            prompt = str(input("Inserisci la tua richiesta: "))            interactive_search(prompt)    except KeyboardInterrupt:        print("\nInterrotto dall'utente. Arrivederci.")
\ No newline at end of file
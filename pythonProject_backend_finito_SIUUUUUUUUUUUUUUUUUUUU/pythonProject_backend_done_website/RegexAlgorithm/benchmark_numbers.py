@@ -0,0 +1,89 @@
+"""
+Benchmark: numeri in lettere con la vecchia regex annidata (WORD_NUMBER_RE)
+vs il parser lineare di number_words.
+
+Su testi di lunghezza crescente (frasi di query con numeri in lettere e parole
+qualsiasi) misura il tempo di una scansione completa con i due metodi e conta
+i frammenti trovati da uno solo dei due ("diverse"): sono i numeri che la regex
+non riconosce, come "duemila" o "quarantamila" senza resto, o che chiude con uno
+spazio di troppo. Per LIMIT_RESULTS confronta la vecchia regex con
+NUMBERS_VARIANT_RE e LimitFinder.
+
+Uso (dalla cartella del progetto):
+    python RegexAlgorithm/benchmark_numbers.py [--sizes 1000 10000 100000] [--repeat 5]
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RegexAlgorithm.number_words import find_numbers, LimitFinder
+from RegexAlgorithm.regex_patterns import (
+    WORD_NUMBER_RE, NUMBERS_VARIANT_RE, LIMIT_PREFIX_RE, LIMIT_SUFFIX_RE,
+)
+
+FLAGS = re.IGNORECASE | re.VERBOSE
+OLD_WORD_NUMBER = re.compile(rf"\b{WORD_NUMBER_RE}\b", FLAGS)
+OLD_LIMIT = re.compile(
+    rf"""\b(?:{LIMIT_PREFIX_RE.pattern}{NUMBERS_VARIANT_RE.pattern})
+    (?:\s+(?:file|documenti|risultat[aeio]*|elementi|record|articoli|atti))?\b""",
+    FLAGS,
+)
+
+NUMBERS = ["tre", "ventuno", "duecentocinquanta", "novecentonovantanove",
+           "duemila", "quarantamila", "centottantamilacinquecento", "diciotto"]
+FILLER = ["mostrami", "i", "documenti", "caricati", "da", "Rossi", "sulla", "trasparenza",
+          "amministrativa", "del", "comune", "voglio", "primi", "al", "massimo", "file"]
+
+
+def make_text(n_chars: int, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    words, size = [], 0
+    while size < n_chars:
+        word = rnd.choice(NUMBERS) if rnd.random() < 0.15 else rnd.choice(FILLER)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)
+
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    limit_finder = LimitFinder(LIMIT_PREFIX_RE, LIMIT_SUFFIX_RE)
+
+    print(f"{'caratteri':>10} {'caso':<14} {'regex ms':>10} {'parser ms':>10} {'speedup':>8} {'diverse':>7}")
+    for size in args.sizes:
+        text = make_text(size)
+
+        old_spans = {m.span() for m in OLD_WORD_NUMBER.finditer(text)}
+        new_spans = {(start, end) for start, end, _ in find_numbers(text)}
+        t_old = best_of(lambda: list(OLD_WORD_NUMBER.finditer(text)), args.repeat)
+        t_new = best_of(lambda: list(find_numbers(text)), args.repeat)
+        print(f"{len(text):>10} {'WORD_NUMBER':<14} {t_old * 1e3:>10.2f} {t_new * 1e3:>10.2f} "
+              f"{t_old / t_new:>7.1f}x {len(old_spans ^ new_spans):>7}")
+
+        old_spans = {m.span() for m in OLD_LIMIT.finditer(text)}
+        new_spans = {m.span() for m in limit_finder.finditer(text)}
+        t_old = best_of(lambda: list(OLD_LIMIT.finditer(text)), args.repeat)
+        t_new = best_of(lambda: list(limit_finder.finditer(text)), args.repeat)
+        print(f"{len(text):>10} {'LIMIT_RESULTS':<14} {t_old * 1e3:>10.2f} {t_new * 1e3:>10.2f} "
+              f"{t_old / t_new:>7.1f}x {len(old_spans ^ new_spans):>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# date_engine.py
+import calendar
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from RegexAlgorithm.number_words import parse_number
+from RegexAlgorithm.regex_patterns import MONTHS
+
+# Un intervallo è (start, end) in epoch (ora locale), semiaperto [start, end);
+# None su un lato = illimitato. None al posto della tupla = non convertibile.
+
+_MONTH_INDEX = {
+    "gen": 1, "feb": 2, "mar": 3, "apr": 4, "mag": 5, "giu": 6,
+    "lug": 7, "ago": 8, "set": 9, "ott": 10, "nov": 11, "dic": 12,
+}
+
+
+@lru_cache(maxsize=128)
+def month_number(name: str) -> int | None:
+    """Numero del mese da nome o abbreviazione ("maggio", "Mag", "dic") con cache."""
+    return _MONTH_INDEX.get(name[:3].lower())
+
+
+# Le stesse forme di DATE_TOKEN, con i gruppi per giorno/mese/anno
+_TOKEN_RE = re.compile(
+    rf"""\b(?:
+        (?P<d1>\d{{1,2}})\s*(?P<m1>{MONTHS})\w*(?:\s*(?P<y1>\d{{4}}))?      # 12 maggio [2023]
+      | (?P<m2>{MONTHS})\w*\s*(?P<y2>\d{{4}})                              # maggio 2023
+      | (?P<d3>\d{{1,2}})[/\-.\s](?P<m3>\d{{1,2}})(?:[/\-.\s](?P<y3>\d{{2,4}}))?   # 12/05[/2023]
+      | (?P<y4>\d{{4}})                                                   # 2023
+      | (?P<m5>{MONTHS})\w*                                               # maggio
+    )\b""",
+    re.IGNORECASE | re.VERBOSE,
+)
+
+# Parola che apre un frammento SINGOLA e lato dell'intervallo che ne deriva
+_SINGOLA_PREFIX_RE = re.compile(
+    r"^\s*(prima|dopo|entro(?:\s+fine)?|fino(?:\s+a(?:l|lla)?)?|da|dal|dalla|il|del|di|della)\b",
+    re.IGNORECASE,
+)
+
+
+def _year(raw: str | None) -> int | None:
+    if raw is None:
+        return None
+    year = int(raw)
+    if len(raw) == 2:
+        year += 2000 if year < 69 else 1900      # come %y di strptime
+    return year
+
+
+def date_parts(token: re.Match) -> tuple[int | None, int | None, int | None]:
+    """(giorno, mese, anno) di un match di _TOKEN_RE; None dove la data non lo specifica."""
+    g = token.groupdict()
+    if g["d1"]:
+        return int(g["d1"]), month_number(g["m1"]), _year(g["y1"])
+    if g["m2"]:
+        return None, month_number(g["m2"]), _year(g["y2"])
+    if g["d3"]:
+        return int(g["d3"]), int(g["m3"]), _year(g["y3"])
+    if g["y4"]:
+        return None, None, _year(g["y4"])
+    return None, month_number(g["m5"]), None
+
+
+def parts_interval(day, month, year) -> tuple[float, float] | None:
+    """Intervallo coperto da una data parziale: giorno, mese intero o anno intero."""
+    try:
+        if month is None:
+            start, end = datetime(year, 1, 1), datetime(year + 1, 1, 1)
+        elif day is None:
+            start = datetime(year, month, 1)
+            end = datetime(year + month // 12, month % 12 + 1, 1)
+        else:
+            start = datetime(year, month, day)
+            end = start + timedelta(days=1)
+    except (ValueError, TypeError):
+        return None                               # 31/02, mese 13, ...
+    return start.timestamp(), end.timestamp()
+
+
+def resolve_range(label: str, fragment: str, now: datetime | None = None):
+    """
+    Intervallo [start, end) di un frammento FILTER_BY_DATE_RANGE.
+      DAL_AL / TRA_E: dall'inizio della prima data alla fine della seconda;
+                      l'anno mancante si prende dall'altra data, poi dall'anno corrente;
+                      se le date risultano invertite, la prima senza anno è dell'anno
+                      prima ("dal 12 dicembre al 3 gennaio 2024") e la seconda senza
+                      anno dell'anno dopo ("dal 12 dicembre 2023 al 3 gennaio");
+                      due date esplicite in ordine inverso non sono convertibili
+      SINGOLA:        prima X -> (None, inizio X), dopo X -> (fine X, None),
+                      entro/fino a X -> (None, fine X), da X -> (inizio X, None),
+                      il/di/del X -> X
+    """
+    now = now or datetime.now()
+    tokens = [date_parts(t) for t in _TOKEN_RE.finditer(fragment)]
+    if not tokens:
+        return None
+
+    if label in ("DAL_AL", "TRA_E") and len(tokens) >= 2:
+        (d1, m1, y1), (d2, m2, y2) = tokens[0], tokens[-1]
+        first_inherits, second_inherits = y1 is None, y2 is None and y1 is not None
+        y1, y2 = y1 or y2 or now.year, y2 or y1 or now.year
+        first, second = parts_interval(d1, m1, y1), parts_interval(d2, m2, y2)
+        if first is not None and second is not None and first[0] >= second[1]:
+            if first_inherits:
+                first = parts_interval(d1, m1, y1 - 1)
+            elif second_inherits:
+                second = parts_interval(d2, m2, y2 + 1)
+        if first is None or second is None or first[0] >= second[1]:
+            return None
+        return first[0], second[1]
+
+    day, month, year = tokens[0]
+    interval = parts_interval(day, month, year or now.year)
+    if interval is None:
+        return None
+    start, end = interval
+    m = _SINGOLA_PREFIX_RE.match(fragment)
+    word = m.group(1).lower() if m else ""
+    if word == "prima":
+        return None, start
+    if word == "dopo":
+        return end, None
+    if word.startswith(("entro", "fino")):
+        return None, end
+    if word in ("da", "dal", "dalla"):
+        return start, None
+    return start, end
+
+
+# ————————————————————————————————————————————————————————————
+# Tempo relativo
+
+_UNITS = (
+    ("second", "seconds"), ("sec", "seconds"), ("s", "seconds"),
+    ("minut", "minutes"), ("min", "minutes"), ("m", "minutes"),
+    ("or", "hours"), ("h", "hours"),
+    ("giorn", "days"), ("settiman", "weeks"), ("mes", "months"), ("ann", "years"),
+)
+_UNIT_WORDS = r"(?:secondi|second[oi]|sec|s|minut[oi]|min|m|or[ae]|h|giorn[oi]|settiman[ae]|mes[ei]|ann[oi])"
+
+_AGO_RE = re.compile(rf"\b(?P<n>\d+|[^\W\d_]+)\s+(?P<unit>{_UNIT_WORDS})\s+fa\b", re.IGNORECASE)
+_LAST_N_RE = re.compile(rf"\bultim\w*\s+(?P<n>\d+|[^\W\d_]+)\s+(?P<unit>{_UNIT_WORDS})\b", re.IGNORECASE)
+_COMPACT_RE = re.compile(r"^\s*(?P<n>\d+)\s*(?P<unit>h|ore|m|min|s|sec)\s*$", re.IGNORECASE)
+_FEW_RE = re.compile(rf"\b(?:pochi|qualche)\s+(?P<unit>{_UNIT_WORDS})\b", re.IGNORECASE)
+_PREVIOUS_RE = re.compile(
+    rf"\b(?:scors[oa]\s+(?P<u1>{_UNIT_WORDS})|(?P<u2>{_UNIT_WORDS})\s+scors[oa])\b", re.IGNORECASE)
+_CURRENT_RE = re.compile(rf"\bquest[aeio'’]\s*(?P<unit>{_UNIT_WORDS})\b", re.IGNORECASE)
+_LAST_ONE_RE = re.compile(rf"\bultim[aeio'’]\s*(?P<unit>{_UNIT_WORDS})s?\b", re.IGNORECASE)
+_DAY_BEFORE_RE = re.compile(r"\b(?:ieri\s+l['’]altro|l['’]altro\s*ieri)\b", re.IGNORECASE)
+
+FEW = 3     # "pochi giorni", "qualche settimana"
+
+
+@lru_cache(maxsize=64)
+def _unit(word: str) -> str | None:
+    word = word.lower()
+    for prefix, unit in _UNITS:
+        if word.startswith(prefix) and (len(prefix) > 1 or len(word) == 1):
+            return unit
+    return None
+
+
+def _count(raw: str) -> int | None:
+    return int(raw) if raw.isdigit() else parse_number(raw)
+
+
+def _shift(dt: datetime, unit: str, n: int) -> datetime:
+    """dt spostato di n unità (negativo = indietro); mesi e anni sul calendario."""
+    if unit in ("months", "years"):
+        months = dt.year * 12 + dt.month - 1 + n * (12 if unit == "years" else 1)
+        year, month = divmod(months, 12)
+        day = min(dt.day, calendar.monthrange(year, month + 1)[1])   # 31 marzo - 1 mese: 28/29 febbraio
+        return dt.replace(year=year, month=month + 1, day=day)
+    return dt + timedelta(**{unit: n})
+
+
+def _period_start(dt: datetime, unit: str) -> datetime:
+    """Inizio del periodo di calendario (ora, giorno, settimana da lunedì, mese, anno) che contiene dt."""
+    if unit == "seconds":
+        return dt.replace(microsecond=0)
+    if unit == "minutes":
+        return dt.replace(second=0, microsecond=0)
+    if unit == "hours":
+        return dt.replace(minute=0, second=0, microsecond=0)
+    day = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "weeks":
+        return day - timedelta(days=day.weekday())
+    if unit == "months":
+        return day.replace(day=1)
+    if unit == "years":
+        return day.replace(month=1, day=1)
+    return day
+
+
+def _calendar(now: datetime, unit: str, offset: int) -> tuple[float, float]:
+    """Periodo di calendario offset unità da quello corrente (0 = questo, -1 = scorso)."""
+    start = _shift(_period_start(now, unit), unit, offset)
+    return start.timestamp(), _shift(start, unit, 1).timestamp()
+
+
+def resolve_relative(fragment: str, now: datetime | None = None):
+    """
+    Intervallo [start, end) di un frammento FILTER_BY_REL_TIME:
+      "ultimi 3 giorni", "3h", "pochi mesi", "ultima settimana" -> da now - N unità in poi
+      "3 giorni fa"                      -> quel giorno (per ore/minuti: quell'ora/minuto)
+      "ieri", "oggi", "l'altro ieri"     -> il giorno di calendario
+      "mese scorso", "quest'anno"        -> il periodo di calendario
+    """
+    now = now or datetime.now()
+    low = fragment.lower()
+
+    if _DAY_BEFORE_RE.search(low):
+        return _calendar(now, "days", -2)
+    if re.search(r"\bieri\b", low):
+        return _calendar(now, "days", -1)
+    if re.search(r"\boggi\b", low):
+        return _calendar(now, "days", 0)
+
+    m = _AGO_RE.search(low)
+    if m:
+        n, unit = _count(m.group("n")), _unit(m.group("unit"))
+        return _calendar(now, unit, -n) if n and unit else None
+
+    m = _LAST_N_RE.search(low) or _COMPACT_RE.search(low)
+    if m:
+        n, unit = _count(m.group("n")), _unit(m.group("unit"))
+        return (_shift(now, unit, -n).timestamp(), None) if n and unit else None
+
+    m = _FEW_RE.search(low)
+    if m and _unit(m.group("unit")):
+        return _shift(now, _unit(m.group("unit")), -FEW).timestamp(), None
+
+    m = _PREVIOUS_RE.search(low)
+    if m:
+        unit = _unit(m.group("u1") or m.group("u2"))
+        return _calendar(now, unit, -1) if unit else None
+
+    m = _CURRENT_RE.search(low)
+    if m:
+        unit = _unit(m.group("unit"))
+        return _calendar(now, unit, 0) if unit else None
+
+    m = _LAST_ONE_RE.search(low)
+    if m:
+        unit = _unit(m.group("unit"))
+        return (_shift(now, unit, -1).timestamp(), None) if unit else None
+    return None
+
+
+def resolve(case: str, label: str, fragment: str, now: datetime | None = None):
+    """Intervallo di un filtro temporale di scan_cases, oppure None se non convertibile."""
+    try:
+        if case == "FILTER_BY_DATE_RANGE":
+            return resolve_range(label, fragment, now)
+        if case == "FILTER_BY_REL_TIME":
+            return resolve_relative(fragment, now)
+    except (ValueError, OverflowError):            # "ultimi 5000 anni": fuori dal range di datetime
+        return None
+    return None
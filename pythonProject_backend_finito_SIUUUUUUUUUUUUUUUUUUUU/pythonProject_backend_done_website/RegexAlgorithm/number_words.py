@@ -0,0 +1,229 @@
+# number_words.py
+import re
+
+# ————————————————————————————————————————————————————————————
+# Morfemi dei numeri in lettere (1 – 999 999)
+
+UNITS = {
+    "uno": 1, "una": 1, "due": 2, "tre": 3, "quattro": 4,
+    "cinque": 5, "sei": 6, "sette": 7, "otto": 8, "nove": 9,
+}
+TEENS = {
+    "dieci": 10, "undici": 11, "dodici": 12, "tredici": 13, "quattordici": 14,
+    "quindici": 15, "sedici": 16, "diciassette": 17, "diciotto": 18, "diciannove": 19,
+}
+TENS = {
+    "venti": 20, "trenta": 30, "quaranta": 40, "cinquanta": 50,
+    "sessanta": 60, "settanta": 70, "ottanta": 80, "novanta": 90,
+}
+# forme elise davanti a vocale: vent-uno, trent-otto, cent-ottanta
+ELIDED = {"vent": 20, "trent": 30, "quarant": 40, "cinquant": 50,
+          "sessant": 60, "settant": 70, "ottant": 80, "novant": 90, "cent": 100}
+
+MORPHEMES: dict[str, tuple[str, int]] = {}
+for _kind, _table in (("unit", UNITS), ("teen", TEENS), ("ten", TENS), ("elided", ELIDED)):
+    for _word, _value in _table.items():
+        MORPHEMES[_word] = (_kind, _value)
+MORPHEMES["cento"] = ("hundred", 100)
+MORPHEMES["mille"] = ("mille", 1000)
+MORPHEMES["mila"] = ("mila", 1000)
+
+_BY_FIRST: dict[str, list[str]] = {}       # iniziale -> morfemi, dal più lungo
+for _word in sorted(MORPHEMES, key=len, reverse=True):
+    _BY_FIRST.setdefault(_word[0], []).append(_word)
+
+_WORD_RE = re.compile(r"[^\W\d_]+")
+# prefiltro: solo le parole che iniziano con un morfema arrivano al parser
+_CANDIDATE_RE = re.compile(
+    r"\b(?=" + "|".join(sorted([*MORPHEMES, "tré", "trè"], key=len, reverse=True)) + r")[^\W\d_]+",
+    re.IGNORECASE,
+)
+_JOINER_RE = re.compile(r"[ \t-]+")        # fra le parole di uno stesso numero ("due mila", "cento-venti")
+_ACCENTS = str.maketrans("èéÈÉ", "eeEE")
+
+
+# ————————————————————————————————————————————————————————————
+# Parser
+
+def _step(state: tuple[int, int], kind: str, value: int) -> tuple[int, int] | None:
+    """
+    Applica un morfema allo stato (migliaia già chiuse, parte < 1000 corrente).
+    Ritorna il nuovo stato oppure None se il morfema non può seguire.
+    """
+    total, current = state
+    low = current % 100
+    if kind == "unit":
+        if low % 10 or 10 <= low <= 19:
+            return None
+        return total, current + value
+    if kind in ("teen", "ten"):
+        return (total, current + value) if low == 0 else None
+    if kind == "elided":
+        if value == 100:
+            return (total, (current or 1) * 100) if current < 10 and current != 1 else None
+        return (total, current + value) if low == 0 else None
+    if kind == "hundred":
+        return (total, (current or 1) * 100) if current < 10 and current != 1 else None
+    if kind == "mille":
+        return (1000, 0) if total == 0 and current == 0 else None
+    if kind == "mila":
+        return (current * 1000, 0) if total == 0 and current >= 2 else None
+    return None
+
+
+def _parse_word(word: str, state: tuple[int, int], i: int = 0, elided: bool = False):
+    """
+    Scompone word[i:] in morfemi (dal più lungo, con backtracking) continuando
+    da state. Ritorna lo stato finale oppure None. Le parole sono corte e i
+    punti di scelta pochi (cent/cento, vent/venti): il costo è lineare nella lunghezza.
+    """
+    if i == len(word):
+        return None if elided else state
+    if elided and word[i] not in "aeiou":
+        return None                          # la forma elisa vuole una vocale dopo
+    for morph in _BY_FIRST.get(word[i], ()):
+        if word.startswith(morph, i):
+            kind, value = MORPHEMES[morph]
+            nxt = _step(state, kind, value)
+            if nxt is not None:
+                end = _parse_word(word, nxt, i + len(morph), kind == "elided")
+                if end is not None:
+                    return end
+    return None
+
+
+def _normalize(word: str) -> str:
+    return word.lower().translate(_ACCENTS)
+
+
+def parse_number(text: str) -> int | None:
+    """
+    Converte un numero scritto in lettere in intero (es. "duecentocinquanta" -> 250,
+    "due mila e" -> None, "ventitré" -> 23). Accetta cifre. Ritorna None se il testo
+    non è (tutto) un numero.
+    """
+    text = text.strip()
+    if text.isdigit():
+        return int(text)
+    state = (0, 0)
+    words = _JOINER_RE.split(text)
+    for word in words:
+        if not word:
+            return None
+        state = _parse_word(_normalize(word), state)
+        if state is None:
+            return None
+    value = state[0] + state[1]
+    return value or None
+
+
+def number_at(text: str, pos: int) -> tuple[int, int] | None:
+    """
+    Legge un numero in lettere che inizia esattamente in pos (anche su più parole).
+    Ritorna (valore, fine) oppure None.
+    """
+    found = None
+    state = (0, 0)
+    m = _WORD_RE.match(text, pos)
+    while m:
+        nxt = _parse_word(_normalize(m.group(0)), state)
+        if nxt is None:
+            break
+        state = nxt
+        found = (state[0] + state[1], m.end())
+        joiner = _JOINER_RE.match(text, m.end())
+        if not joiner:
+            break
+        m = _WORD_RE.match(text, joiner.end())
+    return found
+
+
+def find_numbers(text: str):
+    """Genera (inizio, fine, valore) per ogni numero in lettere del testo, in una passata."""
+    pos = 0
+    for m in _CANDIDATE_RE.finditer(text):
+        if m.start() < pos:
+            continue                         # parola già consumata da un numero su più parole
+        hit = number_at(text, m.start())
+        if hit:
+            value, pos = hit
+            yield m.start(), pos, value
+
+
+def first_number(text: str) -> int | None:
+    """Primo numero del testo, in cifre o in lettere."""
+    digits = re.search(r"\d+", text)
+    words = next(find_numbers(text), None)
+    if digits and (words is None or digits.start() < words[0]):
+        return int(digits.group(0))
+    return words[2] if words else None
+
+
+# ————————————————————————————————————————————————————————————
+# Adattatori per CaseMatcher (stessa interfaccia di re.Match per scan_cases)
+
+class NumberMatch:
+    """Match di un numero: span()/start()/end()/group(0) come re.Match, più value."""
+
+    __slots__ = ("string", "_start", "_end", "value")
+
+    def __init__(self, string: str, start: int, end: int, value: int):
+        self.string = string
+        self._start = start
+        self._end = end
+        self.value = value
+
+    def span(self, group: int = 0) -> tuple[int, int]:
+        return self._start, self._end
+
+    def start(self, group: int = 0) -> int:
+        return self._start
+
+    def end(self, group: int = 0) -> int:
+        return self._end
+
+    def group(self, group: int = 0) -> str:
+        if group != 0:
+            raise IndexError("no such group")
+        return self.string[self._start:self._end]
+
+
+class NumberWordFinder:
+    """Trova i numeri in lettere (caso WORD_NUMBER) senza regex annidate."""
+
+    def finditer(self, text: str):
+        for start, end, value in find_numbers(text):
+            yield NumberMatch(text, start, end, value)
+
+
+class LimitFinder:
+    """
+    LIMIT_RESULTS: parola di richiesta (prefix_re) + numero in cifre o in lettere
+    + eventuale sostantivo (suffix_re). Il valore intero è in NumberMatch.value.
+    Se dopo il numero c'è exclude_re (es. un'unità di tempo) non è un limite.
+    """
+
+    _DIGITS_RE = re.compile(r"\d{1,6}\b")
+
+    def __init__(self, prefix_re: re.Pattern, suffix_re: re.Pattern, exclude_re: re.Pattern | None = None):
+        self.prefix_re = prefix_re
+        self.suffix_re = suffix_re
+        self.exclude_re = exclude_re
+
+    def finditer(self, text: str):
+        pos = 0
+        while True:
+            m = self.prefix_re.search(text, pos)
+            if m is None:
+                return
+            digits = self._DIGITS_RE.match(text, m.end())
+            hit = (int(digits.group(0)), digits.end()) if digits else number_at(text, m.end())
+            if hit is None or (self.exclude_re and self.exclude_re.match(text, hit[1])):
+                pos = m.start() + 1
+                continue
+            value, end = hit
+            suffix = self.suffix_re.match(text, end)
+            if suffix:
+                end = suffix.end()
+            yield NumberMatch(text, m.start(), end, value)
+            pos = end
@@ -0,0 +1,261 @@
+# query_planner.py
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from live_log import emit
+from document_catalog import CATALOG
+from document_index import search as search_documents
+from RegexAlgorithm.date_engine import resolve as resolve_dates
+from RegexAlgorithm.number_words import first_number
+from RegexAlgorithm.regex_patterns import CASE_REQUIREMENTS
+
+# Costo relativo dei passi: i filtri sul catalogo sono query indicizzate,
+# le parole chiave un lookup per termine, gli argomenti più termini da combinare
+STEP_COST = {"metadata": 1, "keyword": 2, "topic": 3}
+STREAM_BATCH_MIN = 20       # documenti verificati per volta dall'ultimo passo con ordinamento e limite
+
+# Ordinamento crescente (dal più vecchio) se il frammento lo chiede esplicitamente
+_ASCENDING_RE = re.compile(
+    r"\b(?:crescente|ascendente|cronologico(?!\s+inverso)|oldest|"
+    r"dal\s+più\s+vecchio|dai\s+più\s+vecchi|più\s+vecch[io])\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class DateFilter:
+    """Filtro temporale estratto dalla query; start/end (epoch, [start, end)) se convertibile."""
+    case: str                   # FILTER_BY_DATE_RANGE | FILTER_BY_REL_TIME
+    label: str                  # DAL_AL | TRA_E | SINGOLA | "" (relativo)
+    text: str
+    start: float | None = None
+    end: float | None = None
+
+    @property
+    def resolved(self) -> bool:
+        return self.start is not None or self.end is not None
+
+
+@dataclass
+class Step:
+    kind: str                   # metadata | keyword | topic
+    detail: str
+    terms: str | None = None
+
+    @property
+    def cost(self) -> int:
+        return STEP_COST[self.kind]
+
+
+@dataclass
+class SearchPlan:
+    method: str                                     # METADATA | CONTENUTO
+    author: str | None = None
+    dates: list[DateFilter] = field(default_factory=list)
+    sort: str | None = None                         # colonna del catalogo
+    descending: bool = True
+    limit: int | None = None
+    keywords: list[str] = field(default_factory=list)
+    topics: list[str] = field(default_factory=list)
+    steps: list[Step] = field(default_factory=list)
+
+    @property
+    def date_from(self) -> float | None:
+        starts = [d.start for d in self.dates if d.start is not None]
+        return max(starts) if starts else None      # intersezione degli intervalli
+
+    @property
+    def date_to(self) -> float | None:
+        ends = [d.end for d in self.dates if d.end is not None]
+        return min(ends) if ends else None
+
+    @property
+    def has_metadata_filters(self) -> bool:
+        return bool(self.author or any(d.resolved for d in self.dates))
+
+
+# ————————————————————————————————————————————————————————————
+# Costruzione del piano
+
+def parse_limit(fragment: str) -> int | None:
+    """
+    Numero di risultati richiesto da un frammento LIMIT_RESULTS, in cifre
+    o in lettere ("primi 5 file", "al massimo venticinque documenti").
+    """
+    return first_number(fragment)
+
+
+def build_plan(counts, matches, prob_metadata=None, soglia: float = 0.5,
+               now: datetime | None = None) -> SearchPlan:
+    """
+    Converte l'output di scan_cases (counts, matches) in un piano di ricerca.
+    I filtri temporali diventano intervalli [start, end) rispetto a now.
+    Metodo: METADATA se c'è un caso che lo richiede, CONTENUTO se tutti i casi
+    vincolati sono di contenuto, altrimenti prob_metadata() (chiamata solo se serve).
+    I passi sono ordinati per costo: prima i filtri indicizzati sul catalogo,
+    poi le scansioni dell'indice dei contenuti.
+    """
+    cases = list(counts)
+    required = [CASE_REQUIREMENTS.get(c) for c in cases if CASE_REQUIREMENTS.get(c)]
+    if "METADATA" in required:
+        method = "METADATA"
+    elif required:
+        method = "CONTENUTO"
+    elif prob_metadata is not None:
+        method = "METADATA" if prob_metadata() >= soglia else "CONTENUTO"
+    else:
+        method = "CONTENUTO"
+
+    plan = SearchPlan(method=method)
+    for case, label, frag in matches:
+        if case == "FIND_BY_AUTHOR" and frag and plan.author is None:
+            plan.author = frag
+        elif case in ("FILTER_BY_DATE_RANGE", "FILTER_BY_REL_TIME"):
+            try:
+                interval = resolve_dates(case, label, frag, now) or (None, None)
+            except (ValueError, OverflowError):
+                interval = (None, None)             # riportato da explain come non convertibile
+            plan.dates.append(DateFilter(case, label, frag, *interval))
+        elif case == "SORT_UPLOAD_DATE":
+            plan.sort = "upload_ts"
+            plan.descending = not _ASCENDING_RE.search(frag)
+        elif case == "LIMIT_RESULTS" and plan.limit is None:
+            plan.limit = parse_limit(frag)
+        elif case == "SEARCH_BY_KEYWORD" and frag:
+            plan.keywords.append(frag)
+        elif case == "ABOUT_TOPIC" and frag:
+            plan.topics.append(frag)
+
+    content = plan.keywords or plan.topics
+    if plan.has_metadata_filters or plan.sort or (plan.limit and not content):
+        parts = []
+        if plan.author:
+            parts.append(f"autore = '{plan.author}'")
+        for d in plan.dates:
+            if d.resolved:
+                parts.append(f"upload in [{_fmt(d.start)}, {_fmt(d.end)})")
+        plan.steps.append(Step("metadata", " AND ".join(parts) or "tutti i documenti"))
+    plan.steps += [Step("keyword", f"parola chiave '{k}'", k) for k in plan.keywords]
+    plan.steps += [Step("topic", f"argomento '{t}'", t) for t in plan.topics]
+    plan.steps.sort(key=lambda s: s.cost)           # sort stabile: a parità di costo resta l'ordine della query
+    return plan
+
+
+def _fmt(ts: float | None) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(ts)) if ts is not None else "…"
+
+
+def explain(plan: SearchPlan) -> list[str]:
+    """Descrizione leggibile del piano, passo per passo."""
+    lines = [f"Metodo: {plan.method}"]
+    for d in plan.dates:
+        if not d.resolved:
+            lines.append(f"Filtro data '{d.text}' non convertibile: ignorato")
+    if not plan.steps:
+        lines.append("Nessun passo eseguibile")
+    for i, step in enumerate(plan.steps, 1):
+        lines.append(f"{i}. [{step.kind}, costo {step.cost}] {step.detail}")
+    order = "decrescente" if plan.descending else "crescente"
+    if plan.sort:
+        lines.append(f"Ordinamento: {plan.sort} {order}")
+    if plan.limit:
+        where = "in SQL" if not (plan.keywords or plan.topics) else "stop al raggiungimento"
+        lines.append(f"Limite: {plan.limit} ({where})")
+    return lines
+
+
+# ————————————————————————————————————————————————————————————
+# Esecuzione
+
+def _rank(hit: dict) -> tuple:
+    # stesso ordine di document_index.search: termini distinti, frase esatta, tf-idf
+    return hit["matched"], hit["phrase"], hit["score"]
+
+
+def _first_matching(username: str, step: Step, rows: list[dict], limit: int) -> list[dict]:
+    """
+    Ultimo passo di contenuto con ordinamento del catalogo: le righe, già
+    nell'ordine richiesto, vengono verificate sull'indice a blocchi e ci si
+    ferma appena ci sono limit documenti confermati.
+    """
+    batch = max(2 * limit, STREAM_BATCH_MIN)
+    results, checked = [], 0
+    for i in range(0, len(rows), batch):
+        block = rows[i:i + batch]
+        found = {h["filename"] for h in search_documents(
+            username, step.terms, limit=None, filenames={r["filename"] for r in block})}
+        checked += len(block)
+        results += [r for r in block if r["filename"] in found]
+        if len(results) >= limit:
+            break
+    emit(f"{step.detail}: {checked} di {len(rows)} documenti verificati, {min(len(results), limit)} trovati",
+         "explain")
+    return results[:limit]
+
+
+def execute(plan: SearchPlan, username: str) -> list[dict]:
+    """
+    Esegue il piano sui documenti dell'utente e ritorna le righe del catalogo.
+      • i filtri sul catalogo (autore, date, ordinamento) sono un'unica query
+        indicizzata; senza passi di contenuto anche il limite va in SQL
+      • ogni passo di contenuto restringe i candidati (solo quelli vengono
+        valutati nell'indice); se restano vuoti ci si ferma
+      • con un limite, l'ultimo passo si ferma appena lo raggiunge: con un
+        ordinamento esplicito verifica i candidati in quell'ordine, a blocchi;
+        con un solo passo di contenuto il limite va direttamente nell'indice
+    """
+    if not plan.steps:
+        return []
+    content_steps = [s for s in plan.steps if s.kind != "metadata"]
+    rows = None
+    if any(s.kind == "metadata" for s in plan.steps):
+        rows = CATALOG.query(
+            username,
+            author=plan.author,
+            date_from=plan.date_from,
+            date_to=plan.date_to,
+            sort=plan.sort or "upload_ts",
+            descending=plan.descending,
+            limit=None if content_steps else plan.limit,
+        )
+        emit(f"catalogo: {len(rows)} documenti", "explain")
+        if not rows or not content_steps:
+            return rows
+
+    candidates = {r["filename"] for r in rows} if rows is not None else None
+    relevance: dict[str, tuple] = {}
+    for i, step in enumerate(content_steps):
+        last = i == len(content_steps) - 1
+        if last and plan.limit and plan.sort and candidates is not None:
+            if rows is None:
+                rows = CATALOG.query(username, sort=plan.sort, descending=plan.descending,
+                                     filenames=sorted(candidates))
+            return _first_matching(username, step, [r for r in rows if r["filename"] in candidates], plan.limit)
+        # un solo passo ordinato per rilevanza: i primi limit dell'indice sono il risultato
+        bound = plan.limit if last and len(content_steps) == 1 and not plan.sort else None
+        hits = search_documents(username, step.terms, limit=bound, filenames=candidates)
+        found = {h["filename"]: _rank(h) for h in hits}
+        emit(f"{step.detail}: {len(found)} documenti", "explain")
+        candidates = set(found) if candidates is None else candidates & set(found)
+        for name, rank in found.items():
+            prev = relevance.get(name, (0, 0, 0.0))
+            relevance[name] = tuple(p + r for p, r in zip(prev, rank))
+        if not candidates:
+            return []                               # nessun passo successivo può recuperare
+
+    if rows is None:
+        rows = CATALOG.query(username, sort=plan.sort or "upload_ts", descending=plan.descending,
+                             filenames=sorted(candidates))
+    if not plan.sort:
+        # senza ordinamento esplicito vince la rilevanza sui contenuti
+        rows.sort(key=lambda r: relevance.get(r["filename"], (0, 0, 0.0)), reverse=True)
+
+    results = []
+    for row in rows:
+        if row["filename"] in candidates:
+            results.append(row)
+            if plan.limit and len(results) >= plan.limit:
+                break
+    return results
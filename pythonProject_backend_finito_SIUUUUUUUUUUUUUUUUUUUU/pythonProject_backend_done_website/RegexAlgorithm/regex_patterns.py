@@ -1,5 +1,7 @@
 import re
 
+from RegexAlgorithm.number_words import NumberWordFinder, LimitFinder
+
 # ————————————————————————————————————————————————————————————
 # Regex di base per date assolute e riferimenti temporali relativi
 
@@ -60,6 +62,7 @@ SINGOLA_RE = rf"""
     \b
     (?:prima|dopo|entro(?:\s+fine)?|il|fino(?:\s+a(?:l|lla)?)?|da|dal|dalla|del|di|della)
     \b\s*
+    (?:d(?:i|el|ella|ei|egli|elle)\b\s*)?       # opzionale: 'prima del', 'dopo di'
     (?:mese\s+di\s+)?                         # opzionale: 'mese di'
     (?:data\s+)?                                 # opzionale: 'data'
     (?:{ART_DET}\s*)?                         # articoli opzionali
@@ -67,7 +70,9 @@ SINGOLA_RE = rf"""
 """
 
 # ————————————————————————————————————————————————————————————
-# Dizionario di regex per i casi d’uso
+# Numeri in lettere: il riconoscimento è in number_words.py (parser lineare).
+# Le regex annidate qui sotto non sono più usate dal matcher; restano come
+# riferimento per benchmark_numbers.py.
 
 UNITS_WORD_RE = r"""
     (?:un[oa]|due|tr[eèé]|quattro|cinque|sei|sette|otto|nove)
@@ -141,6 +146,25 @@ NUMBERS_VARIANT_RE = re.compile(
     re.IGNORECASE | re.VERBOSE
 )
 
+# LIMIT_RESULTS: parole che introducono il numero e sostantivo che lo segue
+LIMIT_PREFIX_RE = re.compile(
+    r"""\b
+    (?:primi|prime|top|ultimi|ultime|
+     solo|(?:al\s+)?massim[oaie](?:\s+di)?|
+     non\s+più\s+di|fino\s+a|esattamente|voglio|mostrami|visualizza)
+    \s+""",
+    re.IGNORECASE | re.VERBOSE,
+)
+LIMIT_SUFFIX_RE = re.compile(
+    r"\s+(?:file|documenti|risultat[aeio]*|elementi|record|articoli|atti)\b",
+    re.IGNORECASE,
+)
+# "ultimi tre giorni" è un filtro temporale (FILTER_BY_REL_TIME), non un limite
+LIMIT_EXCLUDE_RE = re.compile(
+    r"\s+(?:giorni?|settiman[ae]|mesi|anni|ore|minuti|secondi)\b",
+    re.IGNORECASE,
+)
+
 # ————————————————————————————————————————————————————————————
 # Dizionario di regex per i casi d’uso
 
@@ -155,7 +179,7 @@ CASE_PATTERNS = {
     ],
 
     "WORD_NUMBER": [
-        rf"\b{WORD_NUMBER_RE}\b",
+        NumberWordFinder(),
     ],
 
     # ——— Ordinamento per data upload ———
@@ -193,19 +217,9 @@ CASE_PATTERNS = {
         r"\b(?:sopra|in\s+basso)\b",
     ],
 
+    # prefisso + numero (cifre o lettere, convertito in intero) + sostantivo opzionale
     "LIMIT_RESULTS": [
-        rf"""
-        \b
-        (?:
-            (?:primi|prime|top|ultimi|ultime|
-             solo|(?:al\s+)?massim[oaie](?:\s+di)?|
-             non\s+più\s+di|fino\s+a|esattamente|voglio|mostrami|visualizza)
-            \s+
-            {NUMBERS_VARIANT_RE.pattern}  # deve essere qui, subito dopo
-        )
-        (?:\s+(?:file|documenti|risultat[aeio]*|elementi|record|articoli|atti))?
-        \b
-        """
+        LimitFinder(LIMIT_PREFIX_RE, LIMIT_SUFFIX_RE, LIMIT_EXCLUDE_RE),
     ],
 
     # ——— Ricerca per autore ———
@@ -325,4 +339,98 @@ CASE_REQUIREMENTS = {
     "ABOUT_TOPIC":          "CONTENUTO",
     "FILTER_BY_REL_TIME":   "METADATA",
     "DATE_TOKEN":           None,
-}
\ No newline at end of file
+}
+
+# ————————————————————————————————————————————————————————————
+# Prefiltro: parole "innesco" senza le quali un caso non può matchare.
+# Frammenti regex cercati sul testo in minuscolo: devono essere conservativi
+# (meglio un falso positivo che saltare un caso).
+
+_DIGIT = r"\d"
+_MONTH_PREFIXES = ["gen", "feb", "mar", "apr", "mag", "giu",
+                   "lug", "ago", "set", "ott", "nov", "dic"]
+
+CASE_TRIGGERS = {
+    "DATE_TOKEN": [_DIGIT, *_MONTH_PREFIXES],
+
+    "WORD_NUMBER": [
+        "un", "due", "tr", "quattr", "cinque", "sei", "sette", "otto", "nove",
+        "dieci", "dici",
+        "vent", "quarant", "cinquant", "sessant", "settant", "ottant", "novant",
+        "cento", "mille", "mila",
+    ],
+
+    "SORT_UPLOAD_DATE": [
+        "sort", "ordin", "ultim", "data", "dal", "dai", "più", "recent", "vecch",
+        "newest", "oldest", "most", "sopra", "basso",
+    ],
+
+    "LIMIT_RESULTS": [
+        "prim", "top", "ultim", "solo", "massim", "non", "fino", "esattamente",
+        "voglio", "mostrami", "visualizza",
+    ],
+
+    "FIND_BY_AUTHOR": [
+        "autor", "autric", "author", "responsabile",
+        "scrit", "redatt", "firmat", "realizzat", "prodott", "fatt",
+        "file", "document", "atti", "articoli", "pdf",
+    ],
+
+    # ogni variante contiene un DATE_TOKEN
+    "FILTER_BY_DATE_RANGE": [_DIGIT, *_MONTH_PREFIXES],
+
+    "SEARCH_BY_KEYWORD": ["keyword", "termin", "parol", "string"],
+
+    "ABOUT_TOPIC": [
+        "parl", "tratt", "riguard", "relativ", "su", "proposito", "inerent", "concernent",
+    ],
+
+    "FILTER_BY_REL_TIME": [
+        _DIGIT, "ultim", "fa", "ieri", "oggi", "scors", "pochi", "qualche", "quest",
+    ],
+}
+
+
+class CaseMatcher:
+    """
+    Motore regex dei casi d'uso, costruito una sola volta all'import:
+      • tutti i pattern di CASE_PATTERNS sono precompilati;
+      • un prefiltro per caso (CASE_TRIGGERS) salta i casi le cui parole
+        innesco non compaiono nel testo, evitando le relative scansioni.
+
+    I pattern non vengono fusi in un'unica alternanza: scan_cases ha bisogno
+    dei match sovrapposti fra pattern diversi (es. "ultimi 5 file" è sia
+    SORT_UPLOAD_DATE sia LIMIT_RESULTS, DAL_AL e SINGOLA per il dedup delle date),
+    che una sola passata con alternanza consumerebbe.
+    """
+
+    def __init__(self, case_patterns: dict, triggers: dict | None = None,
+                 flags: int = re.IGNORECASE | re.VERBOSE):
+        # un pattern è una regex sorgente oppure un oggetto con finditer()
+        # (es. i parser di number_words), usato così com'è
+        self.compiled = {
+            case: [(pat, re.compile(pat, flags) if isinstance(pat, str) else pat) for pat in patterns]
+            for case, patterns in case_patterns.items()
+        }
+        self.triggers = {
+            case: re.compile("|".join(frags))
+            for case, frags in (triggers or {}).items()
+        }
+
+    def cases_for(self, text: str) -> list[str]:
+        """Casi che possono matchare il testo (nell'ordine di CASE_PATTERNS)."""
+        low = text.lower()
+        return [
+            case for case in self.compiled
+            if case not in self.triggers or self.triggers[case].search(low)
+        ]
+
+    def finditer(self, text: str):
+        """Genera (case, pattern_sorgente, match) nello stesso ordine del vecchio ciclo."""
+        for case in self.cases_for(text):
+            for pat, rx in self.compiled[case]:
+                for m in rx.finditer(text):
+                    yield case, pat, m
+
+
+CASE_MATCHER = CaseMatcher(CASE_PATTERNS, CASE_TRIGGERS)
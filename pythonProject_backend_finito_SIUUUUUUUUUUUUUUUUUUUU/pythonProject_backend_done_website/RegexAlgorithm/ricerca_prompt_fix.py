@@ -1,12 +1,17 @@
+import os
 import re
 import math
-import spacy
+from spacy.tokens import Doc, Span
 from live_log import emit
+from nlp_models import get_pipeline
+from query_cache import QueryCache
+from RegexAlgorithm import keywords_weights, number_words, regex_patterns
 from RegexAlgorithm.keywords_weights import TOKEN_WEIGHTS
+from RegexAlgorithm.query_planner import build_plan, explain, execute
 from collections import Counter
 from RegexAlgorithm.regex_patterns import (
     DATE_RE, REL_TIME_RE,
-    CASE_PATTERNS, CASE_REQUIREMENTS,
+    CASE_MATCHER, CASE_REQUIREMENTS,
     DAL_AL_RE, TRA_E_RE, SINGOLA_RE,
 )
 DATE_RANGE_LABELS = {
@@ -15,7 +20,16 @@ DATE_RANGE_LABELS = {
     SINGOLA_RE: "SINGOLA",
 }
 
-nlp = spacy.load("it_core_news_sm")  # modello spaCy italiano
+# modello spaCy italiano condiviso, caricato al primo uso; il parser non serve
+nlp = get_pipeline("pos+ner")
+
+# Cache dei risultati di scan_cases, invalidata se cambiano pattern o pesi
+QUERY_CACHE = QueryCache(
+    watch=[regex_patterns.__file__, number_words.__file__, keywords_weights.__file__],
+    max_entries=int(os.environ.get("QUERY_CACHE_MAX", 512)),
+    max_bytes=int(os.environ.get("QUERY_CACHE_BYTES", 8 * 1024 * 1024)),
+    ttl=float(os.environ.get("QUERY_CACHE_TTL", 600)),
+)
 
 # ————————————————————————————————————————————————————————————
 # Calcolo probabilità METADATA/CONTENUTO
@@ -24,7 +38,7 @@ BIAS = -1.2  # bias leggermente negativo
 def sigmoid(x: float) -> float:
     return 1 / (1 + math.exp(-x))
 
-def prob_metadata(text: str) -> float:
+def prob_metadata(text: str, doc: Doc | None = None) -> float:
     score = BIAS
 
     if DATE_RE.search(text):
@@ -32,11 +46,12 @@ def prob_metadata(text: str) -> float:
     if REL_TIME_RE.search(text):
         score += 0.9
 
-    doc = nlp(text.lower())
+    if doc is None:
+        doc = nlp(text.lower())
     score += 0.6 * sum(1 for ent in doc.ents if ent.label_ == "DATE")
 
     for tok in doc:
-        score += TOKEN_WEIGHTS.get(tok.lemma_, 0)
+        score += TOKEN_WEIGHTS.get(tok.lemma_.lower(), 0)
 
     return sigmoid(score)
 
@@ -44,12 +59,13 @@ def prob_metadata(text: str) -> float:
 # ————————————————————————————————————————————————————————————
 # Funzioni di pulizia d'output
 
-def clean_author_match(matched_text: str) -> str | None:
+def clean_author_match(matched_text: str | Span) -> str | None:
     """
-    Dato un frammento di testo matchato da FIND_BY_AUTHOR,
+    Dato un frammento di testo matchato da FIND_BY_AUTHOR
+    (stringa oppure Span del Doc della query già analizzata),
     restituisce il nome dell'autore se riconosciuto da SpaCy, altrimenti None.
     """
-    doc = nlp(matched_text)
+    doc = nlp(matched_text) if isinstance(matched_text, str) else matched_text
 
     # 1. Cerca entità di tipo PERSON
     #for ent in doc.ents:
@@ -70,97 +86,125 @@ def clean_author_match(matched_text: str) -> str | None:
 
 def _dedup_date_frags(date_buf):
     """
-    Rimuove i frammenti di data duplicati, preferendo quelli che contengono un anno ({4}).
-
-    date_buf: lista di tuple (label, frammento_data)
-    ritorna: lista filtrata di tuple (label, frammento_data)
-    """
-    # Pattern per riconoscere un anno a 4 cifre
-    year_re = re.compile(r"\b\d{4}\b")
-
-    # Separa frammenti con anno e senza anno
-    with_year = [(lbl, frag) for lbl, frag in date_buf if year_re.search(frag)]
-    without_year = [(lbl, frag) for lbl, frag in date_buf if not year_re.search(frag)]
-
-    # Se esistono frammenti con anno, lavoriamo solo su quelli; altrimenti sugli altri
-    to_process = with_year if with_year else without_year
+    Rimuove i frammenti di data contenuti in uno più ampio della stessa query
+    (es. "dal 12 maggio" dentro "dal 12 maggio al 3 giugno 2023").
 
-    # Ordiniamo per lunghezza del frammento (decrescente) così i più completi vengono tenuti prima
-    to_process_sorted = sorted(to_process, key=lambda x: len(x[1]), reverse=True)
-
-    # Dedup: manteniamo un frammento solo se non è sottostringa di uno già incluso
-    result = []
-    for lbl, frag in to_process_sorted:
-        if not any(frag in existing_frag for _, existing_frag in result):
-            result.append((lbl, frag))
+    date_buf: lista di tuple (inizio, fine, label, frammento_data) con gli offset nel testo
+    ritorna: lista filtrata di tuple (label, frammento_data), in ordine di posizione
 
+    Ordinati i frammenti per inizio (a parità, il più lungo prima) basta confrontare
+    ciascuno con la fine più a destra già tenuta: O(n log n) invece del confronto
+    fra tutte le coppie di stringhe.
+    """
+    result, reach = [], -1
+    for start, end, lbl, frag in sorted(date_buf, key=lambda x: (x[0], -x[1])):
+        if end <= reach:
+            continue                # contenuto in un frammento già tenuto
+        result.append((lbl, frag))
+        reach = end
     return result
 
-def clean_about_topic(raw_text: str) -> str:
+def clean_about_topic(raw_text: str | Span) -> str:
     """
     Pulisce l'output di tipo ABOUT_TOPIC eliminando rumore testuale
     e mantenendo solo le componenti potenzialmente utili come prompt (NOUN, PROPN, ADJ).
+    Accetta una stringa oppure uno Span del Doc della query.
     """
-    doc = nlp(raw_text)
+    doc = nlp(raw_text) if isinstance(raw_text, str) else raw_text
     tokens = [tok.text for tok in doc if tok.pos_ in {"NOUN", "PROPN", "ADJ"} and not tok.is_stop]
     return " ".join(tokens)
 
 # ————————————————————————————————————————————————————————————
 # Individuazione casi d'uso
 
-def scan_cases(text: str) -> tuple[Counter, list[tuple[str, str, str]]]:
+def _match_span(doc: Doc, m: re.Match) -> Span | str:
+    """
+    Converte gli offset del match regex (senza spazi ai bordi) in uno Span del Doc,
+    così i cleaner lavorano sui token già analizzati invece di rilanciare la pipeline.
+    """
+    start, end = m.span()
+    raw = m.group(0)
+    start += len(raw) - len(raw.lstrip())
+    end -= len(raw) - len(raw.rstrip())
+    span = doc.char_span(start, end, alignment_mode="expand")
+    return span if span is not None else raw.strip()
+
+def scan_cases(text: str, doc: Doc | None = None) -> tuple[Counter, list[tuple[str, str, str]]]:
     """
     Ritorna:
       counts  – Counter {case: occorrenze}
       matches – [(case, label, frammento)], dove label è
                 "DAL_AL" | "TRA_E" | "SINGOLA" oppure "" per gli altri casi.
+
+    Il testo passa nella pipeline spaCy al più una volta (e solo se serve):
+    i frammenti AUTHOR/TOPIC diventano Span dello stesso Doc.
     """
+    counts, matches, _ = _scan_cases(text, doc)
+    return counts, matches
+
+def _scan_cases(text: str, doc: Doc | None) -> tuple[Counter, list[tuple[str, str, str]], Doc | None]:
+    """scan_cases più il Doc spaCy usato (None se il testo non è stato analizzato)."""
     counts   = Counter()
     matches  : list[tuple[str, str, str]] = []
-    date_buf : list[tuple[str, str]] = []   # [(label, frag)]
-
-    for case, patterns in CASE_PATTERNS.items():
-        for pat in patterns:
-            for m in re.finditer(pat, text, re.IGNORECASE | re.VERBOSE):
-                output = m.group(0).strip()
-                label = ""
+    date_buf : list[tuple[int, int, str, str]] = []   # [(inizio, fine, label, frag)]
 
-                if case == "FIND_BY_AUTHOR":
-                    emit("before AUTHOR: " + output, "thinking")
-                    output = clean_author_match(output)
-                    if not output:
-                        continue
+    for case, pat, m in CASE_MATCHER.finditer(text):
+        output = m.group(0).strip()
+        label = ""
 
-                if case == "FILTER_BY_DATE_RANGE":
-                    label = DATE_RANGE_LABELS.get(pat, "")
-                    date_buf.append((label, output))
-                    continue                 # dedup dopo
+        if case == "FIND_BY_AUTHOR":
+            emit("before AUTHOR: " + output, "thinking")
+            if doc is None:
+                doc = nlp(text)
+            output = clean_author_match(_match_span(doc, m))
+            if not output:
+                continue
 
-                if case == "WORD_NUMBER" and not output:
-                    continue  # salta i match a lunghezza zero
+        if case == "FILTER_BY_DATE_RANGE":
+            label = DATE_RANGE_LABELS.get(pat, "")
+            date_buf.append((*m.span(), label, output))
+            continue                 # dedup dopo
 
-                if case == "ABOUT_TOPIC":
-                    emit("before TOPIC: " + output, "thinking")
-                    output = clean_about_topic(output)
+        if case == "ABOUT_TOPIC":
+            emit("before TOPIC: " + output, "thinking")
+            if doc is None:
+                doc = nlp(text)
+            output = clean_about_topic(_match_span(doc, m))
 
-                if case == "SEARCH_BY_KEYWORD":
-                    output = m.group('term').strip()
+        if case == "SEARCH_BY_KEYWORD":
+            output = m.group('term').strip()
 
-                counts[case] += 1
-                matches.append((case, label, output))
+        counts[case] += 1
+        matches.append((case, label, output))
 
     # —— deduplica date-range e aggiunge label corrispondente ——
     for lbl, output in _dedup_date_frags(date_buf):
         counts["FILTER_BY_DATE_RANGE"] += 1
         matches.append(("FILTER_BY_DATE_RANGE", lbl, output))
 
-    return counts, matches
+    return counts, matches, doc
+
+def scan_cases_cached(text: str) -> tuple[Counter, list[tuple[str, str, str]], Doc | None]:
+    """
+    scan_cases passando da QUERY_CACHE (i messaggi "thinking" vengono rimandati sugli hit).
+    Ritorna anche il Doc spaCy prodotto dall'analisi, da riusare (None sugli hit
+    o se non è servito): il Doc non entra in cache.
+    """
+    parsed = []
+
+    def scan(t: str):
+        counts, matches, doc = _scan_cases(t, None)
+        parsed.append(doc)
+        return counts, matches
+
+    counts, matches = QUERY_CACHE.cached_call(text, scan)
+    return Counter(counts), list(matches), (parsed[0] if parsed else None)
 
 # ————————————————————————————————————————————————————————————
-def analizza_query(text: str, soglia: float = 0.5) -> str:
+def analizza_query(text: str, soglia: float = 0.5, username: str | None = None) -> str:
     #print("received request: " + text)
     #cases = detect_cases(text)
-    counts, matches = scan_cases(text)
+    counts, matches, doc = scan_cases_cached(text)
     cases = list(counts)  # solo le chiavi, come prima
 
     #print("stepped out")
@@ -205,6 +249,19 @@ def analizza_query(text: str, soglia: float = 0.5) -> str:
                 emit(f" ↳  {case}: \"{frag}\"", "html")
                 #print(f" ↳  {case}: \"{frag}\"")
 
+    # Piano di ricerca (filtri sul catalogo prima, poi indice dei contenuti)
+    if username and counts:
+        # il Doc di scan_cases, se c'è: il testo non passa una seconda volta da spaCy
+        plan = build_plan(counts, matches, lambda: prob_metadata(text, doc), soglia)
+        for line in explain(plan):
+            emit(line, "explain")
+        results = execute(plan, username)
+        if not results:
+            emit("Nessun documento trovato.", "text")
+        for r in results:
+            author = f" — {r['author']}" if r["author"] else ""
+            emit(f"📄 {r['filename']}{author}", "text")
+
     # Avviso di incoerenza (opzionale)
     #incoerenti = [
     #    c for c in cases
@@ -1,32 +1,296 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from threading import Lock
+
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-# Definizione del database (SQLite in questo esempio)
-engine = create_engine('sqlite:///accounts.db', echo=False)
+from passwords import HASHER, PasswordHasher
+
+ACCOUNTS_DB = os.environ.get("ACCOUNTS_DB", "accounts.db")
+
+# Definizione del database (SQLite in questo esempio).
+# Pool di connessioni condiviso fra i thread: ogni operazione prende la sua
+# sessione (session_scope) invece di una sessione globale.
+engine = create_engine(
+    f"sqlite:///{ACCOUNTS_DB}",
+    echo=False,
+    pool_size=int(os.environ.get("ACCOUNTS_POOL_SIZE", 5)),
+    max_overflow=int(os.environ.get("ACCOUNTS_POOL_OVERFLOW", 5)),
+    pool_pre_ping=True,
+    connect_args={"check_same_thread": False, "timeout": 10},
+)
 Base = declarative_base()
 
+
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _record):
+    # WAL: i login leggono mentre una registrazione scrive
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode = WAL")
+    cur.execute("PRAGMA synchronous = NORMAL")
+    cur.execute("PRAGMA busy_timeout = 10000")
+    cur.close()
+
+
 class User(Base):
     __tablename__ = 'users'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(String, nullable=False, unique=True)
-    password = Column(String, nullable=False)
+    password = Column(String, nullable=False)   # hash della password (formato in passwords.py)
     is_admin = Column(Boolean, default=False)
 
     def __repr__(self):
         return f"<User(username='{self.username}', is_admin={self.is_admin})>"
 
-# Creazione di una sessione per le operazioni CRUD
-Session = sessionmaker(bind=engine)
-session = Session()
+
+# Una sessione per operazione; expire_on_commit=False: i valori letti
+# restano utilizzabili dopo la chiusura della sessione
+Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+
+@contextmanager
+def session_scope():
+    """Sessione per una singola operazione: commit a fine blocco, rollback su errore."""
+    session = Session()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+@dataclass(frozen=True)
+class Account:
+    """Copia in sola lettura di un utente, sicura da passare fra thread."""
+    id: int
+    username: str
+    is_admin: bool
+
+
+class AccountRepository:
+    """
+    Accesso agli account thread-safe:
+      • ogni operazione usa la propria sessione sul pool di connessioni;
+      • i metodi *_async girano in un pool di thread dedicato, così le
+        coroutine di Tornado non bloccano l'IOLoop sulle query;
+      • le password sono salvate come hash (passwords.HASHER); al login
+        riuscito un hash con parametri superati, o una password in chiaro
+        di prima, viene ricalcolato con i parametri correnti;
+      • gli utenti autenticati di recente restano in una cache LRU con TTL
+        (impronta della password con un segreto di processo, mai la password),
+        invalidata quando la password cambia o l'utente viene eliminato.
+    Un login concorrente a un cambio password non lo annulla: il rehash scrive
+    solo se l'hash salvato è ancora quello letto, e la cache non viene
+    riempita se nel frattempo l'utente è stato invalidato (generazione).
+    """
+
+    def __init__(self, hasher: PasswordHasher = HASHER, max_workers: int = 4,
+                 cache_entries: int = 1024, cache_ttl: float = 300.0):
+        self.hasher = hasher
+        self.max_workers = max_workers
+        self.cache_entries = cache_entries
+        self.cache_ttl = cache_ttl
+        self._pool = None
+        self._secret = secrets.token_bytes(32)
+        self._auth: OrderedDict[str, tuple[bytes, Account, float]] = OrderedDict()
+        self._generations: dict[str, int] = {}       # username -> invalidazioni
+        self._lock = Lock()
+        self._ready = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _ensure_schema(self) -> None:
+        if not self._ready:
+            Base.metadata.create_all(engine)
+            self._ready = True
+
+    # —— cache degli utenti autenticati ——
+    def _fingerprint(self, password: str) -> bytes:
+        return hmac.new(self._secret, password.encode(), hashlib.sha256).digest()
+
+    def _cached(self, username: str, password: str) -> Account | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._auth.get(username)
+            if entry and entry[2] > now and hmac.compare_digest(entry[0], self._fingerprint(password)):
+                self._auth.move_to_end(username)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def _generation(self, username: str) -> int:
+        with self._lock:
+            return self._generations.get(username, 0)
+
+    def _remember(self, account: Account, password: str, generation: int) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._generations.get(account.username, 0) != generation:
+                return                  # password cambiata o utente eliminato durante il login
+            self._auth[account.username] = (self._fingerprint(password), account, now + self.cache_ttl)
+            self._auth.move_to_end(account.username)
+            while self._auth:
+                oldest = next(iter(self._auth))
+                if self._auth[oldest][2] > now and len(self._auth) <= self.cache_entries:
+                    break
+                del self._auth[oldest]
+
+    def invalidate(self, username: str) -> None:
+        with self._lock:
+            self._generations[username] = self._generations.get(username, 0) + 1
+            if self._auth.pop(username, None) is not None:
+                self.invalidations += 1
+
+    # —— accesso al DB (password già trasformata in hash) ——
+    def _insert(self, username: str, hashed: str, is_admin: bool) -> Account | None:
+        self._ensure_schema()
+        try:
+            with session_scope() as session:
+                user = User(username=username, password=hashed, is_admin=is_admin)
+                session.add(user)
+                session.flush()
+                return Account(user.id, user.username, bool(user.is_admin))
+        except IntegrityError:
+            return None
+
+    def _stored(self, username: str) -> tuple[Account, str] | None:
+        """Utente e hash salvato (None se l'utente non esiste)."""
+        self._ensure_schema()
+        with session_scope() as session:
+            user = session.query(User).filter_by(username=username).first()
+            return (Account(user.id, user.username, bool(user.is_admin)), user.password) if user else None
+
+    def _store_hash(self, username: str, hashed: str) -> bool:
+        self._ensure_schema()
+        with session_scope() as session:
+            return bool(session.query(User).filter_by(username=username).update({"password": hashed}))
+
+    def _rehashed(self, username: str, old: str, hashed: str) -> bool:
+        """
+        Stessa password con i parametri correnti (la cache resta valida). Scrive
+        solo se l'hash salvato è ancora old: False se nel frattempo è cambiato.
+        """
+        self._ensure_schema()
+        with session_scope() as session:
+            updated = session.query(User).filter_by(username=username, password=old).update({"password": hashed})
+        if updated:
+            self.hasher.rehashed += 1
+        return bool(updated)
+
+    # —— API sincrona ——
+    def get(self, username: str) -> Account | None:
+        row = self._stored(username)
+        return row[0] if row else None
+
+    def create(self, username: str, password: str, is_admin: bool = False) -> Account | None:
+        """Registra un utente; None se lo username è già preso."""
+        return self._insert(username, self.hasher.hash(password), is_admin)
+
+    def authenticate(self, username: str, password: str) -> Account | None:
+        """Utente se le credenziali sono corrette, altrimenti None."""
+        account = self._cached(username, password)
+        if account is not None:
+            return account
+        generation = self._generation(username)
+        row = self._stored(username)
+        if row is None or not self.hasher.verify(row[1], password):
+            return None
+        if self.hasher.needs_rehash(row[1]) and not self._rehashed(username, row[1], self.hasher.hash(password)):
+            return row[0]                               # hash cambiato durante il login: niente cache
+        self._remember(row[0], password, generation)
+        return row[0]
+
+    def set_password(self, username: str, password: str) -> bool:
+        updated = self._store_hash(username, self.hasher.hash(password))
+        self.invalidate(username)
+        return updated
+
+    def delete(self, username: str) -> bool:
+        self._ensure_schema()
+        with session_scope() as session:
+            deleted = session.query(User).filter_by(username=username).delete()
+        self.invalidate(username)
+        return bool(deleted)
+
+    # —— API per le coroutine: DB nel pool degli account, KDF nel pool dell'hasher ——
+    async def _run(self, fn, *args):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="accounts")
+        return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    async def get_async(self, username: str) -> Account | None:
+        return await self._run(self.get, username)
+
+    async def create_async(self, username: str, password: str, is_admin: bool = False) -> Account | None:
+        hashed = await self.hasher.hash_async(password)
+        return await self._run(self._insert, username, hashed, is_admin)
+
+    async def authenticate_async(self, username: str, password: str) -> Account | None:
+        account = self._cached(username, password)       # hit: né DB né KDF
+        if account is not None:
+            return account
+        generation = self._generation(username)
+        row = await self._run(self._stored, username)
+        if row is None or not await self.hasher.verify_async(row[1], password):
+            return None
+        if self.hasher.needs_rehash(row[1]):
+            hashed = await self.hasher.hash_async(password)
+            if not await self._run(self._rehashed, username, row[1], hashed):
+                return row[0]                           # hash cambiato durante il login: niente cache
+        self._remember(row[0], password, generation)
+        return row[0]
+
+    async def set_password_async(self, username: str, password: str) -> bool:
+        hashed = await self.hasher.hash_async(password)
+        updated = await self._run(self._store_hash, username, hashed)
+        self.invalidate(username)
+        return updated
+
+    async def delete_async(self, username: str) -> bool:
+        return await self._run(self.delete, username)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "cached_users": len(self._auth),
+                "cache_ttl": self.cache_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+                "pool": engine.pool.status(),
+                "passwords": self.hasher.stats(),
+            }
+
+
+ACCOUNTS = AccountRepository(
+    max_workers=int(os.environ.get("ACCOUNTS_WORKERS", 4)),
+    cache_entries=int(os.environ.get("ACCOUNTS_CACHE_MAX", 1024)),
+    cache_ttl=float(os.environ.get("ACCOUNTS_CACHE_TTL", 300)),
+)
 
 if __name__ == '__main__':
     # Crea le tabelle nel database
     Base.metadata.create_all(engine)
 
     # Esempio: creare un nuovo utente
-    # new_user = User(username='mario', password='segreta', is_admin=True)
-    # session.add(new_user)
-    # session.commit()
-    # print(new_user)
+    # ACCOUNTS.create('mario', 'segreta', is_admin=True)
+    # print(ACCOUNTS.get('mario'))
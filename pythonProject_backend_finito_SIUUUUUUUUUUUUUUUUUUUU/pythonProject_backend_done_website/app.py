@@ -1,20 +1,28 @@
 import tornado.ioloop
 import tornado.web
 import tornado.websocket
+import asyncio
+import functools
 import os
 import json
 import secrets
 import base64
-import re
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives.asymmetric import ec
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from MachineLearningAlgorithm.knowledge_query import interactive_search
-from RegexAlgorithm.ricerca_prompt_fix import analizza_query
-from live_log import register, unregister, emit
-from sqlalchemy.exc import IntegrityError
-from account_database import session, User
+from MachineLearningAlgorithm.knowledge_query import interactive_search, index_stats, SEARCH_CACHE
+from RegexAlgorithm.ricerca_prompt_fix import analizza_query, QUERY_CACHE
+from live_log import register, unregister, subscribe, emit, has_channel, set_channel, reset_channel
+from account_database import ACCOUNTS
+from session_keys import SessionKeyCache
+from query_executor import QueryExecutor, QueueFull
+from uploads import AtomicUpload, EncryptedUploads, UploadError, save_bytes
+from document_catalog import CATALOG
+from document_index import INDEXER
+from file_listing import FILE_LISTING, PAGE_SIZE
+from message_envelope import COMPRESS_MIN_BYTES, loads, negotiate, seal, stats as message_stats
 
 SERVER_PRIV = ec.generate_private_key(ec.SECP256R1())
 SERVER_PUB_BYTES = SERVER_PRIV.public_key().public_bytes(
@@ -23,34 +31,51 @@ SERVER_PUB_BYTES = SERVER_PRIV.public_key().public_bytes(
 )
 SERVER_PUB_B64 = base64.b64encode(SERVER_PUB_BYTES).decode()
 
+# Chiavi AES già derivate per client (ECDH + HKDF una volta per sessione)
+SESSION_KEYS = SessionKeyCache(
+    SERVER_PRIV,
+    max_entries=int(os.environ.get("SESSION_KEYS_MAX", 1024)),
+    ttl=float(os.environ.get("SESSION_KEYS_TTL", 900)),
+)
+
+# Analisi delle query fuori dall'IOLoop ("thread" oppure "process")
+QUERY_EXECUTOR = QueryExecutor(
+    kind=os.environ.get("QUERY_EXECUTOR", "thread"),
+    max_workers=int(os.environ.get("QUERY_WORKERS", 2)),
+    max_queue=int(os.environ.get("QUERY_QUEUE", 8)),
+    timeout=float(os.environ.get("QUERY_TIMEOUT", 30)),
+)
+
+# Upload cifrati a chunk in corso (vedi uploads.py per il protocollo)
+ENCRYPTED_UPLOADS = EncryptedUploads()
+
+# Lavoro su disco delle action (upload, elenco file, chunk): pool separato da
+# quello degli account, così un upload grosso non ritarda i login degli altri
+FILE_IO = ThreadPoolExecutor(int(os.environ.get("FILE_IO_WORKERS", 4)), thread_name_prefix="file-io")
+
+async def run_io(fn, *args):
+    return await tornado.ioloop.IOLoop.current().run_in_executor(FILE_IO, fn, *args)
+
 # ----------------------------------
 #   FUNZIONE PER Tx DATI DAL SERVER
 # ----------------------------------
 
-def encrypt_for_client(client_pub_b64: str, payload: dict) -> dict:
+def encrypt_for_client(client_pub_b64: str, payload: dict, compression: str | None = None) -> dict:
     """
     Data la public key del client in Base64 e un payload dict,
-    ritorna {"iv": base64, "ciphertext": base64}.
+    ritorna {"iv": base64, "ciphertext": base64} (più "encoding" se compresso).
     """
-    # 1) Decodifica public key client
-    cpub = base64.b64decode(client_pub_b64)
-    client_pub = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), cpub)
-
-    # 2) Deriva shared secret e chiave AES
-    shared = SERVER_PRIV.exchange(ec.ECDH(), client_pub)
-    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"handshake data").derive(shared)
+    # 1) Chiave AES della sessione (dalla cache, derivata solo al primo uso)
+    key = SESSION_KEYS.get(client_pub_b64)
 
-    # 3) Cifra con AES-GCM
-    aesgcm = AESGCM(key)
-    iv = os.urandom(12)
-    pt = json.dumps(payload).encode()
-    ct = aesgcm.encrypt(iv, pt, None)
+    # 2) JSON, compressione se negoziata e sopra soglia, poi AES-GCM
+    return seal(key, payload, compression)
 
-    # 4) Restituisci Base64 di iv e ciphertext
-    return {
-        "iv": base64.b64encode(iv).decode(),
-        "ciphertext": base64.b64encode(ct).decode()
-    }
+def on_uploaded(path: str) -> None:
+    """File salvato: entra subito nel catalogo e nell'elenco, testo e autore/titolo in background."""
+    CATALOG.record_upload(path)
+    FILE_LISTING.record(path)
+    INDEXER.submit(path)
 
 # ----------------------------------
 #   HANDLER PER Rx DATI DA CLIENT
@@ -58,106 +83,174 @@ def encrypt_for_client(client_pub_b64: str, payload: dict) -> dict:
 
 class HandshakeHandler(tornado.web.RequestHandler):
     def get(self):
-        self.write({"server_public": SERVER_PUB_B64})
+        # ?compression=deflate: il client sa decomprimere; il server risponde
+        # con quella che userà (o null) e la soglia sotto cui non comprime
+        self.write({
+            "server_public": SERVER_PUB_B64,
+            "compression": negotiate(self.get_query_argument("compression", None)),
+            "compress_min_bytes": COMPRESS_MIN_BYTES,
+        })
 
-class MessageHandler(tornado.web.RequestHandler):
-    def post(self):
-        print("Request dal client: ", self.request.body)
+class StatsHandler(tornado.web.RequestHandler):
+    """Contatori interni (cache, code, ...) per il monitoraggio"""
 
-        data = json.loads(self.request.body)
-        cpub = base64.b64decode(data["client_public"])
-        iv   = base64.b64decode(data["iv"])
-        ct   = base64.b64decode(data["ciphertext"])
+    def get(self):
+        self.write({
+            "session_keys": SESSION_KEYS.stats(),
+            "query_executor": QUERY_EXECUTOR.stats(),
+            "query_cache": QUERY_CACHE.stats(),
+            "search_cache": SEARCH_CACHE.stats(),
+            "knowledge_index": index_stats(),
+            "uploads": ENCRYPTED_UPLOADS.stats(),
+            "document_index": INDEXER.stats(),
+            "accounts": ACCOUNTS.stats(),
+            "file_listing": FILE_LISTING.stats(),
+            "messages": message_stats(),
+        })
 
-        # Import chiave pubblica client e derivazione shared secret
-        client_pub = ec.EllipticCurvePublicKey.from_encoded_point(
-            ec.SECP256R1(), cpub
+# ----------------------------------
+#   ACTION DI /message
+# ----------------------------------
+
+# action -> coroutine (obj, key) che ritorna il payload della risposta;
+# un'action sconosciuta o con dati mancanti risponde {"status": "failed"}
+ACTIONS = {}
+
+def action(name: str):
+    def register_action(fn):
+        ACTIONS[name] = fn
+        return fn
+    return register_action
+
+@action("retrieval")
+async def retrieval(obj, key):
+    # pagina dell'elenco in cache: {"files": [{name, size, mtime}], "total", "offset", "limit"}
+    username = obj.get("username")
+    if not username:
+        return {"status": "ok", "files": [], "total": 0}
+    try:
+        page = await run_io(
+            FILE_LISTING.list, username,
+            obj.get("offset") or 0, obj.get("limit") or PAGE_SIZE, obj.get("sort") or "mtime",
+        )
+    except (ValueError, TypeError) as e:
+        return {"status": "failed", "message": str(e)}
+    return {"status": "ok", **page}
+
+def save_files(username: str, files: list[dict]) -> bool:
+    for file_info in files:
+        filename = file_info.get("filename", "")
+        b64data = file_info.get("data", "")
+        if not filename or not b64data:
+            return False
+        try:
+            on_uploaded(save_bytes(username, filename, base64.b64decode(b64data)))
+        except Exception:
+            return False
+    return True
+
+@action("upload")
+async def upload(obj, key):
+    username = obj.get("username")
+    files = obj.get("files", [])
+    if not username or not files:
+        return {"status": "failed", "message": "Dati mancanti"}
+    if await run_io(save_files, username, files):
+        return {"status": "ok"}
+    return {"status": "failed", "message": "Errore su uno o più file"}
+
+# upload cifrato a chunk: apertura e chiusura passano da qui,
+# i chunk binari da ChunkUploadHandler
+@action("upload_start")
+async def upload_start(obj, key):
+    try:
+        upload_id = await run_io(
+            ENCRYPTED_UPLOADS.start, key, obj.get("username"), obj.get("filename"), obj.get("size")
         )
-        shared = SERVER_PRIV.exchange(ec.ECDH(), client_pub)
+    except UploadError as e:
+        return {"status": "failed", "message": str(e)}
+    return {"status": "ok", "upload_id": upload_id, "chunk_size": ENCRYPTED_UPLOADS.chunk_size}
 
-        # Stesso HKDF usato in JS (salt vuoto, info “handshake data”)
-        key = HKDF(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=None,
-            info=b"handshake data"
-        ).derive(shared)
+def finish_upload(upload_id: str, chunks: int, size: int) -> None:
+    on_uploaded(ENCRYPTED_UPLOADS.finish(upload_id, chunks, size))
 
-        # Decrittazione AES-GCM
-        aesgcm = AESGCM(key)
-        plaintext = aesgcm.decrypt(iv, ct, None)
+@action("upload_finish")
+async def upload_finish(obj, key):
+    try:
+        await run_io(finish_upload, str(obj.get("upload_id")), int(obj.get("chunks", -1)), int(obj.get("size", -1)))
+    except (UploadError, ValueError, TypeError) as e:
+        return {"status": "failed", "message": str(e)}
+    return {"status": "ok"}
+
+@action("register")
+async def register_user(obj, key):
+    username = obj.get("username")
+    password = obj.get("password")
+    if username and password and await ACCOUNTS.create_async(username, password) is not None:
+        return {"status": "ok", "username": username, "password": password}
+    return {"status": "failed"}
+
+@action("access")
+async def access(obj, key):
+    username = obj.get("username")
+    password = obj.get("password")
+    if username and password and await ACCOUNTS.authenticate_async(username, password) is not None:
+        return {"status": "ok", "username": username, "password": password}
+    return {"status": "failed"}
+
+# corpi più grandi di così (upload base64) si decifrano fuori dall'IOLoop
+INLINE_MESSAGE_BYTES = int(os.environ.get("INLINE_MESSAGE_BYTES", 64 * 1024))
+
+def open_message(body: bytes) -> tuple[dict, bytes, bytes]:
+    """Busta di /message -> (busta, chiave di sessione, plaintext)."""
+    data = loads(body)
+    iv   = base64.b64decode(data["iv"])
+    ct   = base64.b64decode(data["ciphertext"])
+
+    # Chiave AES condivisa: ECDH + HKDF (salt vuoto, info “handshake data”)
+    # calcolati una sola volta per public key client, poi presi dalla cache
+    key = SESSION_KEYS.get(data["client_public"])
+
+    # Decrittazione AES-GCM
+    aesgcm = AESGCM(key)
+    return data, key, aesgcm.decrypt(iv, ct, None)
 
-        print("plaintext ricavato: ", plaintext.decode())
+class MessageHandler(tornado.web.RequestHandler):
+    async def post(self):
+        body = self.request.body
+        print("Request dal client: ", len(body), "byte")
+
+        try:
+            if len(body) > INLINE_MESSAGE_BYTES:
+                data, key, plaintext = await run_io(open_message, body)
+            else:
+                data, key, plaintext = open_message(body)
+        except InvalidTag:
+            # chiave di sessione non più valida (es. server riavviato): l'action non
+            # è stata eseguita, il client può rifare l'handshake e rimandarla
+            self.set_status(401)
+            return self.write({"status": "error", "reason": "session", "message": "Sessione scaduta"})
+        except (KeyError, ValueError):  # busta malformata (campi mancanti, base64 o chiave non validi)
+            self.set_status(400)
+            return self.write({"status": "error", "message": "Messaggio non valido"})
 
         # Parsing JSON
         try:
-            obj = json.loads(plaintext.decode())
-        except json.JSONDecodeError:
+            obj = loads(plaintext) if len(plaintext) <= INLINE_MESSAGE_BYTES \
+                else await run_io(loads, plaintext)
+        except ValueError:          # JSON non valido (json e orjson) o UTF-8 non valido
             self.set_status(400)
             return self.write({"status": "error", "message": "JSON non valido"})
 
-        print("Ricevuto JSON:", obj)
-
-        action = obj.get("action")
-        resp_payload = {"status": "failed"}
-
-        if action == "retrieval":
-            username = obj.get("username")
-            files_list = []
-            if username:
-                user_dir = os.path.join('uploaded', username)
-                if os.path.isdir(user_dir):
-                    files_list = os.listdir(user_dir)
-            resp_payload = {"status": "ok", "files": files_list}
-
-        if action == "upload":
-            username = obj.get("username")
-            files = obj.get("files", [])
-            if not username or not files:
-                resp_payload = {"status": "failed", "message": "Dati mancanti"}
-            else:
-                upload_dir = os.path.join('uploaded', username)
-                os.makedirs(upload_dir, exist_ok=True)
-                errore = False
-                for file_info in files:
-                    filename = file_info.get("filename", "")
-                    b64data = file_info.get("data", "")
-                    if not filename or not b64data or not re.search(r'\.(pdf|txt)$', filename, re.IGNORECASE):
-                        errore = True
-                        break
-                    path = os.path.join(upload_dir, filename)
-                    try:
-                        body = base64.b64decode(b64data)
-                        with open(path, 'wb') as f:
-                            f.write(body)
-                    except Exception:
-                        errore = True
-                        break
-                resp_payload = {"status": "ok"} if not errore else {"status": "failed", "message": "Errore su uno o più file"}
-
-        if action == "register":
-            username = obj.get("username")
-            password = obj.get("password")
-            if username and password:
-                user = User(username=username, password=password, is_admin=False)
-                session.add(user)
-                try:
-                    session.commit()
-                    resp_payload = {"status": "ok", "username": username, "password": password}
-                except IntegrityError:
-                    session.rollback()
-
-        elif action == "access":
-            username = obj.get("username")
-            password = obj.get("password")
-            if username and password:
-                user = session.query(User).filter_by(username=username).first()
-                if user and user.password == password:
-                    resp_payload = {"status": "ok", "username": username, "password": password}
-
-        # per qualsiasi altro action o mancanza dati, resp_payload rimane {"status": "failed"}
-
-        resp = encrypt_for_client(data["client_public"], resp_payload)
+        action_name = obj.get("action")
+        print("Action ricevuta:", action_name)
+
+        # una sola action per richiesta, cercata nella tabella
+        handler = ACTIONS.get(action_name)
+        resp_payload = await handler(obj, key) if handler else {"status": "failed"}
+
+        # "compression": quella concordata in /handshake, ripetuta dal client a ogni messaggio
+        resp = encrypt_for_client(data["client_public"], resp_payload, negotiate(data.get("compression")))
         self.write(resp)
 
 # ----------------------------------
@@ -183,63 +276,119 @@ class LoginHandler(tornado.web.RequestHandler):
 class QueryHandler(tornado.web.RequestHandler):
     """Gestisce richieste POST dal front-end"""
 
-    def post(self):
+    async def post(self):
         data   = json.loads(self.request.body)
         query  = data.get("query", "")
         toggle = data.get("toggle", False)
-        print(f"Richiesta ricevuta: '{query}', toggle attivo: {toggle}")
+        username = data.get("username")
+        # canale del websocket del client: i messaggi vanno solo a lui. Senza un
+        # canale con iscritti la risposta ("end" compreso) non arriverebbe a nessuno
+        channel = data.get("channel")
+        if not isinstance(channel, str) or not has_channel(channel):
+            self.set_status(400)
+            return self.write({"status": "error", "message": "Canale del log mancante o sconosciuto"})
+        print(f"Richiesta ricevuta: '{query}', toggle attivo: {toggle}, canale: {channel}")
 
+        token = set_channel(channel)
         emit("", "start")     # inizio
 
-        if toggle:
-            interactive_search(query)
-        else:
-            analizza_query(query)
-
-        emit("", "end")       # fine
+        # l'analisi gira in un worker: l'IOLoop resta libero per gli altri client
+        try:
+            if toggle:
+                await QUERY_EXECUTOR.run(interactive_search, query)
+            else:
+                await QUERY_EXECUTOR.run(functools.partial(analizza_query, username=username), query)
+        except QueueFull:
+            self.set_status(503)
+            self.set_header("Retry-After", "1")
+            emit("Server occupato, riprova tra poco.", "warning")
+        except asyncio.TimeoutError:
+            self.set_status(504)
+            emit("Tempo massimo di analisi superato.", "warning")
+        finally:
+            # anche se il worker solleva un'altra eccezione il client riceve "end"
+            emit("", "end")   # fine
+            reset_channel(token)
+
+        self.write({"channel": channel})
 
 class LogSocket(tornado.websocket.WebSocketHandler):
     """Websocket per mandare al client gli aggiornamenti live"""
 
     def open(self):
-        register(self)
+        channel = register(self)
+        self.write_message(json.dumps({"flag": "channel", "payload": channel}))
 
     def on_close(self):
         unregister(self)
 
-    # se non ti serve ricevere messaggi dal client:
+    # il client può chiedere di seguire un altro canale: {"subscribe": "<id>"}
     def on_message(self, msg):
-        pass
+        try:
+            channel = json.loads(msg).get("subscribe")
+        except (ValueError, AttributeError):
+            return
+        if channel:
+            subscribe(self, str(channel))
 
+@tornado.web.stream_request_body
 class UploadHandler(tornado.web.RequestHandler):
-    def post(self):
-        # prendo username dal form
-        user = self.get_body_argument('username', None)
-        if not user:
-            self.set_status(400)
-            return self.write({'status': 'failed', 'message': 'Utente non autenticato'})
-
-        files = self.request.files.get('file')
-        if not files:
-            self.set_status(400)
-            return self.write({'status': 'failed', 'message': 'Nessun file inviato'})
-
-        fileinfo = files[0]
-        filename = fileinfo['filename']
-        # controllo estensione
-        if not re.search(r'\.(pdf|txt)$', filename, re.IGNORECASE):
-            self.set_status(400)
-            return self.write({'status': 'failed', 'message': 'Formato non supportato'})
-
-        # creo cartella utente
-        upload_dir = os.path.join('uploaded', user)
-        os.makedirs(upload_dir, exist_ok=True)
-        path = os.path.join(upload_dir, filename)
-
-        # salvo il file
-        with open(path, 'wb') as f:
-            f.write(fileinfo['body'])
+    """
+    Upload in streaming: POST /upload?username=<utente>&filename=<nome> con il file
+    come corpo grezzo. I blocchi vengono scritti man mano in un file temporaneo,
+    rinominato sul nome finale a fine richiesta: la memoria usata non dipende
+    dalla dimensione del file.
+    """
 
+    def prepare(self):
+        self.upload = None
+        try:
+            self.upload = AtomicUpload(
+                self.get_query_argument('username', None),
+                self.get_query_argument('filename', None) or self.request.headers.get('X-Filename'),
+            )
+        except UploadError as e:
+            self.set_status(e.status)
+            return self.finish({'status': 'failed', 'message': str(e)})
+        self.request.connection.set_max_body_size(self.upload.max_bytes)
+
+    async def data_received(self, chunk):
+        # coroutine: Tornado aspetta la scrittura prima di leggere il blocco successivo
+        if self.upload is None:
+            return
+        try:
+            await run_io(self.upload.write, chunk)
+        except UploadError as e:
+            self.upload = None
+            self.set_status(e.status)
+            self.finish({'status': 'failed', 'message': str(e)})
+
+    async def post(self):
+        if self.upload is None:
+            return
+        try:
+            path = await run_io(self.upload.commit)
+        except UploadError as e:        # annullato nel frattempo (client disconnesso)
+            self.set_status(e.status)
+            return self.write({'status': 'failed', 'message': str(e)})
+        await run_io(on_uploaded, path)
+        self.write({'status': 'ok', 'size': self.upload.size})
+
+    def on_connection_close(self):
+        # client disconnesso a metà: niente file parziali. L'abort passa dallo
+        # stesso pool di write/commit (e dal lock di AtomicUpload), non dall'IOLoop
+        if self.upload is not None:
+            FILE_IO.submit(self.upload.abort)
+
+class ChunkUploadHandler(tornado.web.RequestHandler):
+    """Un chunk di un upload cifrato: corpo = iv (12 byte) || ciphertext AES-GCM."""
+
+    async def post(self, upload_id, seq):
+        try:
+            await run_io(ENCRYPTED_UPLOADS.chunk, upload_id, int(seq), self.request.body)
+        except UploadError as e:
+            self.set_status(e.status)
+            return self.write({'status': 'failed', 'message': str(e)})
         self.write({'status': 'ok'})
 
 # ----------------------------------
@@ -264,6 +413,8 @@ def make_app():
         (r"/message",   MessageHandler),
         (r"/database", DatabaseHandler),
         (r"/upload", UploadHandler),
+        (r"/upload/chunk/([\w-]+)/(\d+)", ChunkUploadHandler),
+        (r"/stats", StatsHandler),
     ]
 
     return tornado.web.Application(routes, **settings)
@@ -276,6 +427,9 @@ if __name__ == "__main__":
     try:
         app = make_app()
         app.listen(8888)
+        INDEXER.sync_all()   # file caricati mentre il server era spento
+        if not FILE_LISTING.start_watcher():
+            print("watchdog non installato: elenco file validato sulla mtime delle cartelle")
         print("Server avviato su http://localhost:8888")
         tornado.ioloop.IOLoop.current().start()
     except KeyboardInterrupt:
@@ -0,0 +1,99 @@
+"""
+Benchmark: byte in rete e CPU per risposta di /message.
+
+Per alcune risposte tipiche (login, pagine di "retrieval", risultati di
+ricerca) confronta il serializzatore JSON (json della libreria standard o
+orjson, se installato) e la compressione deflate prima della cifratura a
+vari livelli: dimensione del JSON, del corpo HTTP (Base64 compreso) e
+microsecondi per risposta (serializzazione + compressione + AES-GCM).
+
+Uso (dalla cartella del progetto):
+    python benchmark_envelope.py [--levels 1 6 9] [--number 200] [--min-bytes 1024]
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+import message_envelope
+from message_envelope import seal
+
+WORDS = ("contratto fornitura relazione tecnica verbale riunione bilancio preventivo "
+         "consuntivo progetto allegato firmato revisione cliente ordine fattura").split()
+
+
+def _files(n: int) -> dict:
+    rng = random.Random(n)
+    now = time.time()
+    files = [{
+        "name": f"{'_'.join(rng.sample(WORDS, 3))}_{i:04d}.{rng.choice(('pdf', 'docx', 'txt'))}",
+        "size": rng.randint(2_000, 8_000_000),
+        "mtime": now - rng.uniform(0, 3e7),
+    } for i in range(n)]
+    return {"status": "ok", "files": files, "total": n * 4, "offset": 0, "limit": n}
+
+
+def _search(n: int) -> dict:
+    rng = random.Random(n)
+    return {"status": "ok", "results": [{
+        "file": f"{rng.choice(WORDS)}_{i}.pdf",
+        "autore": rng.choice(("Mario Rossi", "Giulia Bianchi", "Luca Verdi")),
+        "titolo": " ".join(rng.sample(WORDS, 4)).capitalize(),
+        "data": f"20{rng.randint(10, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "estratto": " ".join(rng.choices(WORDS, k=40)),
+    } for i in range(n)]}
+
+
+PAYLOADS = {
+    "access": {"status": "ok", "username": "mario", "password": "segreta"},
+    "retrieval 50": _files(50),
+    "retrieval 500": _files(500),
+    "ricerca 100": _search(100),
+}
+
+
+def _timed(fn, number: int) -> float:
+    """Microsecondi per chiamata (migliore di 3 ripetizioni)."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 6, 9])
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--min-bytes", type=int, default=message_envelope.COMPRESS_MIN_BYTES)
+    args = parser.parse_args(argv)
+
+    key = os.urandom(32)
+    serializers = {"json": None}
+    if message_envelope.orjson is not None:
+        serializers["orjson"] = message_envelope.orjson
+    else:
+        print("orjson non installato: solo json della libreria standard\n")
+
+    print(f"{'risposta':<14} {'serializer':<8} {'compressione':<12} "
+          f"{'JSON B':>9} {'in rete B':>10} {'µs/risposta':>12}")
+    for name, payload in PAYLOADS.items():
+        for ser_name, module in serializers.items():
+            message_envelope.orjson = module        # dumps() usa il serializzatore scelto
+            raw = len(message_envelope.dumps(payload))
+            variants = [("nessuna", None, 6)] + [(f"deflate {lv}", "deflate", lv) for lv in args.levels]
+            for label, compression, level in variants:
+                def one():
+                    return seal(key, payload, compression, min_bytes=args.min_bytes, level=level)
+                wire = len(json.dumps(one()))
+                print(f"{name:<14} {ser_name:<8} {label:<12} {raw:>9} {wire:>10} "
+                      f"{_timed(one, args.number):>12.1f}")
+        print()
+    message_envelope.orjson = serializers.get("orjson")
+
+
+if __name__ == "__main__":
+    main()
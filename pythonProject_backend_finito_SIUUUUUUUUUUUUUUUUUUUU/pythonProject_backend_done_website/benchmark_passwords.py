@@ -0,0 +1,87 @@
+"""
+Benchmark: costo della KDF delle password per scegliere i parametri.
+
+Per ogni combinazione di parametri misura la latenza di una verifica da sola
+e con --concurrency login contemporanei sul pool dell'hasher (come farebbe
+l'IOLoop con tanti client). Indica la combinazione più costosa (quindi più
+robusta) il cui p95 sotto carico resta entro lo SLO di --slo-ms.
+
+Uso (dalla cartella del progetto):
+    python benchmark_passwords.py [--kdf scrypt] [--slo-ms 250] [--concurrency 8]
+                                  [--workers 2] [--executor thread] [--rounds 5]
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from passwords import PasswordHasher
+
+GRID = {
+    "scrypt": [(2 ** e, 8, 1) for e in range(12, 18)],
+    "pbkdf2_sha256": [(it,) for it in (100_000, 200_000, 400_000, 600_000, 900_000, 1_200_000)],
+}
+ENV = {
+    "scrypt": lambda p: f"PASSWORD_KDF=scrypt SCRYPT_N={p[0]} SCRYPT_R={p[1]} SCRYPT_P={p[2]}",
+    "pbkdf2_sha256": lambda p: f"PASSWORD_KDF=pbkdf2_sha256 PBKDF2_ITERATIONS={p[0]}",
+}
+
+
+async def under_load(hasher: PasswordHasher, stored: str, concurrency: int, rounds: int) -> list[float]:
+    """Latenze di concurrency verifiche lanciate insieme, ripetute rounds volte."""
+    async def one() -> float:
+        start = time.perf_counter()
+        await hasher.verify_async(stored, "password di prova")
+        return time.perf_counter() - start
+
+    latencies = []
+    for _ in range(rounds):
+        latencies += await asyncio.gather(*(one() for _ in range(concurrency)))
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kdf", choices=sorted(GRID), default="scrypt")
+    parser.add_argument("--slo-ms", type=float, default=250.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"KDF {args.kdf}, {args.executor} pool da {args.workers}, "
+          f"{args.concurrency} login contemporanei, SLO p95 {args.slo_ms:.0f} ms\n")
+    print(f"{'parametri':<22} {'singola ms':>11} {'carico p50':>11} {'carico p95':>11} {'SLO':>5}")
+
+    best = None
+    for params in GRID[args.kdf]:
+        hasher = PasswordHasher(args.kdf, params, executor=args.executor, max_workers=args.workers)
+        stored = hasher.hash("password di prova")
+
+        single = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            hasher.verify(stored, "password di prova")
+            single.append(time.perf_counter() - start)
+
+        loaded = np.array(asyncio.run(under_load(hasher, stored, args.concurrency, args.rounds))) * 1e3
+        p95 = np.percentile(loaded, 95)
+        ok = p95 <= args.slo_ms
+        if ok:
+            best = params
+        print(f"{str(params):<22} {np.median(single) * 1e3:>11.1f} {np.median(loaded):>11.1f} "
+              f"{p95:>11.1f} {'ok' if ok else '--':>5}")
+        if hasher._pool is not None:
+            hasher._pool.shutdown()
+
+    if best is None:
+        print("\nNessuna combinazione rispetta lo SLO: aumentare PASSWORD_WORKERS o ridurre il costo.")
+    else:
+        print(f"\nConsigliato: {ENV[args.kdf](best)} PASSWORD_WORKERS={args.workers} "
+              f"PASSWORD_EXECUTOR={args.executor}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# document_catalog.py
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+
+from uploads import UPLOAD_ROOT, ALLOWED_RE
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None    # senza pypdf autore/titolo dei PDF restano vuoti
+
+CATALOG_PATH = os.path.join(UPLOAD_ROOT, ".catalog.db")
+SORT_COLUMNS = {"upload_ts", "filename", "size", "author", "title"}
+
+# "Autore: Mario Rossi" / "Author - ..." nelle prime righe di un .txt
+_AUTHOR_LINE_RE = re.compile(r"^\s*(?:autore|autrice|author|di)\s*[:\-–]\s*(.+)$", re.IGNORECASE)
+_HEADER_LINES = 20
+
+
+def extract_metadata(path: str) -> dict:
+    """
+    Autore e titolo di un documento: metadati del PDF, oppure per i .txt
+    la prima riga non vuota come titolo e una riga "Autore: ..." in testa.
+    """
+    author = title = None
+    if path.lower().endswith(".pdf"):
+        if PdfReader is not None:
+            try:
+                info = PdfReader(path).metadata
+            except Exception:
+                info = None
+            if info:
+                author, title = info.author, info.title
+    else:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            for i, line in enumerate(f):
+                if i >= _HEADER_LINES:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                m = _AUTHOR_LINE_RE.match(line)
+                if m and author is None:
+                    author = m.group(1).strip()
+                elif title is None:
+                    title = line[:200]
+    return {
+        "author": (author or "").strip() or None,
+        "title": (title or "").strip() or None,
+    }
+
+
+class DocumentCatalog:
+    """
+    Catalogo SQLite dei documenti caricati (proprietario, nome, dimensione,
+    data di upload, autore, titolo). Gli indici su (owner, upload_ts) e
+    (owner, author) permettono di ordinare/limitare e filtrare per data o autore
+    con una query indicizzata invece di scorrere le cartelle.
+    """
+
+    def __init__(self, path: str = CATALOG_PATH):
+        self.path = path
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS Document (
+                    owner     TEXT NOT NULL,
+                    filename  TEXT NOT NULL,
+                    size      INTEGER NOT NULL,
+                    upload_ts REAL NOT NULL,
+                    author    TEXT COLLATE NOCASE,
+                    title     TEXT,
+                    PRIMARY KEY (owner, filename)
+                );
+                CREATE INDEX IF NOT EXISTS Document_owner_upload ON Document (owner, upload_ts);
+                -- upload_ts in coda: il filtro per autore esce già ordinato per data
+                CREATE INDEX IF NOT EXISTS Document_owner_author ON Document (owner, author, upload_ts);
+                """
+            )
+            self._ready = True
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    # —— scrittura ——
+    def record_upload(self, path: str, upload_ts: float | None = None) -> None:
+        """Registra (o aggiorna) un file appena caricato; autore e titolo arrivano dopo."""
+        owner, filename = os.path.basename(os.path.dirname(path)), os.path.basename(path)
+        size = os.path.getsize(path)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                INSERT INTO Document (owner, filename, size, upload_ts) VALUES (?, ?, ?, ?)
+                ON CONFLICT (owner, filename) DO UPDATE SET size = excluded.size, upload_ts = excluded.upload_ts
+                """,
+                (owner, filename, size, upload_ts if upload_ts is not None else time.time()),
+            )
+
+    def set_metadata(self, path: str, author: str | None, title: str | None) -> None:
+        owner, filename = os.path.basename(os.path.dirname(path)), os.path.basename(path)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE Document SET author = ?, title = ? WHERE owner = ? AND filename = ?",
+                (author, title, owner, filename),
+            )
+
+    def remove(self, owner: str, filename: str) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM Document WHERE owner = ? AND filename = ?", (owner, filename))
+
+    def sync_user(self, owner: str) -> int:
+        """
+        Allinea il catalogo alla cartella dell'utente (file caricati a server spento
+        o cancellati a mano): i nuovi entrano con la mtime come data di upload.
+        Ritorna il numero di file aggiunti.
+        """
+        directory = os.path.join(UPLOAD_ROOT, owner)
+        on_disk = {
+            name for name in os.listdir(directory)
+            if ALLOWED_RE.search(name) and not name.startswith(".")
+        } if os.path.isdir(directory) else set()
+        with closing(self._connect()) as conn:
+            known = {r["filename"] for r in conn.execute("SELECT filename FROM Document WHERE owner = ?", (owner,))}
+        for filename in known - on_disk:
+            self.remove(owner, filename)
+        for filename in sorted(on_disk - known):
+            path = os.path.join(directory, filename)
+            self.record_upload(path, os.path.getmtime(path))
+            self.set_metadata(path, **extract_metadata(path))
+        return len(on_disk - known)
+
+    # —— lettura ——
+    def query(
+        self,
+        owner: str,
+        author: str | None = None,
+        date_from: float | None = None,
+        date_to: float | None = None,
+        sort: str = "upload_ts",
+        descending: bool = True,
+        limit: int | None = None,
+        filenames: list[str] | None = None,
+    ) -> list[dict]:
+        """
+        Documenti dell'utente filtrati per intervallo di upload [date_from, date_to)
+        e/o autore, ordinati e limitati in SQL. L'autore è cercato prima per
+        uguaglianza (indice owner, author), poi come sottostringa fra i documenti
+        dell'utente se l'uguaglianza non trova nulla.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Ordinamento non valido: {sort}")
+        where, params = ["owner = ?"], [owner]
+        if date_from is not None:
+            where.append("upload_ts >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            where.append("upload_ts < ?")
+            params.append(date_to)
+        if filenames is not None:
+            if not filenames:
+                return []
+            # tabella temporanea invece di un "?" per nome: nessun limite di variabili SQLite
+            where.append("filename IN (SELECT filename FROM temp.Wanted)")
+
+        def run(author_clause: str | None, author_param: str | None) -> list[dict]:
+            clauses, values = list(where), list(params)
+            if author_clause:
+                clauses.append(author_clause)
+                values.append(author_param)
+            sql = (
+                f"SELECT owner, filename, size, upload_ts, author, title FROM Document "
+                f"WHERE {' AND '.join(clauses)} ORDER BY {sort} {'DESC' if descending else 'ASC'}"
+            )
+            if limit is not None:
+                sql += " LIMIT ?"
+                values.append(int(limit))
+            with closing(self._connect()) as conn:
+                if filenames is not None:
+                    conn.execute("CREATE TEMP TABLE Wanted (filename TEXT PRIMARY KEY)")
+                    conn.executemany("INSERT OR IGNORE INTO temp.Wanted VALUES (?)", ((f,) for f in filenames))
+                return [dict(r) for r in conn.execute(sql, values)]
+
+        if not author:
+            return run(None, None)
+        # % e _ scritti dall'utente vanno cercati alla lettera
+        pattern = "%" + re.sub(r"([\\%_])", r"\\\1", author) + "%"
+        return run("author = ?", author) or run("author LIKE ? ESCAPE '\\'", pattern)
+
+
+CATALOG = DocumentCatalog()
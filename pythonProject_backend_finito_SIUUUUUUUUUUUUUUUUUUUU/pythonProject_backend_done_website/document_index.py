@@ -0,0 +1,350 @@
+# document_index.py
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from threading import Lock
+from urllib.parse import quote
+
+from document_catalog import CATALOG, extract_metadata
+from nlp_models import get_pipeline
+from uploads import UPLOAD_ROOT, ALLOWED_RE, UploadError, user_dir
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None    # senza pypdf ('pip install pypdf') i PDF non vengono indicizzati
+
+INDEX_DIR = os.path.join(UPLOAD_ROOT, ".index")   # un DB per utente: <utente>.db
+BLOCK_CHARS = 100_000                              # testo passato a spaCy per volta (max_length è 1M)
+MAX_RESULTS = 10
+
+nlp = get_pipeline("pos")  # servono solo lemmi e stop word
+
+
+class ExtractionError(Exception):
+    """Testo non estraibile dal file (formato non supportato o libreria mancante)."""
+
+
+# ————————————————————————————————————————————————————————————
+# Estrazione del testo e termini
+
+def extract_text(path: str):
+    """Genera il testo del file a blocchi: gruppi di righe per i .txt, pagine per i .pdf."""
+    if path.lower().endswith(".txt"):
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            block, size = [], 0
+            for line in f:
+                block.append(line)
+                size += len(line)
+                if size >= BLOCK_CHARS:
+                    yield "".join(block)
+                    block, size = [], 0
+            if block:
+                yield "".join(block)
+    elif path.lower().endswith(".pdf"):
+        if PdfReader is None:
+            raise ExtractionError("pypdf non installato: impossibile leggere i PDF")
+        for page in PdfReader(path).pages:
+            yield page.extract_text() or ""
+    else:
+        raise ExtractionError(f"Formato non supportato: {path}")
+
+
+def _term(token) -> str | None:
+    """Termine indicizzato per un token: lemma in minuscolo, senza stop word e punteggiatura."""
+    if token.is_stop or token.is_punct or token.is_space:
+        return None
+    term = (token.lemma_ or token.text).lower().strip()
+    return term if any(c.isalnum() for c in term) else None
+
+
+def query_terms(text: str) -> list[tuple[int, str]]:
+    """[(posizione, termine)] della frase cercata, con le posizioni relative dei token."""
+    return [(tok.i, term) for tok in nlp(text) if (term := _term(tok))]
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ————————————————————————————————————————————————————————————
+# Indice invertito su disco (SQLite, un file per utente)
+
+def index_path(username: str) -> str:
+    """Indice dell'utente; stesse regole di uploads.user_dir (UploadError se il nome non è valido)."""
+    return os.path.join(INDEX_DIR, f"{os.path.basename(user_dir(username))}.db")
+
+
+def connect(username: str, readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        # nel percorso dell'URI "?" e "#" vanno codificati
+        return sqlite3.connect(f"file:{quote(index_path(username))}?mode=ro", uri=True)
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    conn = sqlite3.connect(index_path(username))
+    conn.execute("PRAGMA journal_mode = WAL")     # le ricerche leggono mentre si indicizza
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS Document (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename   TEXT UNIQUE NOT NULL,
+            sha256     TEXT NOT NULL,
+            size       INTEGER NOT NULL,
+            mtime_ns   INTEGER NOT NULL,
+            n_tokens   INTEGER NOT NULL,
+            indexed_at REAL NOT NULL
+        );
+        -- term -> documenti: la chiave primaria raggruppa le posting di un termine
+        CREATE TABLE IF NOT EXISTS Posting (
+            term      TEXT NOT NULL,
+            doc_id    INTEGER NOT NULL,
+            tf        INTEGER NOT NULL,
+            positions TEXT NOT NULL,        -- JSON: posizioni dei token nel documento
+            PRIMARY KEY (term, doc_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS Posting_doc ON Posting (doc_id);
+        """
+    )
+    return conn
+
+
+def index_file(path: str) -> bool:
+    """
+    Indicizza (o reindicizza) un file caricato in uploaded/<utente>/.
+    Se dimensione e mtime, oppure l'hash, non sono cambiati non fa nulla.
+    Le posting del documento vengono sostituite in un'unica transazione.
+    Ritorna True se l'indice è stato modificato.
+    """
+    username = os.path.basename(os.path.dirname(path))
+    filename = os.path.basename(path)
+    st = os.stat(path)
+
+    with closing(connect(username)) as conn:
+        row = conn.execute(
+            "SELECT id, sha256, size, mtime_ns FROM Document WHERE filename = ?", (filename,)
+        ).fetchone()
+        if row and (row[2], row[3]) == (st.st_size, st.st_mtime_ns):
+            return False
+        digest = _file_digest(path)
+        if row and row[1] == digest:
+            with conn:
+                conn.execute("UPDATE Document SET size = ?, mtime_ns = ? WHERE id = ?",
+                             (st.st_size, st.st_mtime_ns, row[0]))
+            return False
+
+        # l'analisi avviene fuori dalla transazione: le ricerche non restano bloccate
+        postings: dict[str, list[int]] = defaultdict(list)
+        offset = 0
+        for doc in nlp.pipe(extract_text(path), batch_size=4):
+            for tok in doc:
+                term = _term(tok)
+                if term:
+                    postings[term].append(offset + tok.i)
+            offset += len(doc)
+
+        with conn:
+            values = (digest, st.st_size, st.st_mtime_ns, offset, time.time())
+            if row:
+                doc_id = row[0]
+                conn.execute("DELETE FROM Posting WHERE doc_id = ?", (doc_id,))
+                conn.execute(
+                    "UPDATE Document SET sha256 = ?, size = ?, mtime_ns = ?, n_tokens = ?, indexed_at = ? "
+                    "WHERE id = ?", (*values, doc_id),
+                )
+            else:
+                doc_id = conn.execute(
+                    "INSERT INTO Document (filename, sha256, size, mtime_ns, n_tokens, indexed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (filename, *values),
+                ).lastrowid
+            conn.executemany(
+                "INSERT INTO Posting (term, doc_id, tf, positions) VALUES (?, ?, ?, ?)",
+                ((term, doc_id, len(pos), json.dumps(pos)) for term, pos in postings.items()),
+            )
+    return True
+
+
+def ingest(path: str) -> bool:
+    """Job di un upload: autore/titolo nel catalogo, poi indice invertito."""
+    CATALOG.set_metadata(path, **extract_metadata(path))
+    return index_file(path)
+
+
+def remove_file(username: str, filename: str) -> None:
+    with closing(connect(username)) as conn, conn:
+        row = conn.execute("SELECT id FROM Document WHERE filename = ?", (filename,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM Posting WHERE doc_id = ?", (row[0],))
+            conn.execute("DELETE FROM Document WHERE id = ?", (row[0],))
+
+
+def sync_user(username: str) -> int:
+    """Allinea l'indice dell'utente alla sua cartella; ritorna i file (re)indicizzati."""
+    directory = os.path.join(UPLOAD_ROOT, username)
+    on_disk = {
+        name for name in os.listdir(directory)
+        if ALLOWED_RE.search(name) and not name.startswith(".")
+    } if os.path.isdir(directory) else set()
+    with closing(connect(username)) as conn:
+        indexed = {name for (name,) in conn.execute("SELECT filename FROM Document")}
+    # un errore su un file non ferma il riallineamento degli altri
+    for filename in indexed - on_disk:
+        try:
+            remove_file(username, filename)
+        except sqlite3.Error as e:
+            print(f"Indice documenti: rimozione di {filename} fallita ({e})")
+    changed = 0
+    for filename in sorted(on_disk):
+        try:
+            changed += index_file(os.path.join(directory, filename))
+        except ExtractionError as e:
+            print(f"Indice documenti: {filename} saltato ({e})")
+        except Exception as e:
+            print(f"Indice documenti: errore su {filename} ({e!r})")
+    return changed
+
+
+# ————————————————————————————————————————————————————————————
+# Ricerca
+
+def _phrase_hits(query: list[tuple[int, str]], positions: dict[str, set[int]]) -> int:
+    """Occorrenze della frase intera: tutti i termini alla stessa distanza che nella query."""
+    first_pos, first_term = query[0]
+    return sum(
+        1 for p in positions[first_term]
+        if all(p + (i - first_pos) in positions[t] for i, t in query[1:])
+    )
+
+
+def search(username: str, text: str, limit: int | None = MAX_RESULTS,
+           filenames: set[str] | None = None) -> list[dict]:
+    """
+    Cerca una parola chiave o una frase nei documenti dell'utente con un lookup
+    per termine sull'indice invertito. Ordine dei risultati: documenti che
+    contengono più termini distinti, poi più occorrenze della frase esatta, poi tf-idf.
+    Con filenames si considerano (e si contano nel limite) solo quei documenti.
+    """
+    try:
+        path = index_path(username)
+    except UploadError:
+        return []
+    if filenames is not None and not filenames:
+        return []
+    query = query_terms(text)
+    if not query or not os.path.exists(path):
+        return []
+    terms = {t for _, t in query}
+
+    with closing(connect(username, readonly=True)) as conn:
+        n_docs = conn.execute("SELECT COUNT(*) FROM Document").fetchone()[0]
+        allowed = None
+        if filenames is not None:
+            allowed = {doc_id for doc_id, name in conn.execute("SELECT id, filename FROM Document")
+                       if name in filenames}
+        docs: dict[int, dict] = defaultdict(lambda: {"tf": {}, "positions": {}})
+        for term in terms:
+            rows = conn.execute(
+                "SELECT doc_id, tf, positions FROM Posting WHERE term = ?", (term,)
+            ).fetchall()
+            idf = math.log(1 + n_docs / len(rows)) if rows else 0.0     # idf su tutti i documenti
+            for doc_id, tf, positions in rows:
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                docs[doc_id]["tf"][term] = (tf, idf)
+                docs[doc_id]["positions"][term] = positions
+        if not docs:
+            return []
+
+        results = []
+        for doc_id, entry in docs.items():
+            phrase = 0
+            if len(query) > 1 and len(entry["tf"]) == len(terms):
+                positions = {t: set(json.loads(p)) for t, p in entry["positions"].items()}
+                phrase = _phrase_hits(query, positions)
+            results.append({
+                "doc_id": doc_id,
+                "matched": len(entry["tf"]),
+                "phrase": phrase,
+                "score": sum(tf * idf for tf, idf in entry["tf"].values()),
+                "terms": {t: tf for t, (tf, _) in entry["tf"].items()},
+            })
+        results.sort(key=lambda r: (r["matched"], r["phrase"], r["score"]), reverse=True)
+        results = results[:limit]
+
+        names = dict(conn.execute(
+            f"SELECT id, filename FROM Document WHERE id IN ({','.join('?' * len(results))})",
+            [r["doc_id"] for r in results],
+        ))
+    for r in results:
+        r["filename"] = names.get(r.pop("doc_id"))
+    return results
+
+
+# ————————————————————————————————————————————————————————————
+# Indicizzazione in background
+
+class DocumentIndexer:
+    """
+    Coda di indicizzazione con un solo thread: gli upload vengono accodati
+    e indicizzati in ordine, senza bloccare l'IOLoop né le altre richieste.
+    """
+
+    def __init__(self):
+        # creato subito (i thread partono al primo submit): submit arriva in
+        # contemporanea da più thread FILE_IO e il worker deve restare uno solo
+        self._pool = ThreadPoolExecutor(1, thread_name_prefix="doc-index")
+        self._lock = Lock()
+        self.queued = 0
+        self.indexed = 0
+        self.failed = 0
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            self.queued += 1
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future) -> None:
+        error = future.exception()
+        with self._lock:
+            self.queued -= 1
+            if error is not None:
+                self.failed += 1
+            else:
+                self.indexed += int(future.result())
+        if error is not None:
+            print(f"Indice documenti: errore ({error})")
+
+    def submit(self, path: str):
+        """Accoda un file appena caricato."""
+        return self._submit(ingest, path)
+
+    def sync_all(self) -> None:
+        """Accoda il riallineamento di tutti gli utenti (file caricati a server spento)."""
+        if os.path.isdir(UPLOAD_ROOT):
+            for username in sorted(os.listdir(UPLOAD_ROOT)):
+                if not username.startswith(".") and os.path.isdir(os.path.join(UPLOAD_ROOT, username)):
+                    self._submit(CATALOG.sync_user, username)
+                    self._submit(sync_user, username)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self.queued,
+                "indexed": self.indexed,
+                "failed": self.failed,
+                "pdf_support": PdfReader is not None,
+            }
+
+
+INDEXER = DocumentIndexer()
@@ -0,0 +1,214 @@
+# file_listing.py
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from uploads import UPLOAD_ROOT, ALLOWED_RE, UploadError, user_dir
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None     # senza watchdog ('pip install watchdog') basta il controllo sulla mtime della cartella
+    FileSystemEventHandler = object
+
+PAGE_SIZE = int(os.environ.get("FILE_LIST_PAGE", 50))
+MAX_PAGE_SIZE = 500
+SORT_KEYS = {
+    "mtime": (lambda e: (e["mtime"], e["name"]), True),     # più recenti prima
+    "name": (lambda e: e["name"].lower(), False),
+    "size": (lambda e: (e["size"], e["name"]), True),
+}
+
+
+def scan_dir(directory: str) -> list[dict]:
+    """Documenti della cartella (niente file nascosti né temporanei di upload) con dimensione e mtime."""
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.startswith(".") or not ALLOWED_RE.search(entry.name):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue                                # rimosso durante la scansione
+            entries.append({"name": entry.name, "size": st.st_size, "mtime": st.st_mtime})
+    return entries
+
+
+class _Listing:
+    __slots__ = ("entries", "dir_mtime_ns", "loaded_at", "views")
+
+    def __init__(self, entries: list[dict], dir_mtime_ns: int):
+        self.entries = {e["name"]: e for e in entries}
+        self.dir_mtime_ns = dir_mtime_ns
+        self.loaded_at = time.monotonic()
+        self.views: dict[str, list[dict]] = {}         # ordinamento -> lista ordinata
+
+    def view(self, sort: str) -> list[dict]:
+        if sort not in self.views:
+            key, reverse = SORT_KEYS[sort]
+            self.views[sort] = sorted(self.entries.values(), key=key, reverse=reverse)
+        return self.views[sort]
+
+
+class DirectoryIndex:
+    """
+    Elenco in memoria dei documenti di ogni utente per l'action "retrieval".
+    Una voce resta valida finché:
+      • non arriva un upload (record / invalidate da on_uploaded);
+      • la mtime della cartella non cambia (file aggiunti, rinominati o rimossi
+        fuori dal server): una sola stat per richiesta invece di listdir + stat;
+      • il watcher (watchdog, se installato) non segnala modifiche diverse
+        da quelle già registrate (creazioni, cancellazioni, spostamenti, scritture);
+      • non passano ttl secondi (limite alla staleness se manca il watcher).
+    """
+
+    def __init__(self, max_users: int = 256, ttl: float = 60.0):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._listings: OrderedDict[str, _Listing] = OrderedDict()     # LRU: usati di recente in fondo
+        self._lock = Lock()
+        self._observer = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _load(self, owner: str, directory: str) -> _Listing | None:
+        try:
+            dir_mtime_ns = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            listing = self._listings.get(owner)
+            if (listing and listing.dir_mtime_ns == dir_mtime_ns
+                    and time.monotonic() - listing.loaded_at < self.ttl):
+                self._listings.move_to_end(owner)
+                self.hits += 1
+                return listing
+            self.misses += 1
+        listing = _Listing(scan_dir(directory), dir_mtime_ns)
+        with self._lock:
+            self._listings[owner] = listing
+            self._listings.move_to_end(owner)
+            while len(self._listings) > self.max_users:
+                self._listings.popitem(last=False)
+        return listing
+
+    def list(self, username: str, offset: int = 0, limit: int = PAGE_SIZE, sort: str = "mtime") -> dict:
+        """Pagina dell'elenco: {"files": [{name, size, mtime}], "total", "offset", "limit"}."""
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Ordinamento non valido: {sort}")
+        offset = max(0, int(offset))
+        limit = min(max(1, int(limit)), MAX_PAGE_SIZE)
+        try:
+            directory = user_dir(username)
+        except UploadError:
+            return {"files": [], "total": 0, "offset": offset, "limit": limit}
+        listing = self._load(os.path.basename(directory), directory)
+        entries = listing.view(sort) if listing else []
+        return {
+            "files": entries[offset:offset + limit],
+            "total": len(entries),
+            "offset": offset,
+            "limit": limit,
+        }
+
+    def record(self, path: str) -> None:
+        """File appena caricato: aggiorna la voce in cache senza riscandire la cartella."""
+        owner, name = os.path.basename(os.path.dirname(path)), os.path.basename(path)
+        try:
+            st = os.stat(path)
+            dir_mtime_ns = os.stat(os.path.dirname(path)).st_mtime_ns
+        except FileNotFoundError:
+            return self.invalidate(owner)
+        with self._lock:
+            listing = self._listings.get(owner)
+            if listing is None:
+                return
+            listing.entries[name] = {"name": name, "size": st.st_size, "mtime": st.st_mtime}
+            listing.dir_mtime_ns = dir_mtime_ns
+            listing.views.clear()
+
+    def changed(self, path: str) -> None:
+        """
+        Evento del watcher su un file: invalida l'elenco solo se non corrisponde
+        più al disco (un upload già registrato con record() non lo svuota).
+        """
+        owner, name = os.path.basename(os.path.dirname(path)), os.path.basename(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            st = None
+        with self._lock:
+            listing = self._listings.get(owner)
+            if listing is None:
+                return
+            entry = listing.entries.get(name)
+            if entry is None and st is None:
+                return
+            if entry is not None and st is not None and (entry["size"], entry["mtime"]) == (st.st_size, st.st_mtime):
+                return
+        self.invalidate(owner)
+
+    def invalidate(self, owner: str) -> None:
+        with self._lock:
+            if self._listings.pop(owner, None) is not None:
+                self.invalidations += 1
+
+    # —— watcher per le modifiche fuori dal server ——
+    def start_watcher(self, root: str = UPLOAD_ROOT) -> bool:
+        """Avvia il watcher su root (una sola volta); False se watchdog non è installato."""
+        if Observer is None or self._observer is not None:
+            return self._observer is not None
+        os.makedirs(root, exist_ok=True)
+        self._observer = Observer()
+        self._observer.schedule(_InvalidateOnChange(self, root), root, recursive=True)
+        self._observer.daemon = True
+        self._observer.start()
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "users": len(self._listings),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+                "watcher": self._observer is not None,
+            }
+
+
+class _InvalidateOnChange(FileSystemEventHandler):
+    """
+    Creazioni, cancellazioni, spostamenti e scritture sotto uploaded/<utente>/
+    invalidano l'elenco di quell'utente se non è già aggiornato. Le aperture e
+    chiusure senza scrittura (indicizzatore, catalogo) vengono ignorate.
+    """
+
+    EVENTS = {"created", "deleted", "moved", "modified"}
+
+    def __init__(self, index: DirectoryIndex, root: str):
+        self.index = index
+        self.root = os.path.abspath(root)
+
+    def on_any_event(self, event):
+        if event.event_type not in self.EVENTS or event.is_directory:
+            return
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            rel = os.path.relpath(os.path.abspath(path), self.root) if path else ""
+            parts = rel.split(os.sep)
+            # file nascosti (.upload-*.part, .index/, .catalog.db) e non documenti non cambiano l'elenco
+            if (len(parts) == 2 and not parts[0].startswith(".") and not parts[1].startswith(".")
+                    and ALLOWED_RE.search(parts[1])):
+                self.index.changed(os.path.join(self.root, *parts))
+
+
+FILE_LISTING = DirectoryIndex(
+    max_users=int(os.environ.get("FILE_LIST_USERS", 256)),
+    ttl=float(os.environ.get("FILE_LIST_TTL", 60)),
+)
@@ -1,27 +1,173 @@
 # live_log.py
 from tornado.ioloop import IOLoop
+import contextlib
+import contextvars
 import json
+import os
+import secrets
+import threading
 
-_clients: list = []          # websocket connessi
+_channels: dict[str, set] = {}   # canale -> websocket iscritti
+_subscriptions: dict = {}        # websocket -> canale
+_loop: IOLoop | None = None      # IOLoop principale (gli emit possono arrivare da altri thread)
+_sink = None                     # se impostato, emit passa di qui (es. nei processi worker)
 
-def register(ws):
-    """Chiamato quando un nuovo websocket si apre."""
-    _clients.append(ws)
+# Verbosità: 0 = solo messaggi di controllo, 1 = risultati, 2 = anche i "thinking"
+FLAG_LEVELS = {"start": 0, "end": 0, "channel": 0, "thinking": 2, "explain": 2}
+_verbosity = int(os.environ.get("LIVE_LOG_VERBOSITY", 2))
+
+# Coalescenza: i messaggi di un canale prodotti entro BATCH_WINDOW secondi
+# (o fino a BATCH_MAX messaggi) partono in un solo frame {"flag":"batch", ...}
+BATCH_WINDOW = float(os.environ.get("LIVE_LOG_BATCH_WINDOW", 0.02))
+BATCH_MAX = int(os.environ.get("LIVE_LOG_BATCH_MAX", 50))
+_FLUSH_NOW = {"start", "end"}    # flag che svuotano subito il buffer
+_buffers: dict[str | None, list] = {}
+_buffers_lock = threading.Lock()
+
+# canale della richiesta in corso: lo imposta QueryHandler, l'algoritmo non ne sa nulla
+_current_channel: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "live_log_channel", default=None
+)
+
+def bind_loop(loop: IOLoop) -> None:
+    """Memorizza l'IOLoop su cui vanno scritti i messaggi."""
+    global _loop
+    _loop = loop
+
+def bound_loop() -> IOLoop:
+    return _loop or IOLoop.current()
+
+def set_sink(sink) -> None:
+    """Devia gli emit verso sink(payload, flag, channel) invece che ai websocket."""
+    global _sink
+    _sink = sink
+
+def set_verbosity(level: int) -> None:
+    global _verbosity
+    _verbosity = level
+
+def new_channel() -> str:
+    """Genera un nuovo id di canale."""
+    return secrets.token_hex(8)
+
+def set_channel(channel: str | None):
+    """Imposta il canale del contesto corrente; ritorna il token per reset_channel."""
+    return _current_channel.set(channel)
+
+def reset_channel(token) -> None:
+    _current_channel.reset(token)
+
+def current_channel() -> str | None:
+    return _current_channel.get()
+
+# richiesta abbandonata (timeout): un threading.Event impostato dal QueryExecutor;
+# se è settato gli emit del contesto vengono scartati
+_stopped: contextvars.ContextVar[threading.Event | None] = contextvars.ContextVar(
+    "live_log_stopped", default=None
+)
+
+def set_stop_event(event: threading.Event | None):
+    """Collega al contesto corrente l'evento di abbandono della richiesta."""
+    return _stopped.set(event)
+
+# registratori attivi (vedi capture): raccolgono gli emit del contesto corrente
+_recorders: contextvars.ContextVar[tuple] = contextvars.ContextVar(
+    "live_log_recorders", default=()
+)
+
+@contextlib.contextmanager
+def capture():
+    """
+    Registra in una lista le coppie (payload, flag) emesse nel blocco,
+    senza fermarne l'invio (serve per rimandarle più tardi, es. dalla cache).
+    I blocchi annidati registrano tutti.
+    """
+    messages: list[tuple[str, str]] = []
+    token = _recorders.set(_recorders.get() + (messages,))
+    try:
+        yield messages
+    finally:
+        _recorders.reset(token)
+
+def subscribe(ws, channel: str) -> None:
+    """Iscrive il websocket al canale (un solo canale per websocket)."""
+    unregister(ws)
+    _subscriptions[ws] = channel
+    _channels.setdefault(channel, set()).add(ws)
+
+def has_channel(channel: str | None) -> bool:
+    """True se al canale è iscritto almeno un websocket."""
+    return channel is not None and channel in _channels
+
+def register(ws) -> str:
+    """Chiamato quando un nuovo websocket si apre: gli assegna un canale e lo ritorna."""
+    bind_loop(IOLoop.current())
+    channel = new_channel()
+    subscribe(ws, channel)
+    return channel
 
 def unregister(ws):
     """Chiamato alla chiusura del websocket."""
-    try:
-        _clients.remove(ws)
-    except ValueError:
-        pass
+    channel = _subscriptions.pop(ws, None)
+    if channel is None:
+        return
+    subscribers = _channels.get(channel)
+    if subscribers is not None:
+        subscribers.discard(ws)
+        if not subscribers:
+            del _channels[channel]
+
+def _targets(channel: str | None) -> list:
+    if channel is None:
+        return list(_subscriptions)
+    return list(_channels.get(channel, ()))
 
-def emit(payload: str, flag: str = "text"):
+def _flush(channel: str | None) -> None:
+    """Svuota il buffer del canale in un solo frame (gira sull'IOLoop)."""
+    with _buffers_lock:
+        entries = _buffers.pop(channel, None)
+    if not entries:
+        return
+    if len(entries) == 1:
+        message = json.dumps(entries[0])
+    else:
+        message = json.dumps({"flag": "batch", "payload": entries})
+    for ws in _targets(channel):
+        ws.write_message(message)
+
+def emit(payload: str, flag: str = "text", channel: str | None = None):
     """
-    Manda una stringa a tutti i client connessi.
-    Se la chiamata arriva da un thread qualunque,
-    la rimetti nell'IOLoop principale di Tornado.
+    Manda una stringa ai websocket iscritti al canale
+    (quello passato, altrimenti quello della richiesta in corso;
+    senza canale il messaggio va a tutti i client connessi).
+    I messaggi vengono accodati e spediti a gruppi dall'IOLoop principale
+    di Tornado, quindi la chiamata può arrivare da un thread qualunque.
     """
-    message = json.dumps({"flag":flag, "payload": payload})
-    loop = IOLoop.current()
-    for ws in list(_clients):
-        loop.add_callback(ws.write_message, str(message))
+    for recorder in _recorders.get():
+        recorder.append((payload, flag))
+    if FLAG_LEVELS.get(flag, 1) > _verbosity:
+        return
+    stopped = _stopped.get()
+    if stopped is not None and stopped.is_set():
+        return      # il client ha già ricevuto "end": il worker in ritardo non scrive più
+    if channel is None:
+        channel = _current_channel.get()
+    if _sink is not None:
+        _sink(payload, flag, channel)
+        return
+    if not _targets(channel):
+        return
+
+    with _buffers_lock:
+        buf = _buffers.get(channel)
+        first = buf is None
+        if first:
+            buf = _buffers[channel] = []
+        buf.append({"flag": flag, "payload": payload})
+        full = len(buf) >= BATCH_MAX or flag in _FLUSH_NOW or BATCH_WINDOW <= 0
+
+    loop = bound_loop()
+    if full:
+        loop.add_callback(_flush, channel)
+    elif first:
+        loop.add_callback(loop.call_later, BATCH_WINDOW, _flush, channel)
@@ -0,0 +1,94 @@
+# message_envelope.py
+import base64
+import json
+import os
+import zlib
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+try:
+    import orjson
+except ImportError:
+    orjson = None       # senza orjson ('pip install orjson') si usa il modulo json
+
+# Compressione prima della cifratura (dopo, il ciphertext non si comprime più).
+# "deflate" = formato zlib, lo stesso di DecompressionStream("deflate") nel browser.
+COMPRESSIONS = ("deflate",)
+COMPRESS_MIN_BYTES = int(os.environ.get("MESSAGE_COMPRESS_MIN", 1024))
+COMPRESS_LEVEL = int(os.environ.get("MESSAGE_COMPRESS_LEVEL", 6))
+
+# contatori per /stats (aggiornati solo dall'IOLoop)
+_counters = {"sealed": 0, "compressed": 0, "json_bytes": 0, "sealed_bytes": 0}
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data: bytes | str):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def negotiate(offered: str | None) -> str | None:
+    """Prima compressione offerta dal client (lista separata da virgole) che il server supporta."""
+    for name in (offered or "").split(","):
+        if name.strip() in COMPRESSIONS:
+            return name.strip()
+    return None
+
+
+def seal(key: bytes, payload, compression: str | None = None,
+         min_bytes: int = COMPRESS_MIN_BYTES, level: int = COMPRESS_LEVEL) -> dict:
+    """
+    Cifra il payload per il client: {"iv", "ciphertext"} in Base64, più
+    "encoding" se il plaintext è stato compresso. Si comprime solo se il client
+    l'ha negoziato e il JSON supera min_bytes: sotto quella soglia il guadagno
+    non ripaga il costo, e le risposte brevi (login) non passano dalla compressione.
+    "encoding" è anche il dato associato (AAD) di AES-GCM: toglierlo o
+    aggiungerlo in transito fa fallire la verifica del tag.
+    """
+    plaintext = dumps(payload)
+    json_bytes = len(plaintext)
+    envelope = {}
+    if compression in COMPRESSIONS and len(plaintext) >= min_bytes:
+        packed = zlib.compress(plaintext, level)
+        if len(packed) < len(plaintext):
+            plaintext = packed
+            envelope["encoding"] = compression
+    iv = os.urandom(12)
+    ct = AESGCM(key).encrypt(iv, plaintext, _aad(envelope.get("encoding")))
+    _counters["sealed"] += 1
+    _counters["compressed"] += "encoding" in envelope
+    _counters["json_bytes"] += json_bytes
+    _counters["sealed_bytes"] += len(ct)
+    envelope["iv"] = base64.b64encode(iv).decode()
+    envelope["ciphertext"] = base64.b64encode(ct).decode()
+    return envelope
+
+
+def _aad(encoding: str | None) -> bytes | None:
+    # senza compressione nessun AAD: stesso formato dei client che non la negoziano
+    return encoding.encode() if encoding else None
+
+
+def unseal(key: bytes, envelope: dict):
+    """Inverso di seal (per i test e il benchmark)."""
+    iv = base64.b64decode(envelope["iv"])
+    encoding = envelope.get("encoding")
+    plaintext = AESGCM(key).decrypt(iv, base64.b64decode(envelope["ciphertext"]), _aad(encoding))
+    if encoding == "deflate":
+        plaintext = zlib.decompress(plaintext)
+    return loads(plaintext)
+
+
+def stats() -> dict:
+    json_bytes, sealed_bytes = _counters["json_bytes"], _counters["sealed_bytes"]
+    return {
+        **_counters,
+        "orjson": orjson is not None,
+        "compress_min_bytes": COMPRESS_MIN_BYTES,
+        "compress_level": COMPRESS_LEVEL,
+        "ratio": sealed_bytes / json_bytes if json_bytes else 1.0,   # byte cifrati / byte JSON
+    }
@@ -0,0 +1,66 @@
+# nlp_models.py
+import os
+from threading import Lock
+
+import spacy
+
+MODEL_NAME = os.environ.get("SPACY_MODEL", "it_core_news_sm")  # modello spaCy italiano
+
+# Profili di pipeline: componenti da saltare per ogni tipo di utilizzo
+PROFILES = {
+    "full":    (),
+    "pos+ner": ("parser",),          # POS, lemmi ed entità (RegexAlgorithm)
+    "pos":     ("parser", "ner"),    # solo POS e lemmi (MachineLearningAlgorithm)
+}
+
+_models: dict = {}
+_lock = Lock()
+
+
+def get_model(name: str = MODEL_NAME):
+    """
+    Ritorna il modello spaCy, caricandolo al primo utilizzo.
+    Il modello viene caricato una sola volta per processo e condiviso da tutti i profili.
+    Solleva OSError se il modello non è installato.
+    """
+    model = _models.get(name)
+    if model is None:
+        with _lock:
+            model = _models.get(name)
+            if model is None:
+                model = _models[name] = spacy.load(name)
+    return model
+
+
+class Pipeline:
+    """
+    Vista "leggera" sul modello condiviso: si usa come un normale nlp
+    (nlp(text), nlp.pipe(texts)) ma esegue solo i componenti del profilo.
+    """
+
+    def __init__(self, profile: str = "full", name: str = MODEL_NAME):
+        if profile not in PROFILES:
+            raise ValueError(f"Profilo spaCy sconosciuto: {profile}")
+        self.profile = profile
+        self.name = name
+        self._disable = None
+
+    def load(self):
+        """Forza il caricamento del modello (utile per segnalare subito l'errore)."""
+        model = get_model(self.name)
+        if self._disable is None:
+            self._disable = [p for p in PROFILES[self.profile] if p in model.pipe_names]
+        return model
+
+    def __call__(self, text: str):
+        model = self.load()
+        return model(text, disable=self._disable)
+
+    def pipe(self, texts, **kwargs):
+        model = self.load()
+        return model.pipe(texts, disable=self._disable, **kwargs)
+
+
+def get_pipeline(profile: str = "full") -> Pipeline:
+    """Ritorna una pipeline con il profilo richiesto (il modello si carica al primo uso)."""
+    return Pipeline(profile)
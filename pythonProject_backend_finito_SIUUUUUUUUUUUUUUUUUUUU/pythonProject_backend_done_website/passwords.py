@@ -0,0 +1,157 @@
+# passwords.py
+import asyncio
+import base64
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+# Formato salvato in User.password:
+#   scrypt$<n>$<r>$<p>$<salt b64>$<hash b64>
+#   pbkdf2_sha256$<iterazioni>$<salt b64>$<hash b64>
+# Qualsiasi altro valore è una password in chiaro di prima dell'hashing.
+KDF_PARAMS = {"scrypt": ("n", "r", "p"), "pbkdf2_sha256": ("iterations",)}
+
+
+def derive(kind: str, params: tuple[int, ...], salt: bytes, password: str) -> bytes:
+    """KDF vera e propria; funzione di modulo per poter girare in un ProcessPoolExecutor."""
+    if kind == "scrypt":
+        n, r, p = params
+        kdf = Scrypt(salt=salt, length=HASH_BYTES, n=n, r=r, p=p)
+    elif kind == "pbkdf2_sha256":
+        (iterations,) = params
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=HASH_BYTES, salt=salt, iterations=iterations)
+    else:
+        raise ValueError(f"KDF non supportata: {kind}")
+    return kdf.derive(password.encode())
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def parse(stored: str) -> tuple[str, tuple[int, ...], bytes, bytes] | None:
+    """(kdf, parametri, salt, hash) di un valore salvato; None se è in chiaro."""
+    kind, _, rest = stored.partition("$")
+    if kind not in KDF_PARAMS:
+        return None
+    parts = rest.split("$")
+    n_params = len(KDF_PARAMS[kind])
+    if len(parts) != n_params + 2:
+        return None
+    try:
+        params = tuple(int(x) for x in parts[:n_params])
+        return kind, params, base64.b64decode(parts[-2]), base64.b64decode(parts[-1])
+    except ValueError:
+        return None
+
+
+class PasswordHasher:
+    """
+    Hash delle password con costo configurabile:
+      kind     – "scrypt" (default) oppure "pbkdf2_sha256"
+      params   – (n, r, p) per scrypt, (iterazioni,) per PBKDF2
+      executor – "thread" oppure "process": dove girano hash e verifica nei
+                 metodi *_async, così l'IOLoop non resta fermo per la KDF
+    needs_rehash() dice se un valore salvato usa parametri diversi da quelli
+    correnti (o è in chiaro): al login riuscito va ricalcolato.
+    """
+
+    def __init__(self, kind: str = "scrypt", params: tuple[int, ...] | None = None,
+                 executor: str = "thread", max_workers: int = 2):
+        if kind not in KDF_PARAMS:
+            raise ValueError(f"KDF non supportata: {kind}")
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Tipo di executor non valido: {executor}")
+        self.kind = kind
+        self.params = tuple(params or ((2 ** 14, 8, 1) if kind == "scrypt" else (600_000,)))
+        self.executor = executor
+        self.max_workers = max_workers
+        self._pool = None
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+
+    # —— sincrono ——
+    def hash(self, password: str) -> str:
+        salt = os.urandom(SALT_BYTES)
+        digest = derive(self.kind, self.params, salt, password)
+        self.hashed += 1
+        return "$".join([self.kind, *map(str, self.params), _b64(salt), _b64(digest)])
+
+    def verify(self, stored: str, password: str) -> bool:
+        self.verified += 1
+        parsed = parse(stored)
+        if parsed is None:
+            # account registrato prima dell'hashing: confronto in chiaro, poi rehash
+            return hmac.compare_digest(stored.encode(), password.encode())
+        kind, params, salt, digest = parsed
+        return hmac.compare_digest(derive(kind, params, salt, password), digest)
+
+    def needs_rehash(self, stored: str) -> bool:
+        parsed = parse(stored)
+        return parsed is None or parsed[:2] != (self.kind, self.params)
+
+    # —— fuori dall'IOLoop ——
+    def _ensure_started(self) -> None:
+        if self._pool is None:
+            if self.executor == "process":
+                self._pool = ProcessPoolExecutor(self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="passwords")
+
+    async def _derive_async(self, kind, params, salt, password) -> bytes:
+        self._ensure_started()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._pool, derive, kind, params, salt, password
+        )
+
+    async def hash_async(self, password: str) -> str:
+        salt = os.urandom(SALT_BYTES)
+        digest = await self._derive_async(self.kind, self.params, salt, password)
+        self.hashed += 1
+        return "$".join([self.kind, *map(str, self.params), _b64(salt), _b64(digest)])
+
+    async def verify_async(self, stored: str, password: str) -> bool:
+        parsed = parse(stored)
+        if parsed is None:
+            return self.verify(stored, password)
+        self.verified += 1
+        kind, params, salt, digest = parsed
+        return hmac.compare_digest(await self._derive_async(kind, params, salt, password), digest)
+
+    def stats(self) -> dict:
+        return {
+            "kdf": self.kind,
+            "params": list(self.params),
+            "executor": self.executor,
+            "max_workers": self.max_workers,
+            "hashed": self.hashed,
+            "verified": self.verified,
+            "rehashed": self.rehashed,
+        }
+
+
+def params_from_env(kind: str) -> tuple[int, ...]:
+    if kind == "scrypt":
+        return (
+            int(os.environ.get("SCRYPT_N", 2 ** 14)),
+            int(os.environ.get("SCRYPT_R", 8)),
+            int(os.environ.get("SCRYPT_P", 1)),
+        )
+    return (int(os.environ.get("PBKDF2_ITERATIONS", 600_000)),)
+
+
+_KIND = os.environ.get("PASSWORD_KDF", "scrypt")
+HASHER = PasswordHasher(
+    kind=_KIND,
+    params=params_from_env(_KIND),
+    executor=os.environ.get("PASSWORD_EXECUTOR", "thread"),
+    max_workers=int(os.environ.get("PASSWORD_WORKERS", 2)),
+)
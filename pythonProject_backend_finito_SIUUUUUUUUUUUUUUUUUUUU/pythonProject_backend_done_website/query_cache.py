@@ -0,0 +1,142 @@
+# query_cache.py
+import os
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from live_log import capture, emit
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Chiave di cache: testo con spazi compattati. Le maiuscole restano: l'analisi
+    ne dipende (autori riconosciuti come PROPN, frammenti con la grafia originale).
+    """
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+def _approx_size(obj) -> int:
+    """Stima grossolana della memoria occupata da una voce (stringhe + overhead)."""
+    if isinstance(obj, str):
+        return len(obj) + 50
+    if isinstance(obj, dict):
+        return sum(_approx_size(k) + _approx_size(v) for k, v in obj.items()) + 50
+    if isinstance(obj, (list, tuple, set)):
+        return sum(_approx_size(x) for x in obj) + 50
+    return 30
+
+
+class QueryCache:
+    """
+    Cache LRU + TTL dei risultati di analisi delle query.
+    Per ogni query normalizzata conserva il risultato e i messaggi emessi
+    su live_log durante il calcolo, che vengono rimandati in caso di hit.
+    Si svuota da sola quando cambia uno dei file in `watch`
+    (es. regex_patterns.py, keywords_weights.py, knowledge.db).
+    Nota: in modalità executor "process" ogni worker ha la sua cache.
+    """
+
+    def __init__(self, watch: list[str] | None = None, max_entries: int = 512,
+                 max_bytes: int = 8 * 1024 * 1024, ttl: float = 600.0):
+        self.watch = list(watch or [])
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[object, list, int, float]] = OrderedDict()
+        self._bytes = 0
+        self._version = self._current_version()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _current_version(self) -> tuple:
+        version = []
+        for path in self.watch:
+            try:
+                version.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                version.append(None)
+        return tuple(version)
+
+    def _check_version(self) -> None:
+        version = self._current_version()
+        if version != self._version:
+            self._version = version
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def _drop(self, key: tuple) -> None:
+        _, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def get(self, key: tuple):
+        """Ritorna (risultato, messaggi) oppure None."""
+        now = time.monotonic()
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None or entry[3] <= now:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key: tuple, result, messages: list) -> None:
+        size = _approx_size(key) + _approx_size(result) + _approx_size(messages)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (result, messages, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def cached_call(self, text: str, fn, *args, version=None):
+        """
+        Esegue fn(text, *args) passando dalla cache: in caso di hit rimanda
+        i messaggi registrati e ritorna il risultato salvato senza ricalcolare.
+        version (es. lo snapshot dei dati usato da fn) fa parte della chiave:
+        un risultato calcolato su dati vecchi non serve mai le richieste nuove.
+        """
+        key = (version, normalize_query(text))
+        hit = self.get(key)
+        if hit is not None:
+            result, messages = hit
+            for payload, flag in messages:
+                emit(payload, flag)
+            return result
+        with capture() as messages:
+            result = fn(text, *args)
+        self.put(key, result, messages)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
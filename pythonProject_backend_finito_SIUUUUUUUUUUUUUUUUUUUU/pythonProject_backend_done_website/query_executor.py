@@ -0,0 +1,175 @@
+# query_executor.py
+import asyncio
+import contextvars
+import itertools
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from tornado.ioloop import IOLoop
+
+import live_log
+
+
+class QueueFull(Exception):
+    """Troppe richieste in attesa: il chiamante deve rispondere 503."""
+
+
+# ————————————————————————————————————————————————————————————
+# Lato processo worker (solo modalità "process")
+
+_worker_queue = None
+_worker_task = None
+
+
+def _init_worker(queue) -> None:
+    """Initializer dei processi: gli emit vengono rigirati al processo principale."""
+    global _worker_queue
+    _worker_queue = queue
+    live_log.set_sink(
+        lambda payload, flag, channel: _worker_queue.put((_worker_task, payload, flag, channel))
+    )
+
+
+def _worker_call(task_id: int, channel: str | None, fn, args):
+    global _worker_task
+    _worker_task = task_id
+    token = live_log.set_channel(channel)
+    try:
+        return fn(*args)
+    finally:
+        live_log.reset_channel(token)
+        _worker_queue.put((task_id, None, None, None))   # marcatore: niente più emit
+        _worker_task = None
+
+
+# ————————————————————————————————————————————————————————————
+# Lato IOLoop
+
+class QueryExecutor:
+    """
+    Esegue l'analisi delle query fuori dall'IOLoop di Tornado.
+      kind        – "thread" oppure "process" (spaCy tiene il GIL per buona parte del lavoro)
+      max_workers – worker in parallelo
+      max_queue   – richieste accettate in attesa oltre a quelle in esecuzione
+      timeout     – secondi massimi di attesa per una singola richiesta
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: int = 2,
+                 max_queue: int = 8, timeout: float = 30.0):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Tipo di executor non valido: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._pool = None
+        self._queue = None
+        self._drained: dict[int, asyncio.Future] = {}
+        self._abandoned: set[int] = set()         # task scaduti: i loro emit non vengono inoltrati
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    # —— avvio pigro dei pool ——
+    def _ensure_started(self) -> None:
+        if self._pool is not None:
+            return
+        if self.kind == "thread":
+            self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="query")
+            return
+        self._queue = multiprocessing.Manager().Queue()
+        self._pool = ProcessPoolExecutor(
+            self.max_workers, initializer=_init_worker, initargs=(self._queue,)
+        )
+        threading.Thread(target=self._pump, name="query-log-pump", daemon=True).start()
+
+    def _pump(self) -> None:
+        """Rigira sull'IOLoop gli emit prodotti dai processi worker."""
+        loop = live_log.bound_loop()
+        while True:
+            try:
+                task_id, payload, flag, channel = self._queue.get()
+            except (EOFError, OSError):
+                return      # manager chiuso: il server si sta fermando
+            if payload is None:
+                self._abandoned.discard(task_id)
+                waiter = self._drained.pop(task_id, None)
+                if waiter is not None:
+                    loop.add_callback(lambda w=waiter: w.done() or w.set_result(None))
+                continue
+            if task_id not in self._abandoned:
+                live_log.emit(payload, flag, channel)
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    # —— API ——
+    async def run(self, fn, *args):
+        """
+        Esegue fn(*args) in un worker e ne ritorna il risultato.
+        Solleva QueueFull se la coda è piena e asyncio.TimeoutError allo scadere del timeout.
+        """
+        live_log.bind_loop(IOLoop.current())
+        self._ensure_started()
+
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise QueueFull()
+            self.in_flight += 1
+            self.submitted += 1
+
+        task_id = None
+        waiter = None
+        stop = threading.Event()
+        if self.kind == "thread":
+            # il contesto (canale di live_log compreso) segue la richiesta nel thread,
+            # con l'evento che ne zittisce gli emit se la richiesta scade
+            ctx = contextvars.copy_context()
+            ctx.run(live_log.set_stop_event, stop)
+            cfut = self._pool.submit(ctx.run, fn, *args)
+        else:
+            task_id = next(self._ids)
+            waiter = asyncio.get_running_loop().create_future()
+            self._drained[task_id] = waiter
+            channel = live_log.current_channel()
+            cfut = self._pool.submit(_worker_call, task_id, channel, fn, args)
+        cfut.add_done_callback(self._release)
+
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(cfut), self.timeout)
+            if waiter is not None:
+                # aspetta che gli ultimi emit del worker siano stati inoltrati
+                await asyncio.wait_for(waiter, self.timeout)
+            return result
+        except asyncio.TimeoutError:
+            # il worker non si può interrompere: continua, ma i suoi emit
+            # successivi vengono scartati (il client riceve subito "end")
+            self.timeouts += 1
+            stop.set()
+            if task_id is not None and task_id in self._drained:     # marcatore di fine non ancora arrivato
+                self._abandoned.add(task_id)
+            raise
+        finally:
+            if waiter is not None and not waiter.done():
+                self._drained.pop(task_id, None)
+                waiter.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "timeout": self.timeout,
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
@@ -0,0 +1,91 @@
+# session_keys.py
+import base64
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+HKDF_INFO = b"handshake data"   # stesso info usato in JS
+
+
+def derive_key(server_priv, client_pub_b64: str) -> bytes:
+    """ECDH + HKDF: ricava la chiave AES-GCM condivisa con il client."""
+    cpub = base64.b64decode(client_pub_b64)
+    client_pub = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), cpub)
+    shared = server_priv.exchange(ec.ECDH(), client_pub)
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=HKDF_INFO
+    ).derive(shared)
+
+
+class SessionKeyCache:
+    """
+    Cache LRU con scadenza (TTL) delle chiavi AES derivate,
+    indicizzata per public key del client (Base64).
+    Così ECDH + HKDF si fanno una sola volta per sessione client
+    e la stessa chiave serve sia a decifrare sia a cifrare la risposta.
+    """
+
+    def __init__(self, server_priv, max_entries: int = 1024, ttl: float = 900.0):
+        self._priv = server_priv
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._keys: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, client_pub_b64: str) -> bytes:
+        """Ritorna la chiave AES per il client, derivandola solo se assente o scaduta."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._keys.get(client_pub_b64)
+            if entry and entry[1] > now:
+                # scadenza "scorrevole": ogni uso rinnova il TTL
+                self._keys[client_pub_b64] = (entry[0], now + self.ttl)
+                self._keys.move_to_end(client_pub_b64)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # derivazione fuori dal lock (operazione costosa)
+        key = derive_key(self._priv, client_pub_b64)
+
+        with self._lock:
+            self._keys[client_pub_b64] = (key, now + self.ttl)
+            self._keys.move_to_end(client_pub_b64)
+            self._evict(now)
+        return key
+
+    def _evict(self, now: float) -> None:
+        # prima le voci scadute (in testa c'è sempre la scadenza più vicina) …
+        while self._keys:
+            oldest = next(iter(self._keys))
+            if self._keys[oldest][1] > now:
+                break
+            del self._keys[oldest]
+            self.evictions += 1
+        # … poi LRU se si supera la capienza
+        while len(self._keys) > self.max_entries:
+            self._keys.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._keys),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -9,9 +9,11 @@ function b642buf(b64) {
 }
 
 async function handshake() {
-  // 1) Prendo la public key server
-  const res = await fetch("/handshake");
-  const { server_public } = await res.json();
+  // 1) Prendo la public key server; se il browser sa decomprimere offro "deflate"
+  //    e il server risponde con la compressione che userà per le risposte (o null)
+  const offer = "DecompressionStream" in globalThis ? "?compression=deflate" : "";
+  const res = await fetch("/handshake" + offer);
+  const { server_public, compression } = await res.json();
   const serverPubBuf = b642buf(server_public);
 
   // 2) Genero coppia ECDH client
@@ -58,12 +60,29 @@ async function handshake() {
     ["encrypt","decrypt"]
   );
 
-  return { aesKey, clientPubRaw };
+  return { aesKey, clientPubRaw, compression };
 }
 
-export async function sendEncryptedJSON(obj) {
+// La coppia ECDH (e quindi la chiave AES) viene riusata per tutta la pagina:
+// il server tiene in cache la chiave derivata per la nostra public key.
+let sessionPromise = null;
+
+function getSession() {
+  if (!sessionPromise) {
+    sessionPromise = handshake().catch(err => {
+      sessionPromise = null;
+      throw err;
+    });
+  }
+  return sessionPromise;
+}
+
+// Action che si possono rimandare senza effetti doppi se la risposta non si decifra
+const IDEMPOTENT_ACTIONS = new Set(["retrieval", "access"]);
+
+export async function sendEncryptedJSON(obj, retry = true) {
   const message = JSON.stringify(obj);
-  const { aesKey, clientPubRaw } = await handshake();
+  const { aesKey, clientPubRaw, compression } = await getSession();
 
   // 8) Cifro con AES-GCM
   const iv = crypto.getRandomValues(new Uint8Array(12));
@@ -78,7 +97,8 @@ export async function sendEncryptedJSON(obj) {
   const payload = {
     client_public: buf2b64(clientPubRaw),
     iv:            buf2b64(iv),
-    ciphertext:    buf2b64(ctBuf)
+    ciphertext:    buf2b64(ctBuf),
+    compression:   compression ?? null
   };
   console.log("Payload cifrato inviato:", payload);
 
@@ -89,8 +109,44 @@ export async function sendEncryptedJSON(obj) {
   });
   const data = await resp.json();
   console.log("received data back:", data);
+  if (resp.status === 401 && data.reason === "session" && retry) {
+    // es. server riavviato con una nuova chiave: il messaggio non è stato
+    // decifrato né eseguito, rifaccio l'handshake e lo rimando una volta
+    sessionPromise = null;
+    return sendEncryptedJSON(obj, false);
+  }
+  if (!resp.ok) {
+    throw new Error(data.message || `Errore del server (${resp.status})`);
+  }
 
-  const plain = await decryptData(data, aesKey);
+  let plain;
+  try {
+    plain = await decryptData(data, aesKey);
+  } catch (err) {
+    // risposta non decifrabile: nuova sessione; l'action è già stata eseguita,
+    // quindi si rimanda solo se non modifica nulla (mai register/upload)
+    sessionPromise = null;
+    if (retry && IDEMPOTENT_ACTIONS.has(obj.action)) {
+      return sendEncryptedJSON(obj, false);
+    }
+    throw err;
+  }
   console.log("plain text: ", plain);
   return plain;
 }
+
+// Cifra un blocco binario con la chiave di sessione (upload a chunk):
+// ritorna iv (12 byte) || ciphertext, con aad come dati autenticati
+export async function encryptBytes(data, aad) {
+  const { aesKey } = await getSession();
+  const iv = crypto.getRandomValues(new Uint8Array(12));
+  const ctBuf = await crypto.subtle.encrypt(
+    { name: "AES-GCM", iv, additionalData: new TextEncoder().encode(aad) },
+    aesKey,
+    data
+  );
+  const out = new Uint8Array(iv.length + ctBuf.byteLength);
+  out.set(iv, 0);
+  out.set(new Uint8Array(ctBuf), iv.length);
+  return out;
+}
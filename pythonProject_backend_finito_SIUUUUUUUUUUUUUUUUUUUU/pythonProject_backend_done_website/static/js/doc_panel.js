@@ -1,5 +1,23 @@
 import { sendEncryptedJSON } from './auth.js';
 
+const PAGE_SIZE = 50;
+
+function formatSize(bytes) {
+  if (bytes < 1024) return `${bytes} B`;
+  if (bytes < 1024 * 1024) return `${(bytes / 1024).toFixed(1)} KB`;
+  return `${(bytes / (1024 * 1024)).toFixed(1)} MB`;
+}
+
+// Una pagina dell'elenco documenti: { files: [{name, size, mtime}], total, offset, limit }
+async function loadPage(user, offset) {
+  const payload = { action: 'retrieval', username: user, offset: offset, limit: PAGE_SIZE };
+  const resp = await sendEncryptedJSON(payload);
+  if (resp.status !== 'ok' || !Array.isArray(resp.files)) {
+    throw new Error(resp.message || 'Retrieval failed');
+  }
+  return resp;
+}
+
 document.addEventListener('DOMContentLoaded', async () => {
   const user = localStorage.getItem('auth_user');
   const pass = localStorage.getItem('auth_pass');
@@ -12,28 +30,51 @@ document.addEventListener('DOMContentLoaded', async () => {
   promptEl.textContent = 'Effettua il login per vedere i documenti.';
   scrollPanel.appendChild(promptEl);
 
-  if (user && pass) {
-    // Rimuovo prompt
-    promptEl.remove();
+  if (!user || !pass) return;
+
+  // Rimuovo prompt
+  promptEl.remove();
 
-    // Invio richiesta 'retrieval'
+  // Le pagine successive arrivano quando la sentinella in fondo diventa visibile
+  const sentinel = document.createElement('div');
+  scrollPanel.appendChild(sentinel);
+  let offset = 0;
+  let total = Infinity;
+  let loading = false;
+
+  async function loadMore() {
+    if (loading || offset >= total) return;
+    loading = true;
     try {
-      const payload = { action: 'retrieval', username: user };
-      const resp = await sendEncryptedJSON(payload);
-
-      if (resp.status === 'ok' && Array.isArray(resp.files)) {
-        resp.files.forEach(filename => {
-          const btn = document.createElement('button');
-          btn.textContent = filename;
-          btn.classList.add('sidebar-btn');
-          // qui si può aggiungere l'evento di download o apertura
-          scrollPanel.appendChild(btn);
-        });
-      } else {
-        console.error('Retrieval failed:', resp.message);
-      }
+      const page = await loadPage(user, offset);
+      page.files.forEach(file => {
+        const btn = document.createElement('button');
+        btn.textContent = file.name;
+        btn.title = `${formatSize(file.size)} · ${new Date(file.mtime * 1000).toLocaleString()}`;
+        btn.classList.add('sidebar-btn');
+        // qui si può aggiungere l'evento di download o apertura
+        scrollPanel.insertBefore(btn, sentinel);
+      });
+      offset += page.files.length;
+      total = page.files.length ? page.total : offset;
     } catch (err) {
       console.error('Errore recupero documenti:', err);
+      total = offset;   // niente tentativi a raffica
+    } finally {
+      loading = false;
+    }
+    if (offset >= total) {
+      observer.disconnect();
+    } else if (sentinel.getBoundingClientRect().top <= scrollPanel.getBoundingClientRect().bottom + 200) {
+      // pannello ancora non pieno: l'observer non scatta di nuovo da solo
+      loadMore();
     }
   }
-});
\ No newline at end of file
+
+  const observer = new IntersectionObserver(entries => {
+    if (entries.some(e => e.isIntersecting)) loadMore();
+  }, { root: scrollPanel, rootMargin: '200px' });
+  observer.observe(sentinel);
+
+  await loadMore();
+});
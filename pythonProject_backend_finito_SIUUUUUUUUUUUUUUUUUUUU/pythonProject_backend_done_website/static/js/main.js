@@ -6,6 +6,26 @@ document.addEventListener('DOMContentLoaded', () => {
     // ---------------------------------------------------------------------
     const scrollBottom = () => chatArea.scrollTo(0, chatArea.scrollHeight);
 
+    // canale del websocket (websocket.js); se non arriva entro pochi secondi la query non parte
+    function aspettaCanale (ms = 5000) {
+        if (window.__logChannel) return Promise.resolve(window.__logChannel);
+        return Promise.race([
+            window.__logChannelReady || Promise.reject(new Error('websocket assente')),
+            new Promise((_, reject) => setTimeout(() => reject(new Error('websocket non pronto')), ms)),
+        ]);
+    }
+
+    // risposta terminata senza "end" dal server: stesso esito visivo
+    function chiudiRisposta (box, messaggio) {
+        const p = document.createElement('p');
+        p.textContent = messaggio;
+        p.classList.add('flag-warning');
+        box.appendChild(p);
+        box.classList.remove('waiting');
+        if (window.__currentAnswerBox === box) delete window.__currentAnswerBox;
+        window.addUserBlock();
+    }
+
     function nuovoBloccoUtente () {
         const node   = tpl.content.firstElementChild.cloneNode(true);
         const prompt = node.querySelector('.prompt');
@@ -35,13 +55,21 @@ document.addEventListener('DOMContentLoaded', () => {
             answerBox.className = 'answer waiting';
             chatArea.insertBefore(answerBox, node.nextSibling);
 
-            fetch('/query', {
-                method:'POST',
-                headers:{'Content-Type':'application/json'},
-                body:JSON.stringify({query,toggle:toggleOn})
-            }).catch(console.error);
-
             window.__currentAnswerBox = answerBox;
+
+            // la risposta arriva sul websocket: prima serve il suo canale
+            aspettaCanale()
+                .then(channel => fetch('/query', {
+                    method:'POST',
+                    headers:{'Content-Type':'application/json'},
+                    body:JSON.stringify({query,toggle:toggleOn,channel,
+                                         username:localStorage.getItem('auth_user')})
+                }))
+                .then(resp => { if (resp.status === 400) throw new Error('canale non valido'); })
+                .catch(err => {
+                    console.error(err);
+                    chiudiRisposta(answerBox, 'Collegamento al server non disponibile: ricarica la pagina.');
+                });
             scrollBottom();
         }
 
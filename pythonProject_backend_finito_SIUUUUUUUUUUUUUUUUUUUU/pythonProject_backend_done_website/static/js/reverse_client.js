@@ -7,10 +7,17 @@ function b642buf(b64) {
 export async function decryptData(data, aesKey) {
   const ivBuf = b642buf(data.iv);
   const ctBuf = b642buf(data.ciphertext);
+  // "encoding" è autenticato come dato associato (AAD): se manomesso il decrypt fallisce
+  const params = { name: "AES-GCM", iv: ivBuf };
+  if (data.encoding) params.additionalData = new TextEncoder().encode(data.encoding);
   const ptBuf = await crypto.subtle.decrypt(
-    { name: "AES-GCM", iv: ivBuf },
+    params,
     aesKey,
     ctBuf
   );
-  return JSON.parse(new TextDecoder().decode(ptBuf));
+  // risposta grande compressa prima della cifratura (concordato in /handshake)
+  const jsonBuf = data.encoding === "deflate"
+    ? await new Response(new Blob([ptBuf]).stream().pipeThrough(new DecompressionStream("deflate"))).arrayBuffer()
+    : ptBuf;
+  return JSON.parse(new TextDecoder().decode(jsonBuf));
 }
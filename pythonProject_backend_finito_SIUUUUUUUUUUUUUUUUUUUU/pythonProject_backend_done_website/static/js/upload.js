@@ -1,5 +1,41 @@
 // upload.js
-import { sendEncryptedJSON } from "./auth.js";
+import { sendEncryptedJSON, encryptBytes } from "./auth.js";
+
+// Upload cifrato a chunk: il file viene letto e inviato un pezzo alla volta,
+// senza base64 e senza tenerlo tutto in memoria (protocollo in uploads.py)
+async function uploadFile(username, file) {
+  const start = await sendEncryptedJSON({
+    action: 'upload_start',
+    username: username,
+    filename: file.name,
+    size: file.size
+  });
+  if (start.status !== 'ok') throw new Error(start.message || 'upload rifiutato');
+
+  const { upload_id, chunk_size } = start;
+  let seq = 0;
+  for (let offset = 0; offset < file.size; offset += chunk_size, seq++) {
+    const chunk = await file.slice(offset, offset + chunk_size).arrayBuffer();
+    const body = await encryptBytes(chunk, `${upload_id}:${seq}`);
+    const resp = await fetch(`/upload/chunk/${upload_id}/${seq}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/octet-stream' },
+      body: body
+    });
+    if (!resp.ok) {
+      const err = await resp.json().catch(() => ({}));
+      throw new Error(err.message || `chunk ${seq} rifiutato`);
+    }
+  }
+
+  const end = await sendEncryptedJSON({
+    action: 'upload_finish',
+    upload_id: upload_id,
+    chunks: seq,
+    size: file.size
+  });
+  if (end.status !== 'ok') throw new Error(end.message || 'upload incompleto');
+}
 
 document.addEventListener('DOMContentLoaded', () => {
   const uploadBtn = document.getElementById('btn-upload');
@@ -18,32 +54,14 @@ document.addEventListener('DOMContentLoaded', () => {
     const username = localStorage.getItem('auth_user');
     if (!username) return alert('Devi essere loggato per caricare documenti.');
 
-    // Legge tutti i file come base64
-    const readPromises = files.map(file => new Promise(resolve => {
-      const reader = new FileReader();
-      reader.onload = () => {
-        const base64data = reader.result.split(',')[1];
-        resolve({ filename: file.name, data: base64data });
-      };
-      reader.readAsDataURL(file);
-    }));
-
     try {
-      const filePayloads = await Promise.all(readPromises);
-      const message = {
-        action: 'upload',
-        username: username,
-        files: filePayloads
-      };
-      const resp = await sendEncryptedJSON(message);
-      if (resp.status === 'ok') {
-        alert('Upload riuscito!');
-      } else {
-        alert('Upload fallito: ' + (resp.message || ''));
+      for (const file of files) {
+        await uploadFile(username, file);
       }
+      alert('Upload riuscito!');
     } catch (e) {
       console.error(e);
-      alert('Errore di rete durante l\'upload.');
+      alert('Upload fallito: ' + (e.message || ''));
     } finally {
       input.value = '';
     }
@@ -1,13 +1,21 @@
 /*
    Il server ora invia JSON:        { "flag":"...", "payload":"..." }
    flag = start | text | html | end | ... (nuovi tipi hard-coded a piacere)
+   flag = channel arriva all'apertura: è il canale da mandare con ogni /query
+   flag = batch  → payload è un array di { flag, payload } da gestire in ordine
 */
 const ws = new WebSocket(`ws://${location.host}/ws/log`);
 
-ws.onmessage = ({ data }) => {
-    let msg;
-    try   { msg = JSON.parse(data); }
-    catch { msg = { flag:'text', payload:data }; }
+// main.js aspetta il canale prima di mandare /query (il server rifiuta query senza canale)
+let resolveLogChannel;
+window.__logChannelReady = new Promise(resolve => { resolveLogChannel = resolve; });
+
+function handleMessage(msg) {
+    if (msg.flag === 'channel') {         // canale privato di questa pagina
+        window.__logChannel = msg.payload;
+        resolveLogChannel(msg.payload);
+        return;
+    }
 
     const box = window.__currentAnswerBox;
     if (!box) return;                     // sicurezza
@@ -31,6 +39,7 @@ ws.onmessage = ({ data }) => {
         case 'text':
         case 'thinking':
         case 'analysis':
+        case 'explain':
         case 'warning': {                    // aggiungi qui i flag che vuoi trattare come testo
             const p = document.createElement('p');
             p.textContent = msg.payload;
@@ -40,6 +49,18 @@ ws.onmessage = ({ data }) => {
         }
     }
     box.scrollTop = box.scrollHeight;
+}
+
+ws.onmessage = ({ data }) => {
+    let msg;
+    try   { msg = JSON.parse(data); }
+    catch { msg = { flag:'text', payload:data }; }
+
+    if (msg.flag === 'batch' && Array.isArray(msg.payload)) {
+        msg.payload.forEach(handleMessage);
+    } else {
+        handleMessage(msg);
+    }
     document.getElementById('chatArea').scrollTop =
         document.getElementById('chatArea').scrollHeight;
 };
@@ -0,0 +1,253 @@
+# uploads.py
+import os
+import re
+import secrets
+import tempfile
+import time
+from threading import Lock
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+UPLOAD_ROOT = "uploaded"
+ALLOWED_RE = re.compile(r"\.(pdf|txt)$", re.IGNORECASE)
+MAX_UPLOAD_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 512 * 1024 * 1024))
+CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 256 * 1024))     # byte in chiaro per chunk cifrato
+UPLOAD_SESSION_TTL = float(os.environ.get("UPLOAD_SESSION_TTL", 300))  # secondi di inattività
+IV_SIZE = 12
+
+
+class UploadError(Exception):
+    """Upload rifiutato: il messaggio è pensato per essere rimandato al client."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def safe_filename(filename: str) -> str:
+    """Solo il nome del file (niente percorsi), con estensione .pdf o .txt."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if not name or name.startswith(".") or not ALLOWED_RE.search(name):
+        raise UploadError("Formato non supportato")
+    return name
+
+
+def user_dir(username: str) -> str:
+    name = os.path.basename((username or "").strip())
+    if not name or name.startswith("."):
+        raise UploadError("Utente non autenticato")
+    return os.path.join(UPLOAD_ROOT, name)
+
+
+class AtomicUpload:
+    """
+    Scrittura di un file caricato: i blocchi finiscono in un file temporaneo
+    nella cartella dell'utente, che viene rinominato sul nome finale solo a
+    upload completato (os.replace è atomico). Un upload interrotto non lascia
+    file a metà e non sovrascrive la versione precedente.
+    write/commit girano nel pool FILE_IO mentre abort può arrivare da un altro
+    thread (client disconnesso): un lock le serializza e dopo la chiusura
+    write e commit falliscono con UploadError.
+    """
+
+    def __init__(self, username: str, filename: str, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.filename = safe_filename(filename)
+        self.directory = user_dir(username)
+        self.path = os.path.join(self.directory, self.filename)
+        self.max_bytes = max_bytes
+        self.size = 0
+        os.makedirs(self.directory, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".upload-", suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+        self._lock = Lock()
+        self.closed = False         # completato o annullato
+
+    def write(self, chunk: bytes) -> None:
+        with self._lock:
+            if self.closed:
+                raise UploadError("Upload interrotto")
+            self.size += len(chunk)
+            if self.size > self.max_bytes:
+                self._abort()
+                raise UploadError("File troppo grande", 413)
+            self._file.write(chunk)
+
+    def commit(self) -> str:
+        """Chiude il temporaneo e lo rinomina sul nome finale; ritorna il percorso."""
+        with self._lock:
+            if self.closed:
+                raise UploadError("Upload interrotto")
+            self.closed = True
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self.tmp_path, self.path)
+            return self.path
+
+    def abort(self) -> None:
+        """Scarta il temporaneo; non fa nulla se l'upload è già completato o annullato."""
+        with self._lock:
+            self._abort()
+
+    def _abort(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def save_bytes(username: str, filename: str, body: bytes) -> str:
+    """Salva un file già in memoria (vecchia action "upload") con la stessa rinomina atomica."""
+    upload = AtomicUpload(username, filename)
+    try:
+        upload.write(body)
+        return upload.commit()
+    except BaseException:
+        upload.abort()
+        raise
+
+# ————————————————————————————————————————————————————————————
+# Upload cifrato a chunk
+#
+#   1. /message {"action": "upload_start", "username", "filename", "size"}
+#        -> {"upload_id", "chunk_size"}
+#   2. POST /upload/chunk/<upload_id>/<seq>   corpo binario: iv (12 byte) || ciphertext
+#        AES-GCM con la chiave di sessione, AAD = "<upload_id>:<seq>"
+#        (un chunk non può essere riordinato né spostato su un altro upload)
+#   3. /message {"action": "upload_finish", "upload_id", "chunks", "size"}
+#
+# Il server tiene in memoria al massimo un chunk per richiesta.
+
+
+class _EncryptedUpload:
+    def __init__(self, key: bytes, upload: AtomicUpload, expected_size: int | None):
+        self.aesgcm = AESGCM(key)
+        self.upload = upload
+        self.expected_size = expected_size
+        self.next_seq = 0
+        self.touched = time.monotonic()
+        # i chunk girano nel pool FILE_IO: controllo della sequenza, scrittura e
+        # incremento avvengono sotto lock, e la chiusura aspetta la scrittura in corso
+        self.lock = Lock()
+        self.closed = False
+
+    def close(self) -> None:
+        """Scarta il temporaneo (da chiamare con self.lock acquisito)."""
+        if not self.closed:
+            self.closed = True
+            self.upload.abort()
+
+
+class EncryptedUploads:
+    """Registro degli upload cifrati in corso, con scadenza per quelli abbandonati."""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, ttl: float = UPLOAD_SESSION_TTL):
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+        self._uploads: dict[str, _EncryptedUpload] = {}
+        self._lock = Lock()
+        self.completed = 0
+        self.expired = 0
+
+    def start(self, key: bytes, username: str, filename: str, size: int | None = None) -> str:
+        if size is not None:
+            try:
+                size = int(size)
+            except (TypeError, ValueError):
+                raise UploadError("Dimensione non valida")
+            if size < 0:
+                raise UploadError("Dimensione non valida")
+            if size > MAX_UPLOAD_BYTES:
+                raise UploadError("File troppo grande", 413)
+        self._expire()
+        upload_id = secrets.token_urlsafe(16)
+        state = _EncryptedUpload(key, AtomicUpload(username, filename), size)
+        with self._lock:
+            self._uploads[upload_id] = state
+        return upload_id
+
+    def _get(self, upload_id: str) -> _EncryptedUpload:
+        with self._lock:
+            state = self._uploads.get(upload_id)
+        if state is None:
+            raise UploadError("Upload sconosciuto o scaduto", 404)
+        state.touched = time.monotonic()
+        return state
+
+    def chunk(self, upload_id: str, seq: int, body: bytes) -> None:
+        """Decifra e accoda un chunk; il reinvio dell'ultimo chunk già scritto è ignorato."""
+        if len(body) <= IV_SIZE or len(body) > IV_SIZE + self.chunk_size + 16:
+            raise UploadError("Chunk di dimensione non valida")
+        state = self._get(upload_id)
+        with state.lock:
+            if state.closed:
+                raise UploadError("Upload sconosciuto o scaduto", 404)
+            if seq < state.next_seq:
+                return
+            if seq > state.next_seq:
+                raise UploadError(f"Chunk fuori sequenza: atteso {state.next_seq}", 409)
+            try:
+                data = state.aesgcm.decrypt(body[:IV_SIZE], body[IV_SIZE:], f"{upload_id}:{seq}".encode())
+            except InvalidTag:
+                raise UploadError("Chunk non autentico")
+            try:
+                state.upload.write(data)
+            except UploadError:
+                self._remove(upload_id, state)
+                raise
+            state.next_seq += 1
+
+    def finish(self, upload_id: str, chunks: int, size: int) -> str:
+        state = self._get(upload_id)
+        with state.lock:
+            if state.closed:
+                raise UploadError("Upload sconosciuto o scaduto", 404)
+            if chunks != state.next_seq or size != state.upload.size or (
+                state.expected_size is not None and size != state.expected_size
+            ):
+                self._remove(upload_id, state)
+                raise UploadError("Upload incompleto")
+            with self._lock:
+                self._uploads.pop(upload_id, None)
+                self.completed += 1
+            state.closed = True
+            return state.upload.commit()
+
+    def abort(self, upload_id: str) -> None:
+        self._discard(upload_id)
+
+    def _remove(self, upload_id: str, state: _EncryptedUpload) -> None:
+        """Toglie dal registro e scarta un upload di cui si tiene già state.lock."""
+        with self._lock:
+            if self._uploads.get(upload_id) is state:
+                del self._uploads[upload_id]
+        state.close()
+
+    def _discard(self, upload_id: str) -> None:
+        with self._lock:
+            state = self._uploads.pop(upload_id, None)
+        if state is not None:
+            with state.lock:
+                state.close()
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.ttl
+        with self._lock:
+            stale = [uid for uid, s in self._uploads.items() if s.touched < deadline]
+        for upload_id in stale:
+            self._discard(upload_id)
+            self.expired += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_progress": len(self._uploads),
+                "completed": self.completed,
+                "expired": self.expired,
+                "chunk_size": self.chunk_size,
+            }